@@ -0,0 +1,348 @@
+print('#' * 52 + '  ### Application - Buffered DataIterator')
+
+print('#' * 52 + '  The `DataIterator` from "Not Just a Context Manager" reads one line per `__next__`,'
+                 '  splits it on `,` (which breaks on quoted fields),')
+print('#' * 52 + '  and can only be iterated once per `with` block.')
+print('#' * 52 + '  This version reads the file in large binary chunks and splits all the rows of a chunk at once.')
+print('#' * 52 + '  Rows without quotes are split with `str.split`, the rows with quotes'
+                 '  (and chunks with blank lines or \\r) go through the `csv` module.')
+print('#' * 52 + '  Every `for` loop is a new pass over the file, and `rewind()` restarts `next()`'
+                 '  - all without reopening the file.')
+
+import csv
+import io
+from itertools import chain, islice
+from operator import methodcaller
+
+
+class DataIterator:
+    def __init__(self, fname, *, delimiter=',', quotechar='"', skip_header=False,
+                 chunk_size=1 << 16, encoding='utf-8'):
+        self._fname = fname
+        self._delimiter = delimiter
+        self._quotechar = quotechar
+        self._quote_byte = quotechar.encode(encoding)
+        self._skip_header = skip_header
+        self._chunk_size = chunk_size
+        self._encoding = encoding
+        self._split = methodcaller('split', delimiter)
+        self._f = None
+        self._current = None
+        self.header = None
+
+    def __enter__(self):
+        self._f = open(self._fname, 'rb')
+        self._data_start = 0
+        if self._skip_header:
+            chunk = next(self._chunks(0), b'')
+            header_end = self._line_end(chunk)
+            self.header = next(self._parse(chunk[:header_end]), None)
+            self._data_start = header_end
+        self._current = None
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        if not self._f.closed:
+            self._f.close()
+        return False
+
+    def _line_end(self, chunk):
+        # end of the first complete row (a newline outside of quotes)
+        start = 0
+        while True:
+            end = chunk.find(b'\n', start) + 1
+            if end == 0:
+                return len(chunk)
+            if chunk.count(self._quote_byte, 0, end) % 2 == 0:
+                return end
+            start = end
+
+    def _cut(self, chunk):
+        # end of the last complete row in the chunk, 0 if there is none
+        end = chunk.rfind(b'\n') + 1
+        if self._quote_byte not in chunk:
+            return end
+        quotes = chunk.count(self._quote_byte, 0, end)
+        while end and quotes % 2:
+            # that newline is inside a quoted field, try the one before
+            previous = chunk.rfind(b'\n', 0, end - 1) + 1
+            quotes -= chunk.count(self._quote_byte, previous, end)
+            end = previous
+        return end
+
+    def _chunks(self, position):
+        # each pass keeps its own position, so passes never disturb each other
+        f = self._f
+        leftover = b''
+        while True:
+            f.seek(position)
+            data = f.read(self._chunk_size)
+            position += len(data)
+            if not data:
+                if leftover:
+                    yield leftover
+                return
+            data = leftover + data
+            end = self._cut(data)
+            if end == 0:
+                leftover = data  # a single row longer than the chunk: read more
+                continue
+            yield data[:end]
+            leftover = data[end:]
+
+    def _parse(self, chunk):
+        text = chunk.decode(self._encoding)
+        if '\r' in text or '\n\n' in text or text.startswith('\n'):
+            return self._csv(text)
+        if self._quotechar in text:
+            return self._mixed(text)
+        return self._fast(text)
+
+    def _csv(self, text):
+        return csv.reader(io.StringIO(text, newline=''),
+                          delimiter=self._delimiter, quotechar=self._quotechar)
+
+    def _fast(self, text):
+        lines = text.split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        return map(self._split, lines)
+
+    def _mixed(self, text):
+        # only the rows that contain quotes go through the csv module
+        quotechar = self._quotechar
+        segments = []
+        position = 0
+        while True:
+            quote = text.find(quotechar, position)
+            if quote == -1:
+                segments.append(self._fast(text[position:]))
+                return chain.from_iterable(segments)
+            start = max(position, text.rfind('\n', position, quote) + 1)
+            if start > position:
+                segments.append(self._fast(text[position:start]))
+            end = text.find('\n', quote)
+            while end != -1 and text.count(quotechar, start, end) % 2:
+                end = text.find('\n', end + 1)
+            end = len(text) if end == -1 else end + 1
+            segments.append(self._csv(text[start:end]))
+            position = end
+
+    def _check_open(self):
+        if self._f is None or self._f.closed:
+            raise ValueError('DataIterator must be used inside a with block')
+
+    def _rows(self):
+        self._check_open()
+        parse = self._parse
+        for chunk in self._chunks(self._data_start):
+            yield from parse(chunk)
+
+    def __iter__(self):
+        return self._rows()
+
+    def __next__(self):
+        if self._current is None:
+            self._current = self._rows()
+        return next(self._current)
+
+    def rewind(self):
+        self._current = None
+
+    def batches(self, size=1_000, converters=None):
+        self._check_open()
+        rows = chain.from_iterable(map(self._parse, self._chunks(self._data_start)))
+        while True:
+            batch = list(islice(rows, size))
+            if not batch:
+                return
+            yield batch if converters is None else convert(batch, converters)
+
+
+def convert(rows, converters):
+    # column by column: one map() per column instead of one call per value in Python code
+    columns = [list(map(converter, column)) for converter, column in zip(converters, zip(*rows))]
+    return list(zip(*columns))
+
+
+import os
+import tempfile
+
+
+def test_data_iterator():
+    directory = tempfile.mkdtemp()
+    try:
+        f_name = os.path.join(directory, 'quoted.csv')
+        lines = ['id,name,comment\n', '1,plain,no quotes\n', '2,"Smith, John","a ""quoted"" word"\n',
+                 '3,multi,"first line\nsecond line"\n', '\n', '4,last,no newline at the end']
+        # without the blank line, the quoted rows are the only ones parsed by the csv module
+        for content in (''.join(lines), ''.join(line for line in lines if line != '\n')):
+            with open(f_name, 'w', newline='') as f:
+                f.write(content)
+            with open(f_name, newline='') as f:
+                expected = list(csv.reader(f))
+
+            # tiny chunks: rows and quoted newlines are split across chunk boundaries
+            for chunk_size in (1, 7, 16, 1 << 16):
+                with DataIterator(f_name, chunk_size=chunk_size) as data:
+                    assert list(data) == expected, chunk_size
+                    assert list(data) == expected, 'a second pass in the same with block'
+                    assert [row for batch in data.batches(2) for row in batch] == expected
+
+        with DataIterator(f_name, skip_header=True) as data:
+            assert data.header == ['id', 'name', 'comment']
+            assert next(data) == ['1', 'plain', 'no quotes']
+            assert next(data)[1] == 'Smith, John'
+            data.rewind()
+            assert next(data) == ['1', 'plain', 'no quotes']
+
+        with DataIterator('nyc_parking_tickets_extract.csv', skip_header=True) as data:
+            batch = next(data.batches(10, converters=(int, str, str, str, str, int, str, str, str)))
+            assert len(batch) == 10 and batch[0][0] == 4006478550 and batch[0][5] == 5
+
+        data = DataIterator(f_name)
+        for use in (next, lambda data: next(data.batches())):
+            try:
+                use(data)
+                assert False, 'ValueError expected'
+            except ValueError:
+                pass
+    finally:
+        import shutil
+        shutil.rmtree(directory)
+
+
+test_data_iterator()
+
+with DataIterator('nyc_parking_tickets_extract.csv', skip_header=True) as data:
+    print(data.header)
+    for row in data:
+        print(row)
+        if row[0] == '4007117810':
+            break
+    print('#' * 52 + '  And a second pass, in the same `with` block, in batches of typed rows:')
+    converters = (int, str, str, str, str, int, str, str, str)
+    for batch in data.batches(400, converters):
+        print(len(batch), batch[0])
+
+print('#' * 52 + '  #### Timings')
+print('#' * 52 + '  nyc_parking_tickets_extract.csv repeated 1000 times (1,000,000 rows).')
+print('#' * 52 + '  Most of the time goes into creating the row lists and their strings,'
+                 '  which every version has to do,')
+print('#' * 52 + '  so reading in chunks only removes the per line overhead - it does not make rows cheaper:')
+
+from time import perf_counter
+
+
+class LineDataIterator:
+    # the original version
+    def __init__(self, fname):
+        self._fname = fname
+        self._f = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = next(self._f)
+        return row.strip('\n').split(',')
+
+    def __enter__(self):
+        self._f = open(self._fname)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        if not self._f.closed:
+            self._f.close()
+        return False
+
+
+output_dir = tempfile.mkdtemp()
+large_file = os.path.join(output_dir, 'nyc_large.csv')
+with open('nyc_parking_tickets_extract.csv') as f:
+    header = next(f)
+    rows = f.readlines()
+with open(large_file, 'w') as f:
+    f.write(header)
+    for _ in range(1000):
+        f.writelines(rows)
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        count = fn()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def original():
+    count = 0
+    with LineDataIterator(large_file) as data:
+        for row in data:
+            count += 1
+    return count
+
+
+def csv_reader():
+    count = 0
+    with open(large_file, newline='') as f:
+        for row in csv.reader(f):
+            count += 1
+    return count
+
+
+def chunked():
+    count = 0
+    with DataIterator(large_file) as data:
+        for row in data:
+            count += 1
+    return count
+
+
+def second_pass():
+    with DataIterator(large_file) as data:
+        for row in data:
+            pass
+        start = perf_counter()
+        count = 0
+        for row in data:
+            count += 1
+        return count, perf_counter() - start
+
+
+def batched():
+    count = 0
+    with DataIterator(large_file) as data:
+        for batch in data.batches():
+            count += len(batch)
+    return count
+
+
+def typed():
+    count = 0
+    converters = (int, str, str, str, str, int, str, str, str)
+    with DataIterator(large_file, skip_header=True) as data:
+        for batch in data.batches(converters=converters):
+            count += len(batch)
+    return count + 1
+
+
+print(f'{"version":<32} {"rows/sec":>12}')
+for name, fn in (('original, one line per next', original),
+                 ('csv.reader', csv_reader),
+                 ('chunked, row by row', chunked),
+                 ('chunked, batches', batched),
+                 ('chunked, typed batches', typed)):
+    elapsed, count = timed(fn)
+    assert count == 1_000_001
+    print(f'{name:<32} {count / elapsed:>12,.0f}')
+
+(count, elapsed) = second_pass()
+print(f'{"chunked, second pass":<32} {count / elapsed:>12,.0f}')
+
+import shutil
+
+shutil.rmtree(output_dir)
@@ -0,0 +1,246 @@
+print('#' * 52 + '  ### Application - Multi-File Reader')
+
+print('#' * 52 + '  `ExitStack` lets us open any number of files in a single `with` block,'
+                 '  but all of them are open at the same time.')
+print('#' * 52 + '  With tens of thousands of shard files that runs into the limit on open file descriptors.')
+print('#' * 52 + '  `MultiFileReader` combines the rows of many files in one of three modes:')
+print('#' * 52 + '  - `zip`: one row from each file at a time (lockstep), like in "Nested Context Managers",')
+print('#' * 52 + '  - `chain`: all the rows of the first file, then the second file, and so on,')
+print('#' * 52 + '  - `merge`: files that are each sorted, merged into one sorted stream (k-way merge).')
+print('#' * 52 + '  Files are only opened when their rows are first needed, at most `max_open` of them at a time:'
+                 '  the least recently used one is closed, and reopened later at the offset where we left off.')
+print('#' * 52 + '  Rows are read in blocks, so a reopened file serves many rows before it gets closed again.')
+
+import heapq
+from collections import OrderedDict
+from itertools import chain, islice
+
+
+class FilePool:
+    def __init__(self, max_open=None):
+        self.max_open = max_open
+        self._files = OrderedDict()
+        self.opened = 0
+        self.reopened = 0
+        self.most_open = 0
+        self._seen = set()
+        self.closed = False
+
+    def get(self, f_name, offset):
+        if self.closed:
+            raise ValueError('I/O operation on a closed file pool')
+        f = self._files.get(f_name)
+        if f is None:
+            if self.max_open is not None and len(self._files) >= self.max_open:
+                _, least_recent = self._files.popitem(last=False)
+                least_recent.close()
+            f = open(f_name, 'rb')
+            f.seek(offset)
+            self._files[f_name] = f
+            self.opened += 1
+            if f_name in self._seen:
+                self.reopened += 1
+            self._seen.add(f_name)
+            self.most_open = max(self.most_open, len(self._files))
+        else:
+            self._files.move_to_end(f_name)
+        return f
+
+    def release(self, f_name):
+        f = self._files.pop(f_name, None)
+        if f is not None:
+            f.close()
+
+    def close(self):
+        self.closed = True
+        while self._files:
+            _, f = self._files.popitem()
+            f.close()
+
+    @property
+    def open_count(self):
+        return len(self._files)
+
+
+class MultiFileReader:
+    def __init__(self, f_names, mode='zip', *, key=None, max_open=None, block_size=1_000,
+                 encoding='utf-8'):
+        if mode not in ('zip', 'chain', 'merge'):
+            raise ValueError(f'unknown mode {mode!r}, expected zip, chain or merge')
+        self._f_names = list(f_names)
+        self._mode = mode
+        self._key = key
+        self._block_size = block_size
+        self._encoding = encoding
+        self._max_open = max_open
+        self.pool = None
+
+    def __enter__(self):
+        self.pool = FilePool(self._max_open)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.pool.close()
+        return False
+
+    def _rows(self, f_name):
+        # each file remembers its own offset, so the pool can close it between blocks
+        pool = self.pool
+        offset = 0
+        while True:
+            f = pool.get(f_name, offset)
+            block = list(islice(f, self._block_size))
+            offset = f.tell()
+            if len(block) < self._block_size:
+                pool.release(f_name)
+            for line in block:
+                if pool.closed:
+                    raise ValueError('MultiFileReader is closed')
+                yield line.decode(self._encoding).rstrip('\r\n')
+            if len(block) < self._block_size:
+                return
+
+    def __iter__(self):
+        if self.pool is None or self.pool.closed:
+            raise ValueError('MultiFileReader must be used inside a with block')
+        files = [self._rows(f_name) for f_name in self._f_names]
+        if self._mode == 'zip':
+            return zip(*files)
+        if self._mode == 'chain':
+            return chain.from_iterable(files)
+        return heapq.merge(*files, key=self._key)
+
+
+import os
+import tempfile
+
+
+def test_multi_file_reader():
+    directory = tempfile.mkdtemp()
+    try:
+        f_names = []
+        for i in range(5):
+            f_name = os.path.join(directory, f'shard_{i}.txt')
+            with open(f_name, 'w') as f:
+                f.writelines(f'{n}\n' for n in range(i, 100 + i * 10, 5))
+            f_names.append(f_name)
+        contents = []
+        for f_name in f_names:
+            with open(f_name) as f:
+                contents.append(f.read().splitlines())
+
+        for max_open in (None, 1, 2):
+            with MultiFileReader(f_names, 'zip', max_open=max_open, block_size=3) as reader:
+                assert list(reader) == list(zip(*contents))
+                assert reader.pool.most_open <= (max_open or 5)
+            assert reader.pool.open_count == 0
+
+            with MultiFileReader(f_names, 'chain', max_open=max_open, block_size=3) as reader:
+                assert list(reader) == [row for rows in contents for row in rows]
+                assert reader.pool.most_open == 1, 'only one file at a time'
+
+            with MultiFileReader(f_names, 'merge', key=int, max_open=max_open, block_size=3) as reader:
+                assert list(reader) == sorted((row for rows in contents for row in rows), key=int)
+
+        with MultiFileReader(f_names, 'merge', key=int, max_open=2, block_size=3) as reader:
+            assert reader.pool.opened == 0, 'nothing is opened before the rows are needed'
+            rows = iter(reader)
+            next(rows)
+            assert (reader.pool.opened, reader.pool.open_count) == (5, 2), 'a first block from every file'
+            pool = reader.pool
+        assert pool.open_count == 0, 'an early exit closes everything'
+        try:
+            list(rows)
+            assert False, 'ValueError expected'
+        except ValueError:
+            pass
+        assert pool.open_count == 0, 'rows are not read after the with block, nothing is reopened'
+        try:
+            iter(reader)
+            assert False, 'ValueError expected'
+        except ValueError:
+            pass
+
+        try:
+            with MultiFileReader(f_names, 'zip', max_open=3) as reader:
+                for row in reader:
+                    raise RuntimeError('failing halfway')
+        except RuntimeError:
+            pass
+        assert reader.pool.open_count == 0
+
+        try:
+            MultiFileReader(f_names, 'interleave')
+            assert False, 'ValueError expected'
+        except ValueError:
+            pass
+    finally:
+        import shutil
+        shutil.rmtree(directory)
+
+
+test_multi_file_reader()
+
+print('#' * 52 + '  Zipping file1.txt, file2.txt and file3.txt, with at most 2 open files:')
+
+f_names = 'file1.txt', 'file2.txt', 'file3.txt'
+
+with MultiFileReader(f_names, 'zip', max_open=2, block_size=2) as reader:
+    for rows in reader:
+        print(','.join(rows))
+print(f'opened {reader.pool.opened} times, reopened {reader.pool.reopened} times,'
+      f' at most {reader.pool.most_open} open at a time')
+
+print('#' * 52 + '  And chaining them:')
+
+with MultiFileReader(f_names, 'chain') as reader:
+    for row in reader:
+        print(row)
+
+print('#' * 52 + '  #### 5,000 sorted shards')
+print('#' * 52 + '  Opening them all with `ExitStack`, with a limit of 1,024 open files:')
+
+import resource
+import shutil
+from contextlib import ExitStack
+from time import perf_counter
+
+output_dir = tempfile.mkdtemp()
+shards = []
+for i in range(5_000):
+    f_name = os.path.join(output_dir, f'shard_{i:05}.txt')
+    with open(f_name, 'w') as f:
+        f.writelines(f'{n:08}\n' for n in range(i, 1_000_000, 5_000))  # 200 rows per shard
+    shards.append(f_name)
+
+soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+resource.setrlimit(resource.RLIMIT_NOFILE, (min(1_024, hard_limit), hard_limit))
+try:
+    try:
+        with ExitStack() as stack:
+            files = [stack.enter_context(open(f_name)) for f_name in shards]
+    except OSError as ex:
+        print(f'{ex.__class__.__name__}: {ex.strerror}')
+
+    print('#' * 52 + '  The same shards through `MultiFileReader`:')
+    print(f'{"mode":<8} {"max_open":>8} {"rows":>10} {"seconds":>8} {"opened":>8} {"reopened":>8}')
+    for mode, max_open, block_size in (('chain', None, 1_000), ('merge', 1_000, 1_000),
+                                       ('merge', 100, 1_000), ('merge', 100, 10), ('zip', 100, 50)):
+        start = perf_counter()
+        with MultiFileReader(shards, mode, max_open=max_open, block_size=block_size) as reader:
+            rows = sum(1 for _ in reader)
+            if mode == 'merge':
+                assert rows == 1_000_000
+        elapsed = perf_counter() - start
+        pool = reader.pool
+        print(f'{mode:<8} {max_open or "-":>8} {rows:>10,} {elapsed:>8.2f} {pool.opened:>8,} {pool.reopened:>8,}')
+finally:
+    resource.setrlimit(resource.RLIMIT_NOFILE, (soft_limit, hard_limit))
+
+with MultiFileReader(shards, 'merge', max_open=100) as reader:
+    print(list(islice(reader, 5)))
+
+print('#' * 52 + '  In `merge` mode every file is needed all the time, so when `max_open` is smaller than'
+                 '  the number of files, the block size decides how often they are reopened.')
+
+shutil.rmtree(output_dir)
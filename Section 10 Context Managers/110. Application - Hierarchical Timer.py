@@ -0,0 +1,294 @@
+print('#' * 52 + '  ### Application - Hierarchical Timer')
+
+print('#' * 52 + '  The `Timer` class and the `timer()` generator we wrote earlier record a single `elapsed` value.')
+print('#' * 52 + '  To find out where the time goes in a pipeline we want more than that:')
+print('#' * 52 + '  - named timers, that can be nested (`read/parse`, `read/convert`, ...),')
+print('#' * 52 + '  - statistics per name, over all the calls: count, total, min, max and percentiles,')
+print('#' * 52 + '  - the current nesting kept in a `ContextVar`, so threads and asyncio tasks do not mix up'
+                 '  each other\'s timers,')
+print('#' * 52 + '  - next to no overhead when timing is disabled.')
+
+import json
+import threading
+from contextvars import ContextVar
+from time import perf_counter_ns
+
+print('#' * 52 + '  Percentiles come from a histogram with buckets whose width grows with the value'
+                 '  (like an HDR histogram):')
+print('#' * 52 + '  values keep their 7 most significant bits, so a percentile is off by less than 1%'
+                 '  whatever the range of the values.')
+
+SIGNIFICANT_BITS = 7
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = {}
+
+    @staticmethod
+    def bucket(value):
+        shift = value.bit_length() - SIGNIFICANT_BITS
+        if shift <= 0:
+            return value
+        return value >> shift << shift
+
+    @staticmethod
+    def width(bucket):
+        return 1 << max(0, bucket.bit_length() - SIGNIFICANT_BITS)
+
+    def add(self, value):
+        bucket = self.bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, p):
+        count = sum(self.buckets.values())
+        if not count:
+            return None
+        rank = max(1, round(p / 100 * count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # the middle of the bucket
+                return bucket + (self.width(bucket) - 1) / 2
+
+
+class Stats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.histogram = Histogram()
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if self.min is None or elapsed < self.min:
+            self.min = elapsed
+        if self.max is None or elapsed > self.max:
+            self.max = elapsed
+        self.histogram.add(elapsed)
+
+    def percentile(self, p):
+        value = self.histogram.percentile(p)
+        # the exact extremes are known, so never report a percentile outside of them
+        return None if value is None else min(max(value, self.min), self.max)
+
+    def as_dict(self, percentiles):
+        # all times in milliseconds
+        result = {'count': self.count, 'total': self.total / 1e6,
+                  'mean': self.total / self.count / 1e6, 'min': self.min / 1e6}
+        for p in percentiles:
+            result[f'p{p:g}'] = self.percentile(p) / 1e6
+        result['max'] = self.max / 1e6
+        return result
+
+
+_current_path = ContextVar('timer_path', default=())
+
+
+class _NullTiming:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        return False
+
+
+_null_timing = _NullTiming()
+
+
+class _Timing:
+    __slots__ = ('_timers', '_name', '_token', '_path', '_start')
+
+    def __init__(self, timers, name):
+        self._timers = timers
+        self._name = name
+
+    def __enter__(self):
+        self._path = _current_path.get() + (self._name,)
+        self._token = _current_path.set(self._path)
+        self._start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        elapsed = perf_counter_ns() - self._start
+        _current_path.reset(self._token)
+        self._timers.record(self._path, elapsed)
+        return False
+
+
+class Timers:
+    def __init__(self, enabled=True, percentiles=(50, 90, 99)):
+        self.enabled = enabled
+        self.percentiles = percentiles
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, name):
+        if not self.enabled:
+            return _null_timing
+        return _Timing(self, name)
+
+    def record(self, path, elapsed):
+        with self._lock:
+            stats = self._stats.get(path)
+            if stats is None:
+                stats = self._stats[path] = Stats()
+            stats.add(elapsed)
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+    def stats(self, *path):
+        return self._stats.get(path)
+
+    def as_dict(self):
+        with self._lock:
+            return {'/'.join(path): stats.as_dict(self.percentiles)
+                    for path, stats in sorted(self._stats.items())}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def report(self):
+        columns = ['count', 'total', 'mean', 'min'] + [f'p{p:g}' for p in self.percentiles] + ['max']
+        lines = [f'{"timer (ms)":<24}' + ''.join(f'{column:>11}' for column in columns)]
+        with self._lock:
+            items = sorted(self._stats.items())
+        for path, stats in items:
+            values = stats.as_dict(self.percentiles)
+            name = '  ' * (len(path) - 1) + path[-1]
+            lines.append(f'{name:<24}{values["count"]:>11,}'
+                         + ''.join(f'{values[column]:>11.3f}' for column in columns[1:]))
+        return '\n'.join(lines)
+
+
+def test_timers():
+    import asyncio
+    import random
+
+    rnd = random.Random(0)
+    values = [rnd.randrange(1, 10_000_000) for _ in range(10_000)]
+    stats = Stats()
+    for value in values:
+        stats.add(value)
+    values.sort()
+    for p in (1, 50, 90, 99, 100):
+        exact = values[max(1, round(p / 100 * len(values))) - 1]
+        assert abs(stats.percentile(p) - exact) <= exact / 2 ** (SIGNIFICANT_BITS - 1), p
+    assert (stats.min, stats.max, stats.count) == (values[0], values[-1], len(values))
+    assert Histogram.bucket(100) == 100 and Histogram.bucket(1000) == 1000 and Histogram.bucket(1001) == 1000
+
+    timers = Timers()
+    with timers('outer'):
+        for _ in range(3):
+            with timers('inner'):
+                pass
+        with timers('other'):
+            pass
+    assert timers.stats('outer').count == 1
+    assert timers.stats('outer', 'inner').count == 3
+    assert timers.stats('outer', 'other').count == 1
+    assert timers.stats('inner') is None
+    assert list(json.loads(timers.to_json())) == ['outer', 'outer/inner', 'outer/other']
+
+    try:
+        with timers('failing'):
+            raise ValueError
+    except ValueError:
+        pass
+    assert timers.stats('failing').count == 1 and _current_path.get() == ()
+
+    # each task has its own nesting, even while they interleave
+    async def task(name):
+        with timers(name):
+            for _ in range(5):
+                with timers('step'):
+                    await asyncio.sleep(0)
+
+    async def main():
+        await asyncio.gather(task('a'), task('b'))
+
+    asyncio.run(main())
+    assert timers.stats('a', 'step').count == 5 and timers.stats('b', 'step').count == 5
+    assert timers.stats('a', 'b') is None and timers.stats('b', 'a') is None
+
+    def worker():
+        for _ in range(1_000):
+            with timers('thread'):
+                with timers('step'):
+                    pass
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert timers.stats('thread', 'step').count == 4_000
+
+    timers = Timers(enabled=False)
+    with timers('disabled'):
+        pass
+    assert timers.stats('disabled') is None
+
+
+test_timers()
+
+print('#' * 52 + '  #### Timing a parsing pipeline')
+
+import csv
+from time import sleep
+
+timers = Timers()
+
+converters = (int, str, str, str, str, int, str, str, str)
+
+with timers('pipeline'):
+    with open('nyc_parking_tickets_extract.csv') as f:
+        with timers('read'):
+            lines = f.readlines()
+        for _ in range(20):
+            with timers('pass'):
+                with timers('parse'):
+                    rows = list(csv.reader(lines[1:]))
+                with timers('convert'):
+                    for row in rows:
+                        with timers('row'):
+                            parsed = [converter(value) for converter, value in zip(converters, row)]
+                with timers('sleep'):
+                    sleep(0.001)
+
+print(timers.report())
+
+print('#' * 52 + '  The same statistics as JSON:')
+
+print(json.dumps(timers.as_dict()['pipeline/pass/parse'], indent=2))
+
+print('#' * 52 + '  #### Overhead')
+print('#' * 52 + '  1,000,000 empty `with` blocks:')
+
+n = 1_000_000
+
+
+def no_timer():
+    start = perf_counter_ns()
+    for _ in range(n):
+        pass
+    return (perf_counter_ns() - start) / n
+
+
+def with_timers(timers):
+    start = perf_counter_ns()
+    for _ in range(n):
+        with timers('empty'):
+            pass
+    return (perf_counter_ns() - start) / n
+
+
+baseline = no_timer()
+print(f'{"no timer":<20} {baseline:>8.0f} ns per iteration')
+print(f'{"disabled":<20} {with_timers(Timers(enabled=False)) - baseline:>8.0f} ns per timer')
+print(f'{"enabled":<20} {with_timers(Timers()) - baseline:>8.0f} ns per timer')
@@ -0,0 +1,304 @@
+print('#' * 52 + '  ### Application - Fast Context Managers')
+
+print('#' * 52 + '  A `with` block around every row (a decimal precision, a timer, ...) is a nice way to scope'
+                 '  a setting, but every one of them costs a few microseconds.')
+print('#' * 52 + '  With `contextlib.contextmanager` (and our own `context_manager_dec`) each `with`:')
+print('#' * 52 + '  - creates a generator,')
+print('#' * 52 + '  - creates the context manager object, which also stores the function, its arguments'
+                 '  and its docstring,')
+print('#' * 52 + '  - resumes the generator twice, in `__enter__` and in `__exit__`.')
+print('#' * 52 + '  We are going to try two things:')
+print('#' * 52 + '  - a slimmer `contextmanager` decorator, with the same semantics,')
+print('#' * 52 + '  - a `Scope`: a context manager built from an enter and an exit function, that is created once'
+                 '  and reused for every `with` - no generator at all.')
+
+from functools import partial, wraps
+
+
+class _GeneratorContextManager:
+    __slots__ = ('gen',)
+
+    def __init__(self, gen):
+        self.gen = gen
+
+    def __enter__(self):
+        try:
+            return next(self.gen)
+        except StopIteration:
+            raise RuntimeError("generator didn't yield") from None
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        if exc_type is None:
+            try:
+                next(self.gen)
+            except StopIteration:
+                return False
+            self.gen.close()
+            raise RuntimeError("generator didn't stop")
+
+        # the same rules as contextlib: an exception is suppressed only if the generator swallowed it
+        if exc_value is None:
+            exc_value = exc_type()
+        try:
+            self.gen.throw(exc_value)
+        except StopIteration as ex:
+            return ex is not exc_value
+        except RuntimeError as ex:
+            if ex is exc_value or (isinstance(exc_value, StopIteration) and ex.__cause__ is exc_value):
+                exc_value.__traceback__ = exc_tb
+                return False
+            raise
+        except BaseException as ex:
+            if ex is not exc_value:
+                raise
+            ex.__traceback__ = exc_tb
+            return False
+        self.gen.close()
+        raise RuntimeError("generator didn't stop after throw()")
+
+
+def contextmanager(gen_fn):
+    @wraps(gen_fn)
+    def helper(*args, **kwargs):
+        return _GeneratorContextManager(gen_fn(*args, **kwargs))
+    return helper
+
+
+print('#' * 52 + '  A `Scope` keeps the values returned by `enter` on a stack, so the same instance can be'
+                 '  nested inside itself (re-entrant).')
+print('#' * 52 + '  The stack belongs to the instance: use one instance per thread.')
+
+
+class Scope:
+    __slots__ = ('_enter', '_exit', '_states')
+
+    def __init__(self, enter, exit):
+        # enter() returns a state, exit(state) undoes whatever enter did
+        self._enter = enter
+        self._exit = exit
+        self._states = []
+
+    def __enter__(self):
+        state = self._enter()
+        self._states.append(state)
+        return state
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self._exit(self._states.pop())
+        return False
+
+
+import contextlib
+
+
+def test_contextmanager():
+    events = []
+
+    def body(suppress=False, stop=True, replace=False):
+        events.append('enter')
+        try:
+            yield 'value'
+        except ValueError:
+            events.append('caught')
+            if replace:
+                raise KeyError('replaced')
+            if not suppress:
+                raise
+        finally:
+            events.append('exit')
+        if not stop:
+            yield 'again'
+
+    def run(decorator, fail_with=None, **kwargs):
+        events.clear()
+        try:
+            with decorator(body)(**kwargs) as value:
+                assert value == 'value'
+                if fail_with is not None:
+                    raise fail_with
+        except BaseException as ex:
+            return type(ex).__name__, str(ex), list(events)
+        return None, None, list(events)
+
+    cases = [{}, {'fail_with': ValueError('bad')}, {'fail_with': ValueError('bad'), 'suppress': True},
+             {'fail_with': ValueError('bad'), 'replace': True}, {'fail_with': TypeError('other')},
+             {'fail_with': StopIteration('stop')}, {'stop': False},
+             {'fail_with': ValueError('bad'), 'suppress': True, 'stop': False}]
+    for kwargs in cases:
+        assert run(contextmanager, **kwargs) == run(contextlib.contextmanager, **kwargs), kwargs
+
+    assert contextmanager(body).__name__ == 'body'
+
+    states = []
+    counter = Scope(lambda: len(states) + 1, states.append)
+    with counter as outer:
+        with counter as inner:
+            pass
+    assert (outer, inner, states) == (1, 1, [1, 1])
+
+    values = [0]
+
+    def enter():
+        values.append(values[-1] + 1)
+        return values[-1]
+
+    def exit(state):
+        assert values.pop() == state
+
+    scope = Scope(enter, exit)
+    try:
+        with scope as first:
+            with scope as second:
+                raise ValueError
+    except ValueError:
+        pass
+    assert (first, second, values) == (1, 2, [0])
+
+
+test_contextmanager()
+
+print('#' * 52 + '  #### Per-row decimal precision')
+print('#' * 52 + '  Each version sets the precision of the current decimal context and restores it afterwards:')
+
+import decimal
+from time import perf_counter
+
+
+def set_precision(prec):
+    ctx = decimal.getcontext()
+    old_prec = ctx.prec
+    ctx.prec = prec
+    return old_prec
+
+
+def restore_precision(old_prec):
+    decimal.getcontext().prec = old_prec
+
+
+def precision_gen(prec):
+    ctx = decimal.getcontext()
+    old_prec = ctx.prec
+    ctx.prec = prec
+    try:
+        yield ctx
+    finally:
+        ctx.prec = old_prec
+
+
+precision_contextlib = contextlib.contextmanager(precision_gen)
+precision_fast = contextmanager(precision_gen)
+
+
+class GenContextManager:
+    # from "The contextmanager Decorator"
+    def __init__(self, gen):
+        self.gen = gen
+
+    def __enter__(self):
+        return next(self.gen)
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        try:
+            next(self.gen)
+        except StopIteration:
+            pass
+        return False
+
+
+def context_manager_dec(gen_fn):
+    def helper(*args, **kwargs):
+        gen = gen_fn(*args, **kwargs)
+        ctx = GenContextManager(gen)
+        return ctx
+    return helper
+
+
+precision_course = context_manager_dec(precision_gen)
+
+
+class Precision:
+    def __init__(self, prec):
+        self.prec = prec
+
+    def __enter__(self):
+        ctx = decimal.getcontext()
+        self.old_prec = ctx.prec
+        ctx.prec = self.prec
+        return ctx
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        decimal.getcontext().prec = self.old_prec
+        return False
+
+
+prices = [decimal.Decimal(n) / 7 for n in range(1, 1001)]
+n = 200
+
+
+def plain_loop():
+    start = perf_counter()
+    for _ in range(n):
+        for price in prices:
+            price * 3
+    return perf_counter() - start
+
+
+def no_context():
+    start = perf_counter()
+    for _ in range(n):
+        for price in prices:
+            old_prec = set_precision(4)
+            try:
+                price * 3
+            finally:
+                restore_precision(old_prec)
+    return perf_counter() - start
+
+
+def per_row(precision):
+    start = perf_counter()
+    for _ in range(n):
+        for price in prices:
+            with precision(4):
+                price * 3
+    return perf_counter() - start
+
+
+def per_row_scope():
+    scope = Scope(partial(set_precision, 4), restore_precision)
+    start = perf_counter()
+    for _ in range(n):
+        for price in prices:
+            with scope:
+                price * 3
+    return perf_counter() - start
+
+
+def per_batch():
+    start = perf_counter()
+    for _ in range(n):
+        with decimal.localcontext() as ctx:
+            ctx.prec = 4
+            for price in prices:
+                price * 3
+    return perf_counter() - start
+
+
+rows = n * len(prices)
+baseline = min(plain_loop() for _ in range(3))
+print(f'{"version":<34} {"ns per row":>10} {"overhead":>10}')
+print(f'{"same loop, precision not changed":<34} {baseline / rows * 1e9:>10.0f}')
+for name, fn in (('inline try/finally (no with)', no_context),
+                 ('contextlib.contextmanager', lambda: per_row(precision_contextlib)),
+                 ('context_manager_dec (course)', lambda: per_row(precision_course)),
+                 ('slim contextmanager', lambda: per_row(precision_fast)),
+                 ('hand-written class', lambda: per_row(Precision)),
+                 ('Scope, created once', per_row_scope),
+                 ('localcontext around each batch', per_batch)):
+    elapsed = min(fn() for _ in range(3))
+    print(f'{name:<34} {elapsed / rows * 1e9:>10.0f} {(elapsed - baseline) / rows * 1e9:>10.0f}')
+
+print('#' * 52 + '  The slim decorator saves the bookkeeping `contextlib` does when creating the context manager,'
+                 '  but still creates a generator per row.')
+print('#' * 52 + '  A `Scope` or a hand-written class avoids the generator, and setting the precision once'
+                 '  around the whole batch avoids the per-row work altogether.')
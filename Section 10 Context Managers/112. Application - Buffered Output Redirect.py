@@ -0,0 +1,359 @@
+print('#' * 52 + '  ### Application - Buffered Output Redirect')
+
+print('#' * 52 + '  `OutToFile` swaps `sys.stdout` for a file while the `with` block runs.')
+print('#' * 52 + '  Two problems with that:')
+print('#' * 52 + '  - `sys.stdout` is shared by the whole process: while one thread redirects its output,'
+                 '  every other thread\'s `print` goes to the same file,')
+print('#' * 52 + '  - all the writing (and compressing, if we write a `.gz` file) happens in the thread'
+                 '  that prints.')
+print('#' * 52 + '  Here `sys.stdout` is replaced once, by a proxy that is a `threading.local`: each thread'
+                 '  sees its own `write`, with no Python code in between.')
+print('#' * 52 + '  Inside asyncio tasks several redirects share a thread: there the proxy looks up the current'
+                 '  target in a `ContextVar` instead, so each task has its own redirect.')
+print('#' * 52 + '  The target is buffered in C, like a regular file, and hands large chunks through a pipe to'
+                 '  a background thread, which writes (and optionally compresses) them.')
+
+import asyncio
+import gzip
+import io
+import os
+import sys
+import threading
+from contextvars import ContextVar
+
+_target = ContextVar('stdout_target', default=None)
+_get_target = _target.get
+
+
+class StdoutProxy(threading.local):
+    # __init__ runs again in every thread, the first time that thread uses the proxy
+    def __init__(self, original):
+        self.original = original
+        self.write = original.write
+        self.sinks = []  # redirects entered by this thread, the innermost last
+        self.in_tasks = 0  # how many of them were entered inside an asyncio task
+
+    def _current(self):
+        target = _get_target()
+        return self.original if target is None else target
+
+    def _context_write(self, text):
+        return self._current().write(text)
+
+    def update(self):
+        # print looks up `write` for every argument, separator and line end:
+        # bind it directly to the target whenever that is unambiguous
+        if self.in_tasks:
+            self.write = self._context_write
+        elif self.sinks:
+            self.write = self.sinks[-1].write
+        else:
+            self.write = self.original.write
+
+    # no __getattr__: with one, every lookup of `write` would go through Python code first
+
+    def flush(self):
+        return self._current().flush()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def isatty(self):
+        return self._current().isatty()
+
+    def fileno(self):
+        return self._current().fileno()
+
+    def writable(self):
+        return self._current().writable()
+
+    def reconfigure(self, **settings):
+        return self._current().reconfigure(**settings)
+
+    @property
+    def buffer(self):
+        return self._current().buffer
+
+    @property
+    def closed(self):
+        return self._current().closed
+
+    @property
+    def encoding(self):
+        return self._current().encoding
+
+    @property
+    def errors(self):
+        return self._current().errors
+
+    @property
+    def mode(self):
+        return self._current().mode
+
+    @property
+    def name(self):
+        return self._current().name
+
+
+_installed = 0
+_install_lock = threading.Lock()
+
+
+def install_proxy():
+    global _installed
+    with _install_lock:
+        if not isinstance(sys.stdout, StdoutProxy):
+            sys.stdout = StdoutProxy(sys.stdout)
+        _installed += 1
+        return sys.stdout
+
+
+def uninstall_proxy():
+    # the last redirect to exit puts the original stdout back
+    global _installed
+    with _install_lock:
+        _installed -= 1
+        if _installed == 0 and isinstance(sys.stdout, StdoutProxy):
+            sys.stdout = sys.stdout.original
+
+
+class _ChunkWriter:
+    # the printing thread writes into a plain TextIOWrapper over a pipe: every layer is the C one a regular
+    # file has, and each full buffer goes through the pipe to the background thread in one write
+    def __init__(self, f_name, compress=False, buffer_size=1 << 20, encoding='utf-8'):
+        self._f = gzip.open(f_name, 'wb') if compress else open(f_name, 'wb')
+        self._read_fd, write_fd = os.pipe()
+        self._error = None
+        self.chunks = 0
+        self.sink = io.TextIOWrapper(io.BufferedWriter(io.FileIO(write_fd, 'w'), buffer_size),
+                                     encoding=encoding)
+        self._writer = threading.Thread(target=self._write_chunks, args=(buffer_size,), daemon=True)
+        self._writer.start()
+
+    def _write_chunks(self, size):
+        try:
+            while True:
+                chunk = os.read(self._read_fd, size)
+                if not chunk:
+                    break
+                self._f.write(chunk)
+                self.chunks += 1
+        except BaseException as ex:
+            self._error = ex
+        finally:
+            # once the reading end is closed, the next write in the printing thread fails
+            # instead of blocking on a dead writer
+            os.close(self._read_fd)
+            try:
+                self._f.close()
+            except BaseException as ex:
+                self._error = self._error or ex
+
+    def close(self):
+        # the pipe is bounded by the OS: if the writer falls behind, the printing thread waits
+        # instead of piling up memory
+        try:
+            self.sink.close()
+        except BrokenPipeError:
+            if self._error is None:
+                raise
+        finally:
+            self._writer.join()
+        if self._error is not None:
+            raise self._error
+
+
+def _in_task():
+    try:
+        return asyncio.current_task() is not None
+    except RuntimeError:
+        return False
+
+
+class redirect_output:
+    def __init__(self, f_name, compress=False, buffer_size=1 << 20):
+        self._f_name = f_name
+        self._compress = compress
+        self._buffer_size = buffer_size
+
+    def __enter__(self):
+        self._writer = _ChunkWriter(self._f_name, self._compress, self._buffer_size)
+        sink = self._writer.sink
+        proxy = install_proxy()
+        self._token = _target.set(sink)
+        self._in_task = _in_task()
+        proxy.sinks.append(sink)
+        proxy.in_tasks += self._in_task
+        proxy.update()
+        self._proxy = proxy
+        self._sink = sink
+        return sink
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        proxy = self._proxy
+        proxy.sinks.remove(self._sink)
+        proxy.in_tasks -= self._in_task
+        proxy.update()
+        _target.reset(self._token)
+        uninstall_proxy()
+        self._writer.close()
+        return False
+
+
+import tempfile
+
+
+def test_redirect_output():
+    directory = tempfile.mkdtemp()
+
+    def read(f_name):
+        opener = gzip.open if f_name.endswith('.gz') else open
+        with opener(f_name, 'rt') as f:
+            return f.read()
+
+    try:
+        f_name = os.path.join(directory, 'out.txt')
+        inner_name = os.path.join(directory, 'inner.txt.gz')
+        with redirect_output(f_name, buffer_size=10):
+            print('line 1')
+            with redirect_output(inner_name, compress=True):
+                print('inner', 'line', sep='-')
+            print('line 2', end='!\n')
+        assert read(f_name) == 'line 1\nline 2!\n'
+        assert read(inner_name) == 'inner-line\n'
+        assert _target.get() is None
+        assert not isinstance(sys.stdout, StdoutProxy), 'the original stdout is restored'
+
+        redirect = redirect_output(f_name, buffer_size=1000)
+        with redirect as sink:
+            for i in range(10_000):
+                sys.stdout.write(f'row {i}\n')
+            # handed to the writer thread in chunks while writing, not all at the end
+            assert redirect._writer.chunks >= 5
+            # everything else a text file has is forwarded to the current target
+            assert sys.stdout.buffer is sink.buffer and sys.stdout.writable() and not sys.stdout.closed
+            assert sys.stdout.encoding == 'utf-8'
+        assert read(f_name) == ''.join(f'row {i}\n' for i in range(10_000))
+
+        try:
+            with redirect_output(f_name):
+                print('before the error')
+                raise ValueError
+        except ValueError:
+            pass
+        assert read(f_name) == 'before the error\n', 'flushed even when the block fails'
+
+        def worker(i):
+            with redirect_output(os.path.join(directory, f'thread_{i}.txt'), buffer_size=100):
+                for n in range(1_000):
+                    print(i, n)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(4):
+            assert read(os.path.join(directory, f'thread_{i}.txt')) == ''.join(f'{i} {n}\n' for n in range(1_000))
+
+        async def task(name):
+            with redirect_output(os.path.join(directory, f'{name}.txt')):
+                for n in range(3):
+                    print(name, n)
+                    await asyncio.sleep(0)
+
+        async def main():
+            await asyncio.gather(task('a'), task('b'))
+
+        asyncio.run(main())
+        assert read(os.path.join(directory, 'a.txt')) == 'a 0\na 1\na 2\n'
+        assert read(os.path.join(directory, 'b.txt')) == 'b 0\nb 1\nb 2\n'
+
+        try:
+            with redirect_output(os.path.join(directory, 'missing', 'out.txt')):
+                pass
+            assert False, 'FileNotFoundError expected'
+        except FileNotFoundError:
+            pass
+        assert _target.get() is None
+    finally:
+        import shutil
+        shutil.rmtree(directory)
+
+
+test_redirect_output()
+
+print('#' * 52 + '  Outside of a redirect, `print` still goes to the console:')
+
+output_dir = tempfile.mkdtemp()
+f_name = os.path.join(output_dir, 'test.txt')
+
+with redirect_output(f_name):
+    print('Line 1')
+    print('Line 2')
+
+print('back to console output')
+
+with open(f_name) as f:
+    print(f.readlines())
+
+print('#' * 52 + '  #### Timings: 10,000,000 prints')
+
+from time import perf_counter
+
+
+class OutToFile:
+    def __init__(self, fname, opener=open):
+        self._fname = fname
+        self._opener = opener
+        self._current_stdout = sys.stdout
+
+    def __enter__(self):
+        self._current_stdout = sys.stdout
+        self._file = self._opener(self._fname, 'wt')
+        sys.stdout = self._file
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        sys.stdout = self._current_stdout
+        if self._file:
+            self._file.close()
+        return False
+
+
+n = 10_000_000
+
+
+def timed(context, f_name):
+    start = perf_counter()
+    with context:
+        for i in range(n):
+            print('row', i, 'of the report')
+    elapsed = perf_counter() - start
+    return elapsed, os.path.getsize(f_name)
+
+
+plain_name = os.path.join(output_dir, 'out.txt')
+gzip_name = os.path.join(output_dir, 'out.txt.gz')
+print(f'{"method":<32} {"lines/sec":>12} {"bytes":>12}')
+for name, context, f_name in (
+        ('OutToFile', OutToFile(plain_name), plain_name),
+        ('OutToFile, gzip', OutToFile(gzip_name, gzip.open), gzip_name),
+        ('redirect_output', redirect_output(plain_name), plain_name),
+        ('redirect_output, gzip', redirect_output(gzip_name, compress=True), gzip_name)):
+    elapsed, size = timed(context, f_name)
+    print(f'{name:<32} {n / elapsed:>12,.0f} {size:>12,}')
+
+print('#' * 52 + '  `print` calls `write` for every argument, separator and line end: outside of asyncio tasks'
+                 '  the proxy hands it the target\'s C `write` directly, so each of those calls costs about'
+                 '  as much as writing to a regular file.')
+print('#' * 52 + '  The pipe matters: with a Python `RawIOBase` under the buffer instead, `TextIOWrapper` loses'
+                 '  its fast path and checks `closed` in Python code on every write, about a third slower'
+                 '  than a regular file. With every layer in C, a plain file costs about the same as `OutToFile`.')
+print('#' * 52 + '  With compression the printing thread no longer compresses: on a single core that gains a'
+                 '  little, a spare core lets the background writer compress while the printing thread keeps going.')
+print('#' * 52 + '  On top of that, the output is scoped per thread and task.')
+
+import shutil
+
+shutil.rmtree(output_dir)
@@ -0,0 +1,332 @@
+print('#' * 52 + '  ### Application - Streaming Report Renderer')
+
+print('#' * 52 + '  `Tag` and `ListMaker` call `print` for every opening tag, closing tag and list item.')
+print('#' * 52 + '  For a report with a few rows that is fine, with millions of rows it is very slow.')
+print('#' * 52 + '  The renderers below keep the nested `with` idiom, but:')
+print('#' * 52 + '  - they collect the output fragments in a list, and write them to the file in large chunks,')
+print('#' * 52 + '  - the indentation string for each depth is computed once,')
+print('#' * 52 + '  - table rows are rendered in bulk, with one format string per table,')
+print('#' * 52 + '  - whatever is collected is written out whenever a top level section closes, or the buffer'
+                 '  is full: memory stays bounded however long the report is.')
+
+from html import escape
+
+
+class Renderer:
+    def __init__(self, f, indent='  ', chunk_size=1 << 16, flush_depth=0):
+        self._f = f
+        self._indent = indent
+        self._indents = ['']
+        self._chunk_size = chunk_size
+        self._flush_depth = flush_depth
+        self._parts = []
+        self._size = 0
+        self.depth = 0
+        self.max_buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.flush()
+        return False
+
+    def indentation(self, depth=None):
+        depth = self.depth if depth is None else depth
+        while len(self._indents) <= depth:
+            self._indents.append(self._indents[-1] + self._indent)
+        return self._indents[depth]
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self._chunk_size:
+            self.flush()
+
+    def write_lines(self, lines):
+        # many lines at the same depth, as a single fragment
+        prefix = self.indentation()
+        self.write(''.join(prefix + line + '\n' for line in lines))
+
+    def line(self, text):
+        self.write(self.indentation() + text + '\n')
+
+    def flush(self):
+        if self._parts:
+            self.max_buffered = max(self.max_buffered, self._size)
+            self._f.write(''.join(self._parts))
+            self._parts = []
+            self._size = 0
+
+    def _section_closed(self):
+        if self.depth <= self._flush_depth:
+            self.flush()
+
+
+class _Block:
+    __slots__ = ('_renderer', '_start', '_end')
+
+    def __init__(self, renderer, start, end):
+        self._renderer = renderer
+        self._start = start
+        self._end = end
+
+    def __enter__(self):
+        renderer = self._renderer
+        if self._start is not None:
+            renderer.line(self._start)
+        renderer.depth += 1
+        return renderer
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        renderer = self._renderer
+        renderer.depth -= 1
+        if self._end is not None:
+            renderer.line(self._end)
+        renderer._section_closed()
+        return False
+
+
+class HtmlReport(Renderer):
+    def tag(self, tag, **attributes):
+        attrs = ''.join(f' {name.rstrip("_")}="{escape(str(value))}"' for name, value in attributes.items())
+        return _Block(self, f'<{tag}{attrs}>', f'</{tag}>')
+
+    def element(self, tag, text):
+        self.line(f'<{tag}>{escape(str(text))}</{tag}>')
+
+    def text(self, text):
+        self.line(escape(str(text)))
+
+    def table(self, headers, rows, **attributes):
+        cell = '<td>{}</td>' * len(headers)
+        row_format = '<tr>' + cell + '</tr>'
+        with self.tag('table', **attributes):
+            self.line('<tr>' + ''.join(f'<th>{escape(str(header))}</th>' for header in headers) + '</tr>')
+            batch = []
+            for row in rows:
+                batch.append(row_format.format(*map(escape, map(str, row))))
+                if len(batch) == 1_000:
+                    self.write_lines(batch)
+                    batch = []
+            self.write_lines(batch)
+
+
+class MarkdownReport(Renderer):
+    def __init__(self, f, chunk_size=1 << 16, flush_depth=0):
+        super().__init__(f, indent='   ', chunk_size=chunk_size, flush_depth=flush_depth)
+        self._level = 0
+
+    def _section_closed(self):
+        if self._level <= self._flush_depth and self.depth <= self._flush_depth:
+            self.flush()
+
+    def section(self, title):
+        # a heading one level below the enclosing section
+        self._level += 1
+        self.write('#' * self._level + ' ' + title + '\n\n')
+        return _Section(self)
+
+    def items(self):
+        return _Block(self, None, None)
+
+    def item(self, text, prefix='- '):
+        # at depth 1 the items are not indented, like the first level of ListMaker
+        self.write(self.indentation(max(self.depth - 1, 0)) + prefix + str(text) + '\n')
+
+    def paragraph(self, text):
+        self.write(str(text) + '\n\n')
+
+    def table(self, headers, rows):
+        row_format = '|' + ' {} |' * len(headers)
+        header = row_format.format(*(str(value).replace('|', '\\|') for value in headers))
+        self.write(header + '\n' + '|' + ' --- |' * len(headers) + '\n')
+        batch = []
+        for row in rows:
+            batch.append(row_format.format(*(str(value).replace('|', '\\|') for value in row)))
+            if len(batch) == 1_000:
+                self.write('\n'.join(batch) + '\n')
+                batch = []
+        if batch:
+            self.write('\n'.join(batch) + '\n')
+        self.write('\n')
+
+
+class _Section:
+    __slots__ = ('_renderer',)
+
+    def __init__(self, renderer):
+        self._renderer = renderer
+
+    def __enter__(self):
+        return self._renderer
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self._renderer._level -= 1
+        self._renderer._section_closed()
+        return False
+
+
+import io
+
+
+def test_renderers():
+    out = io.StringIO()
+    with HtmlReport(out) as html:
+        with html.tag('div', class_='report'):
+            html.element('h1', 'Tickets & fines')
+            with html.tag('p'):
+                html.text('some <b> text')
+            html.table(('make', 'count'), [('FORD', 3), ('A|B', 1)])
+    assert out.getvalue() == ('<div class="report">\n'
+                              '  <h1>Tickets &amp; fines</h1>\n'
+                              '  <p>\n'
+                              '    some &lt;b&gt; text\n'
+                              '  </p>\n'
+                              '  <table>\n'
+                              '    <tr><th>make</th><th>count</th></tr>\n'
+                              '    <tr><td>FORD</td><td>3</td></tr>\n'
+                              '    <tr><td>A|B</td><td>1</td></tr>\n'
+                              '  </table>\n'
+                              '</div>\n')
+
+    out = io.StringIO()
+    with MarkdownReport(out) as md:
+        with md.section('Report'):
+            md.paragraph('Items')
+            with md.items():
+                md.item('Item 1')
+                with md.items():
+                    md.item('item 1a')
+                md.item('Item 2')
+            md.item('Outside a list')
+            with md.section('Table'):
+                md.table(('make', 'count|n'), [('FORD', 3), ('A|B', 1)])
+    assert out.getvalue() == ('# Report\n\nItems\n\n'
+                              '- Item 1\n   - item 1a\n- Item 2\n- Outside a list\n'
+                              '## Table\n\n'
+                              '| make | count\\|n |\n| --- | --- |\n| FORD | 3 |\n| A\\|B | 1 |\n\n')
+
+    # nothing is written before the top level section closes, unless the buffer is full
+    out = io.StringIO()
+    html = HtmlReport(out, chunk_size=1 << 20)
+    with html.tag('section'):
+        html.text('first')
+        assert out.getvalue() == ''
+    assert out.getvalue() == '<section>\n  first\n</section>\n'
+
+    out = io.StringIO()
+    html = HtmlReport(out, chunk_size=100)
+    with html.tag('section'):
+        html.table(('n',), ((n,) for n in range(10_000)))
+        assert len(out.getvalue()) > 250_000
+    # the buffer never holds more than one batch of table rows on top of the chunk size
+    assert html.max_buffered < 30_000
+
+
+test_renderers()
+
+print('#' * 52 + '  #### A short report')
+
+import csv
+import sys
+from collections import defaultdict
+
+with open('nyc_parking_tickets_extract.csv') as f:
+    reader = csv.reader(f)
+    headers = next(reader)
+    rows = list(reader)
+
+by_make = defaultdict(list)
+for row in rows:
+    by_make[row[7]].append(row)
+
+with MarkdownReport(sys.stdout) as md:
+    with md.section('Parking tickets'):
+        md.paragraph(f'{len(rows)} tickets, {len(by_make)} makes.')
+        with md.items():
+            for make in ('BMW', 'TOYOT'):
+                md.item(make)
+                with md.items():
+                    md.item(f'{len(by_make[make])} tickets')
+        with md.section('BMW'):
+            md.table(headers[:5], (row[:5] for row in by_make['BMW'][:5]))
+
+print('#' * 52 + '  #### Timings: per make ticket tables, 300,000 rows')
+
+import os
+import tempfile
+from time import perf_counter
+
+
+class OutToFile:
+    def __init__(self, fname):
+        self._fname = fname
+        self._current_stdout = sys.stdout
+
+    def __enter__(self):
+        self._file = open(self._fname, 'w')
+        sys.stdout = self._file
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        sys.stdout = self._current_stdout
+        if self._file:
+            self._file.close()
+        return False
+
+
+class Tag:
+    def __init__(self, tag):
+        self._tag = tag
+
+    def __enter__(self):
+        print(f'<{self._tag}>', end='')
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        print(f'</{self._tag}>', end='')
+        return False
+
+
+copies = 300
+output_dir = tempfile.mkdtemp()
+
+
+def with_print(f_name):
+    with OutToFile(f_name):
+        with Tag('html'):
+            for make, make_rows in by_make.items():
+                with Tag('h2'):
+                    print(escape(make), end='')
+                with Tag('table'):
+                    for _ in range(copies):
+                        for row in make_rows:
+                            with Tag('tr'):
+                                for value in row:
+                                    with Tag('td'):
+                                        print(escape(value), end='')
+
+
+def with_renderer(f_name):
+    with open(f_name, 'w') as f:
+        with HtmlReport(f, chunk_size=1 << 20) as html:
+            with html.tag('html'):
+                for make, make_rows in by_make.items():
+                    html.element('h2', make)
+                    html.table(headers, (row for _ in range(copies) for row in make_rows))
+    return html.max_buffered
+
+
+elapsed = {}
+for name, fn in (('Tag + print', with_print), ('HtmlReport', with_renderer)):
+    f_name = os.path.join(output_dir, name.replace(' ', '') + '.html')
+    start = perf_counter()
+    max_buffered = fn(f_name)
+    elapsed[name] = perf_counter() - start
+    print(f'{name:<12} {elapsed[name]:>7.2f} s {len(rows) * copies / elapsed[name]:>12,.0f} rows/sec'
+          f' {os.path.getsize(f_name):>14,} bytes')
+
+print(f'max buffered by HtmlReport: {max_buffered:,} characters')
+
+import shutil
+
+shutil.rmtree(output_dir)
@@ -0,0 +1,449 @@
+print('#' * 52 + '  ### Application - Resource Pool')
+
+print('#' * 52 + '  `ResourceManager` and our `open_file` context managers create a new resource on every `with`,'
+                 '  and destroy it on the way out.')
+print('#' * 52 + '  When the same few files or database connections are used over and over again,'
+                 '  we can keep them around instead:')
+print('#' * 52 + '  `with pool.acquire(key) as resource:` checks out an idle resource for that key'
+                 '  (or creates one), and puts it back when the block ends.')
+print('#' * 52 + '  - up to `max_idle` idle resources are kept per key, the least recently used ones are'
+                 '  closed first,')
+print('#' * 52 + '  - idle resources are closed after `idle_timeout` seconds,')
+print('#' * 52 + '  - a resource is validated before it is handed out, and is closed if the block raises,')
+print('#' * 52 + '  - `max_per_key` limits how many resources a key can have at the same time:'
+                 '  other threads wait for one to come back,')
+print('#' * 52 + '  - the pool counts hits, misses and time spent waiting.')
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+_missing = object()
+
+
+class _Lease:
+    __slots__ = ('_pool', '_key', '_timeout', '_resource')
+
+    def __init__(self, pool, key, timeout):
+        self._pool = pool
+        self._key = key
+        self._timeout = timeout
+
+    def __enter__(self):
+        self._resource = self._pool._checkout(self._key, self._timeout)
+        return self._resource
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        # after an error we cannot tell what state the resource is in
+        self._pool._checkin(self._key, self._resource, discard=exc_type is not None)
+        return False
+
+
+class ResourcePool:
+    def __init__(self, factory, *, close=None, validate=None, max_idle=4, max_idle_total=None,
+                 max_per_key=None, idle_timeout=None, clock=time.monotonic):
+        self._factory = factory
+        self._close = close if close is not None else (lambda resource: resource.close())
+        self._validate = validate
+        self._max_idle = max_idle
+        self._max_idle_total = max_idle_total
+        self._max_per_key = max_per_key
+        self._idle_timeout = idle_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._returned = threading.Condition(self._lock)
+        self._idle = {}  # key -> deque of idle tokens, the most recently used on the right
+        self._entries = OrderedDict()  # token -> (key, resource, released_at), least recently used first
+        self._counts = {}  # key -> number of resources, idle or in use
+        self._next_token = 0
+        self._closed = False
+        self.stats = {'hits': 0, 'misses': 0, 'invalid': 0, 'evicted': 0, 'expired': 0,
+                      'discarded': 0, 'waits': 0, 'wait_time': 0.0}
+
+    def acquire(self, key, timeout=None):
+        return _Lease(self, key, timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+        return False
+
+    def _remove_idle(self, token):
+        # called with the lock held, returns the resource to close (outside of the lock)
+        key, resource, _ = self._entries.pop(token)
+        self._idle[key].remove(token)
+        self._counts[key] -= 1
+        return resource
+
+    def _expired(self):
+        if self._idle_timeout is None:
+            return []
+        deadline = self._clock() - self._idle_timeout
+        expired = []
+        for token, (_, _, released_at) in self._entries.items():
+            if released_at > deadline:
+                break  # entries are in release order, the rest are more recent
+            expired.append(token)
+        self.stats['expired'] += len(expired)
+        return [self._remove_idle(token) for token in expired]
+
+    def _checkout(self, key, timeout):
+        start = None
+        while True:
+            to_close = []
+            resource = _missing
+            try:
+                with self._lock:
+                    if self._closed:
+                        raise RuntimeError('pool is closed')
+                    to_close.extend(self._expired())
+                    while True:
+                        idle = self._idle.get(key)
+                        if idle:
+                            _, resource, _ = self._entries.pop(idle.pop())
+                            if self._validate is None:
+                                self._hit(start)
+                                return resource
+                            break
+                        if self._max_per_key is None or self._counts.get(key, 0) < self._max_per_key:
+                            if start is not None:
+                                self.stats['wait_time'] += self._clock() - start
+                            self.stats['misses'] += 1
+                            # reserve the slot now, create the resource outside of the lock
+                            self._counts[key] = self._counts.get(key, 0) + 1
+                            break
+                        # every resource for this key is in use: wait for one to come back
+                        now = self._clock()
+                        if start is None:
+                            start = now
+                            self.stats['waits'] += 1
+                        remaining = None if timeout is None else timeout - (now - start)
+                        if remaining is not None and remaining <= 0:
+                            self.stats['wait_time'] += now - start
+                            raise PoolTimeout(f'no resource available for {key!r} after {timeout} s')
+                        self._returned.wait(remaining)
+                        if self._closed:
+                            raise RuntimeError('pool is closed')
+            finally:
+                for stale in to_close:
+                    self._close(stale)
+
+            if resource is _missing:
+                return self._create(key)
+            # validating can take a round trip (a `SELECT 1` on a connection):
+            # outside of the lock, so that checkouts for other keys are not held up
+            try:
+                valid = self._validate(resource)
+            except BaseException:
+                self._drop(key, resource, 'invalid')
+                raise
+            if valid:
+                with self._lock:
+                    self._hit(start)
+                return resource
+            self._drop(key, resource, 'invalid')
+
+    def _hit(self, start):
+        # called with the lock held
+        self.stats['hits'] += 1
+        if start is not None:
+            self.stats['wait_time'] += self._clock() - start
+
+    def _create(self, key):
+        try:
+            return self._factory(key)
+        except BaseException:
+            with self._lock:
+                if not self._closed:
+                    self._counts[key] -= 1
+                self._returned.notify_all()
+            raise
+
+    def _drop(self, key, resource, reason):
+        # a checked out resource that is not coming back
+        with self._lock:
+            self.stats[reason] += 1
+            if not self._closed:
+                self._counts[key] -= 1
+            self._returned.notify_all()
+        self._close(resource)
+
+    def _checkin(self, key, resource, discard=False):
+        to_close = []
+        with self._lock:
+            if self._closed:
+                to_close.append(resource)
+            elif discard:
+                self.stats['discarded'] += 1
+                self._counts[key] -= 1
+                to_close.append(resource)
+            else:
+                token = self._next_token
+                self._next_token += 1
+                self._entries[token] = (key, resource, self._clock())
+                idle = self._idle.setdefault(key, deque())
+                idle.append(token)
+                if len(idle) > self._max_idle:
+                    to_close.append(self._remove_idle(idle[0]))
+                    self.stats['evicted'] += 1
+                while self._max_idle_total is not None and len(self._entries) > self._max_idle_total:
+                    to_close.append(self._remove_idle(next(iter(self._entries))))
+                    self.stats['evicted'] += 1
+                to_close.extend(self._expired())
+            self._returned.notify_all()
+        for resource in to_close:
+            self._close(resource)
+
+    @property
+    def idle_count(self):
+        return len(self._entries)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            resources = [resource for _, resource, _ in self._entries.values()]
+            self._entries.clear()
+            self._idle.clear()
+            self._counts.clear()
+            self._returned.notify_all()
+        for resource in resources:
+            self._close(resource)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_pool():
+    created = []
+    closed = []
+
+    class Handle:
+        def __init__(self, key):
+            self.key = key
+            self.ok = True
+            created.append(self)
+
+        def close(self):
+            closed.append(self)
+
+    def validate(handle):
+        assert not pool._lock.locked(), 'validated outside of the pool lock'
+        return handle.ok
+
+    clock = FakeClock()
+    pool = ResourcePool(Handle, validate=validate, max_idle=2, max_idle_total=3,
+                        idle_timeout=10, clock=clock)
+
+    with pool.acquire('a') as first:
+        pass
+    with pool.acquire('a') as second:
+        assert second is first
+    assert (pool.stats['hits'], pool.stats['misses']) == (1, 1)
+
+    with pool.acquire('a') as a1, pool.acquire('a') as a2, pool.acquire('a') as a3:
+        pass
+    # released in reverse order: a3 is the least recently used
+    assert pool.idle_count == 2 and pool.stats['evicted'] == 1, 'at most 2 idle per key'
+    assert a1 is first and closed == [a3]
+
+    with pool.acquire('b'), pool.acquire('c'):
+        pass
+    assert pool.idle_count == 3 and closed == [a3, a2], 'at most 3 idle in total, LRU first'
+
+    with pool.acquire('a') as handle:
+        handle.ok = False
+    with pool.acquire('a') as replacement:
+        assert replacement is not handle and pool.stats['invalid'] == 1
+
+    try:
+        with pool.acquire('b') as broken:
+            raise ValueError
+    except ValueError:
+        pass
+    assert broken in closed and pool.stats['discarded'] == 1
+
+    clock.now += 11
+    with pool.acquire('c') as fresh:
+        assert fresh.key == 'c'
+    # the idle c and the replacement for a were idle for too long
+    assert pool.stats['expired'] == 2 and pool.stats['misses'] == 7
+
+    with pool.acquire('d') as last:
+        pool.close()
+    assert all(handle in closed for handle in created), 'closed on checkin after the pool is closed'
+
+    # threads: one resource for the key, so they take turns
+    pool = ResourcePool(Handle, max_per_key=1)
+    in_use = []
+
+    def worker():
+        for _ in range(50):
+            with pool.acquire('shared') as handle:
+                in_use.append(handle)
+                assert len(in_use) == 1
+                time.sleep(0.0001)
+                in_use.remove(handle)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pool.stats['misses'] == 1 and pool.stats['hits'] == 399
+    assert pool.stats['waits'] > 0 and pool.stats['wait_time'] > 0
+
+    with pool.acquire('shared'):
+        try:
+            with pool.acquire('shared', timeout=0.01):
+                pass
+            assert False, 'PoolTimeout expected'
+        except PoolTimeout:
+            pass
+
+    # closing the pool wakes up the waiting threads, they do not create new resources
+    errors = []
+
+    def waiter():
+        try:
+            with pool.acquire('shared'):
+                pass
+        except RuntimeError as ex:
+            errors.append(ex)
+
+    with pool.acquire('shared'):
+        created_before = len(created)
+        waits = pool.stats['waits']
+        waiting = threading.Thread(target=waiter)
+        waiting.start()
+        # the waiter holds the lock from counting its wait until it waits
+        while pool.stats['waits'] == waits:
+            time.sleep(0.001)
+        pool.close()
+        waiting.join()
+    assert len(errors) == 1 and len(created) == created_before
+
+
+test_pool()
+
+print('#' * 52 + '  #### Reusing file handles')
+
+import os
+import shutil
+import sqlite3
+import tempfile
+from time import perf_counter
+
+output_dir = tempfile.mkdtemp()
+f_names = []
+for i in range(12):
+    f_name = os.path.join(output_dir, f'lookup_{i}.csv')
+    with open(f_name, 'w') as f:
+        f.writelines(f'{i},{n}\n' for n in range(100))
+    f_names.append(f_name)
+
+
+def first_line_open(f_name):
+    with open(f_name) as f:
+        return f.readline()
+
+
+def first_line_pooled(pool, f_name):
+    with pool.acquire(f_name) as f:
+        f.seek(0)
+        return f.readline()
+
+
+n = 20_000
+file_pool = ResourcePool(open, validate=lambda f: not f.closed)
+
+start = perf_counter()
+for i in range(n):
+    first_line_open(f_names[i % 12])
+elapsed_open = perf_counter() - start
+
+start = perf_counter()
+for i in range(n):
+    first_line_pooled(file_pool, f_names[i % 12])
+elapsed_pool = perf_counter() - start
+file_pool.close()
+
+print(f'{"method":<26} {"uses/sec":>10}')
+print(f'{"open on every use":<26} {n / elapsed_open:>10,.0f}')
+print(f'{"pooled":<26} {n / elapsed_pool:>10,.0f}')
+print(file_pool.stats)
+
+print('#' * 52 + '  #### Reusing SQLite connections')
+
+db_names = []
+for i in range(3):
+    db_name = os.path.join(output_dir, f'db_{i}.sqlite')
+    with sqlite3.connect(db_name) as conn:
+        conn.execute('create table tickets (make text, fine integer)')
+        conn.executemany('insert into tickets values (?, ?)', [('FORD', 65), ('BMW', 115), ('TOYOT', 45)])
+    conn.close()
+    db_names.append(db_name)
+
+
+def query_connect(db_name):
+    conn = sqlite3.connect(db_name)
+    try:
+        return conn.execute('select sum(fine) from tickets').fetchone()
+    finally:
+        conn.close()
+
+
+def query_pooled(pool, db_name):
+    with pool.acquire(db_name) as conn:
+        return conn.execute('select sum(fine) from tickets').fetchone()
+
+
+# connections are created in one thread and used in another when the pool is shared
+db_pool = ResourcePool(lambda db_name: sqlite3.connect(db_name, check_same_thread=False), max_idle=2)
+
+n = 5_000
+start = perf_counter()
+for i in range(n):
+    assert query_connect(db_names[i % 3]) == (225,)
+elapsed_connect = perf_counter() - start
+
+start = perf_counter()
+for i in range(n):
+    assert query_pooled(db_pool, db_names[i % 3]) == (225,)
+elapsed_pool = perf_counter() - start
+
+print(f'{"method":<26} {"queries/sec":>11}')
+print(f'{"connect on every query":<26} {n / elapsed_connect:>11,.0f}')
+print(f'{"pooled":<26} {n / elapsed_pool:>11,.0f}')
+
+print('#' * 52 + '  4 threads sharing 2 connections per database:')
+
+db_pool.close()
+db_pool = ResourcePool(lambda db_name: sqlite3.connect(db_name, check_same_thread=False), max_per_key=2)
+
+
+def worker():
+    for i in range(1_000):
+        query_pooled(db_pool, db_names[i % 3])
+
+
+threads = [threading.Thread(target=worker) for _ in range(4)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+db_pool.close()
+print(db_pool.stats)
+
+shutil.rmtree(output_dir)
@@ -0,0 +1,272 @@
+print('#' * 52 + '  ### Application - Lazy File Iterators')
+
+print('#' * 52 + '  In "Caveat when used with Lazy Iterators", returning `csv.reader(f)` from inside the'
+                 '  `with` block fails: the file is closed before the first row is read.')
+print('#' * 52 + '  `list(...)` fixes that by reading everything into memory, and `yield from` only closes the file'
+                 '  when the generator is exhausted or garbage collected.')
+print('#' * 52 + '  `FileIterator` ties the file to the iterator: the file is open exactly as long as the'
+                 '  iterator is alive, and is closed:')
+print('#' * 52 + '  - when the last row has been read,')
+print('#' * 52 + '  - when `close()` is called (or at the end of a `with` block),')
+print('#' * 52 + '  - when the iterator is garbage collected (with `weakref.finalize`, which also runs'
+                 '  at interpreter exit).')
+print('#' * 52 + '  Optionally, a background thread reads up to `prefetch` rows ahead of the consumer.')
+
+import csv
+import queue
+import threading
+import weakref
+
+_done = object()
+
+
+class _Prefetcher:
+    # owns the file and the thread, and never references the FileIterator, so that one can be collected
+    def __init__(self, f, rows, prefetch, batch_size):
+        self._f = f
+        self._rows = rows
+        self._batch_size = batch_size
+        self._batches = queue.Queue(max(1, prefetch // batch_size))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            batch = []
+            for row in self._rows:
+                if self._stop.is_set():
+                    return
+                batch.append(row)
+                if len(batch) == self._batch_size:
+                    self._put(batch)
+                    batch = []
+            if batch:
+                self._put(batch)
+            self._put(_done)
+        except BaseException as ex:
+            self._put(ex)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._batches.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def get(self):
+        return self._batches.get()
+
+    def close(self):
+        self._stop.set()
+        # unblock the reader if it is waiting on a full queue
+        while True:
+            try:
+                self._batches.get_nowait()
+            except queue.Empty:
+                break
+        self._thread.join()
+        self._f.close()
+
+
+class FileIterator:
+    def __init__(self, f_name, make_iterator=iter, *, prefetch=0, batch_size=256, mode='r', **open_kwargs):
+        f = open(f_name, mode, **open_kwargs)
+        try:
+            rows = make_iterator(f)
+        except BaseException:
+            f.close()
+            raise
+        self._f = f
+        self._batch = iter(())
+        if prefetch:
+            self._rows = None
+            self._prefetcher = _Prefetcher(f, rows, prefetch, min(batch_size, prefetch))
+            self._finalizer = weakref.finalize(self, self._prefetcher.close)
+        else:
+            self._rows = rows
+            self._prefetcher = None
+            self._finalizer = weakref.finalize(self, f.close)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._prefetcher is None:
+            if self._rows is None:
+                raise StopIteration
+            try:
+                return next(self._rows)
+            except BaseException:
+                self.close()
+                raise
+
+        for row in self._batch:
+            return row
+        if not self._finalizer.alive:
+            raise StopIteration
+        item = self._prefetcher.get()
+        if item is _done:
+            self.close()
+            raise StopIteration
+        if isinstance(item, BaseException):
+            self.close()
+            raise item
+        self._batch = iter(item)
+        return next(self._batch)
+
+    def close(self):
+        self._rows = None
+        self._batch = iter(())
+        self._finalizer()
+
+    @property
+    def closed(self):
+        return self._f.closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+        return False
+
+
+def read_data(f_name='nyc_parking_tickets_extract.csv', prefetch=0):
+    return FileIterator(f_name, lambda f: csv.reader(f, delimiter=',', quotechar='"'),
+                        prefetch=prefetch, newline='')
+
+
+import gc
+
+
+def test_file_iterator():
+    f_name = 'nyc_parking_tickets_extract.csv'
+    with open(f_name, newline='') as f:
+        expected = list(csv.reader(f))
+
+    for prefetch in (0, 1, 10, 5_000):
+        rows = read_data(f_name, prefetch)
+        assert list(rows) == expected, prefetch
+        assert rows.closed, 'closed on exhaustion'
+        assert next(rows, None) is None
+
+        rows = read_data(f_name, prefetch)
+        assert next(rows) == expected[0]
+        rows.close()
+        assert rows.closed and next(rows, None) is None
+
+        rows = read_data(f_name, prefetch)
+        next(rows)
+        f = rows._f
+        del rows
+        gc.collect()
+        assert f.closed, 'closed when garbage collected'
+
+        with read_data(f_name, prefetch) as rows:
+            for row in rows:
+                break
+        assert rows.closed
+
+    def failing(f):
+        for n, line in enumerate(f):
+            if n == 3:
+                raise ValueError('bad row')
+            yield line
+
+    for prefetch in (0, 2):
+        rows = FileIterator(f_name, failing, prefetch=prefetch)
+        try:
+            list(rows)
+            assert False, 'ValueError expected'
+        except ValueError:
+            pass
+        assert rows.closed
+
+    try:
+        FileIterator(f_name, lambda f: 1 / 0)
+        assert False, 'ZeroDivisionError expected'
+    except ZeroDivisionError:
+        pass
+
+
+test_file_iterator()
+
+print('#' * 52 + '  The `read_data` from "Caveat when used with Lazy Iterators", streaming:')
+
+for row in read_data():
+    print(row)
+    if row[0] == '4006462396':
+        break
+
+print('#' * 52 + '  #### Memory: 200,000 rows')
+
+import os
+import tempfile
+import tracemalloc
+
+output_dir = tempfile.mkdtemp()
+large_file = os.path.join(output_dir, 'nyc_large.csv')
+with open('nyc_parking_tickets_extract.csv') as f:
+    header = next(f)
+    lines = f.readlines()
+with open(large_file, 'w') as f:
+    f.write(header)
+    for _ in range(200):
+        f.writelines(lines)
+
+
+def read_data_list(f_name):
+    with open(f_name, newline='') as f:
+        return list(csv.reader(f, delimiter=',', quotechar='"'))
+
+
+def peak_memory(rows_fn):
+    tracemalloc.start()
+    count = sum(1 for _ in rows_fn())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, peak
+
+
+print(f'{"method":<28} {"rows":>8} {"peak MB":>8}')
+for name, rows_fn in (('list(csv.reader(f))', lambda: read_data_list(large_file)),
+                      ('FileIterator', lambda: read_data(large_file)),
+                      ('FileIterator, prefetch=5000', lambda: read_data(large_file, prefetch=5_000))):
+    count, peak = peak_memory(rows_fn)
+    print(f'{name:<28} {count:>8,} {peak / 2 ** 20:>8.1f}')
+
+print('#' * 52 + '  #### Read-ahead')
+print('#' * 52 + '  Storage that takes 1 ms per 100 rows, and a consumer that waits 1 ms (on a service,'
+                 '  a database, ...) per 100 rows:')
+
+from time import perf_counter, sleep
+
+
+def slow_storage(f):
+    for n, row in enumerate(csv.reader(f)):
+        if n % 100 == 0:
+            sleep(0.001)
+        yield row
+
+
+def consume(rows):
+    start = perf_counter()
+    for n, row in enumerate(rows):
+        if n % 100 == 0:
+            sleep(0.001)
+    return perf_counter() - start
+
+
+print(f'{"method":<28} {"seconds":>8}')
+for prefetch in (0, 1_000):
+    elapsed = consume(FileIterator(large_file, slow_storage, prefetch=prefetch, newline=''))
+    print(f'{f"prefetch={prefetch}":<28} {elapsed:>8.2f}')
+
+print('#' * 52 + '  With read-ahead, reading and consuming overlap (sleeping, like waiting on I/O,'
+                 '  releases the GIL), as long as both mostly wait rather than compute.')
+
+import shutil
+
+shutil.rmtree(output_dir)
@@ -0,0 +1,248 @@
+print('#' * 52 + '  ### Application - Decimal Aggregation')
+
+print('#' * 52 + '  Our `precision` context manager changes the global `decimal.getcontext()` on the way in,'
+                 '  and back on the way out.')
+print('#' * 52 + '  Summing money amounts over millions of rows with a `with` block per row spends most of its'
+                 '  time entering and exiting contexts.')
+print('#' * 52 + '  Instead we enter one `decimal.localcontext()` around a whole batch:')
+print('#' * 52 + '  - `DecimalScope` does that (and, unlike `precision`, does not touch the global context,'
+                 '  so it is safe in threads and asyncio tasks),')
+print('#' * 52 + '  - the helpers aggregate a whole batch with `sum`, `accumulate` and `map`, so the additions'
+                 '  themselves run in C,')
+print('#' * 52 + '  - `exact_sum` adds under the maximum precision: the result is exact, whatever the precision'
+                 '  of the enclosing context.')
+
+import decimal
+from decimal import Decimal
+from contextvars import ContextVar
+from itertools import accumulate
+
+_ZERO = Decimal(0)
+
+# the localcontext of every active with block, kept per thread and per asyncio task
+# (like the decimal context itself), so one scope can be nested or shared
+_entered = ContextVar('decimal_scope_entered', default=())
+
+
+class DecimalScope:
+    def __init__(self, prec=28, rounding=decimal.ROUND_HALF_EVEN, **settings):
+        self._settings = dict(prec=prec, rounding=rounding, **settings)
+
+    def __enter__(self):
+        local = decimal.localcontext(**self._settings)
+        ctx = local.__enter__()
+        _entered.set(_entered.get() + (local,))
+        return ctx
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        *outer, local = _entered.get()
+        _entered.set(tuple(outer))
+        return local.__exit__(exc_type, exc_value, exc_tb)
+
+
+def _decimals(values):
+    # Decimal(Decimal) returns the same value, so mixed inputs are fine
+    return map(Decimal, values)
+
+
+def decimal_sum(values):
+    return sum(_decimals(values), _ZERO)
+
+
+def decimal_mean(values):
+    values = list(_decimals(values))
+    if not values:
+        raise ValueError('mean of an empty batch')
+    return sum(values, _ZERO) / len(values)
+
+
+def running_totals(values, start=_ZERO):
+    return list(accumulate(_decimals(values), initial=start))[1:]
+
+
+def exact_sum(values):
+    # with enough precision that no addition is ever rounded, whatever the current context
+    with DecimalScope(prec=decimal.MAX_PREC):
+        return sum(_decimals(values), _ZERO)
+
+
+def test_aggregation():
+    amounts = ['10.25', '0.10', '99.99', '-5.00']
+    with DecimalScope(prec=28):
+        assert decimal_sum(amounts) == Decimal('105.34')
+        assert decimal_mean(amounts) == Decimal('26.335')
+        assert running_totals(amounts) == [Decimal('10.25'), Decimal('10.35'), Decimal('110.34'), Decimal('105.34')]
+        assert running_totals([Decimal(1), '2'], start=Decimal(10)) == [Decimal(11), Decimal(13)]
+    assert exact_sum(amounts) == Decimal('105.34') and str(exact_sum(amounts)) == '105.34'
+    assert exact_sum(['1.5', '2.25', '3']) == Decimal('6.75'), 'mixed scales'
+    assert exact_sum(['1', '2']) == Decimal(3) and exact_sum([]) == 0
+    assert str(exact_sum([Decimal('1.00'), '2.50', Decimal('-0.25')])) == '3.25'
+    assert exact_sum([Decimal('1E+3'), Decimal('0.5'), 1.5]) == Decimal('1002.0'), 'mixed scales and types'
+
+    scope = DecimalScope(prec=5)
+    with scope:
+        with scope:
+            assert decimal.getcontext().prec == 5
+        assert decimal.getcontext().prec == 5
+    assert decimal.getcontext().prec == 28, 'nested use of the same scope'
+
+    # one scope shared by two threads: each exit restores the context of its own thread
+    import threading
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def use_shared_scope(prec):
+        try:
+            decimal.getcontext().prec = prec
+            with scope:
+                barrier.wait()
+                assert decimal.getcontext().prec == 5
+                barrier.wait()
+            assert decimal.getcontext().prec == prec
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=use_shared_scope, args=(prec,)) for prec in (10, 20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+
+    big = ['12345678901234567890.01'] * 3
+    with DecimalScope(prec=10):
+        assert decimal_sum(big) != Decimal('37037036703703703670.03'), 'rounded to 10 digits'
+        assert exact_sum(big) == Decimal('37037036703703703670.03'), 'exact whatever the precision'
+        assert decimal.getcontext().prec == 10
+    assert decimal.getcontext().prec == 28, 'the global context is never changed'
+
+    with DecimalScope(prec=3, rounding=decimal.ROUND_DOWN):
+        assert Decimal(2) / Decimal(3) == Decimal('0.666')
+
+    try:
+        decimal_mean([])
+        assert False, 'ValueError expected'
+    except ValueError:
+        pass
+
+
+test_aggregation()
+
+print('#' * 52 + '  #### Example')
+
+fines = ['65.00', '115.00', '45.50', '60.00', '95.00']
+with DecimalScope(prec=6):
+    print(f'total {decimal_sum(fines)}, mean {decimal_mean(fines)}')
+    print('running totals', [str(total) for total in running_totals(fines)])
+    print(f'exact_sum {exact_sum(fines)}')
+
+print('#' * 52 + '  #### Timings: 1,000,000 amounts, read from a csv file as strings')
+
+import random
+from time import perf_counter
+
+rnd = random.Random(0)
+amounts = [f'{rnd.randrange(100, 100_000) / 100:.2f}' for _ in range(1_000_000)]
+
+
+class precision:
+    # from "Additional Uses"
+    def __init__(self, prec):
+        self.prec = prec
+        self.current_prec = decimal.getcontext().prec
+
+    def __enter__(self):
+        decimal.getcontext().prec = self.prec
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        decimal.getcontext().prec = self.current_prec
+        return False
+
+
+def per_row_precision():
+    total = _ZERO
+    for amount in amounts:
+        with precision(12):
+            total += Decimal(amount)
+    return total
+
+
+def per_row_localcontext():
+    total = _ZERO
+    for amount in amounts:
+        with decimal.localcontext() as ctx:
+            ctx.prec = 12
+            total += Decimal(amount)
+    return total
+
+
+def hoisted_loop():
+    with DecimalScope(prec=12):
+        total = _ZERO
+        for amount in amounts:
+            total += Decimal(amount)
+        return total
+
+
+def hoisted_sum():
+    with DecimalScope(prec=12):
+        return decimal_sum(amounts)
+
+
+def max_precision():
+    return exact_sum(amounts)
+
+
+def timed(fn):
+    best = None
+    for _ in range(3):
+        start = perf_counter()
+        result = fn()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+expected = None
+print(f'{"sum":<36} {"seconds":>8} {"amounts/sec":>12}')
+for name, fn in (('per row: precision (global context)', per_row_precision),
+                 ('per row: decimal.localcontext()', per_row_localcontext),
+                 ('DecimalScope, loop', hoisted_loop),
+                 ('DecimalScope, decimal_sum', hoisted_sum),
+                 ('exact_sum (maximum precision)', max_precision)):
+    elapsed, total = timed(fn)
+    expected = total if expected is None else expected
+    assert total == expected
+    print(f'{name:<36} {elapsed:>8.3f} {len(amounts) / elapsed:>12,.0f}')
+
+decimals = list(map(Decimal, amounts))
+
+
+def per_row_running():
+    totals = []
+    total = _ZERO
+    for amount in decimals:
+        with decimal.localcontext() as ctx:
+            ctx.prec = 12
+            total += amount
+            totals.append(total)
+    return totals
+
+
+def hoisted_running():
+    with DecimalScope(prec=12):
+        return running_totals(decimals)
+
+
+print(f'{"running totals (Decimal inputs)":<36} {"seconds":>8} {"amounts/sec":>12}')
+for name, fn in (('per row: decimal.localcontext()', per_row_running),
+                 ('DecimalScope, running_totals', hoisted_running)):
+    elapsed, totals = timed(fn)
+    assert totals[-1] == expected
+    print(f'{name:<36} {elapsed:>8.3f} {len(amounts) / elapsed:>12,.0f}')
+
+print('#' * 52 + '  The C implementation of `decimal` makes the additions themselves cheap:'
+                 '  entering a context per row is what costs the most.')
+print('#' * 52 + '  `exact_sum` costs about the same as `decimal_sum`, there is just no rounding to do.'
+                 '  Adding the amounts as integers ourselves (removing the decimal point and using `int`)'
+                 '  is no faster: parsing the strings costs the same either way.')
@@ -0,0 +1,408 @@
+print('#' * 52 + '  ### Pipelines - Batching Data')
+
+print('#' * 52 + '  In our push pipelines every row costs one `send()` per stage.'
+                 '  For cheap stages, resuming the generator costs more than the work itself.')
+print('#' * 52 + '  Instead, we can push a **list** of rows through the pipeline with a single `send()` per stage.')
+
+import types
+from contextlib import ExitStack
+
+
+class Collector:
+    def __init__(self):
+        self.rows = []
+
+    def send(self, row):
+        self.rows.append(row)
+
+    def close(self):
+        pass
+
+
+def _collect_targets(args, kwargs):
+    # swap every downstream coroutine for a collector, remembering which is which
+    pairs = []
+
+    def swap(value):
+        if isinstance(value, types.GeneratorType):
+            collector = Collector()
+            pairs.append((collector, value))
+            return collector
+        if isinstance(value, (tuple, list)):
+            return type(value)(swap(item) for item in value)
+        return value
+
+    args = tuple(swap(arg) for arg in args)
+    kwargs = {key: swap(value) for key, value in kwargs.items()}
+    return args, kwargs, pairs
+
+
+def batch_adapter(row_stage, pairs):
+    send = row_stage.send
+    try:
+        while True:
+            batch = yield
+            for row in batch:
+                send(row)
+            for collector, target in pairs:
+                if collector.rows:
+                    rows, collector.rows = collector.rows, []
+                    target.send(rows)
+    finally:
+        # the downstream stages were handed to the per row stage as collectors,
+        # so closing them is up to us, each one even if another fails to close
+        with ExitStack() as stack:
+            for collector, target in reversed(pairs):
+                stack.callback(target.close)
+            row_stage.close()
+
+
+def coroutine(fn=None, *, batch=False):
+    if fn is None:
+        return lambda fn: coroutine(fn, batch=batch)
+
+    def inner(*args, **kwargs):
+        if batch:
+            g = fn(*args, **kwargs)
+        else:
+            # a per row stage: rows of a batch are fed to it one by one,
+            # and whatever it sends downstream is forwarded as one batch
+            args, kwargs, pairs = _collect_targets(args, kwargs)
+            row_stage = fn(*args, **kwargs)
+            next(row_stage)
+            g = batch_adapter(row_stage, pairs)
+        next(g)
+        return g
+    return inner
+
+
+print('#' * 52 + '  A per row stage, written exactly as before, is adapted automatically:')
+
+import math
+
+
+@coroutine
+def handle_data():
+    while True:
+        received = yield
+        print(received)
+
+
+@coroutine
+def power_up(n, next_gen):
+    while True:
+        received = yield
+        output = math.pow(received, n)
+        next_gen.send(output)
+
+
+@coroutine
+def filter_even(next_gen):
+    while True:
+        received = yield
+        if received % 2 == 0:
+            next_gen.send(received)
+
+
+print_data = handle_data()
+filtered = filter_even(print_data)
+gen2 = power_up(3, filtered)
+gen1 = power_up(2, gen2)
+
+# pipeline: gen1 --> gen2 --> filtered --> print_data, one send per stage per batch
+gen1.send([1, 2, 3, 4, 5])
+
+print('#' * 52 + '  Closing the head of the pipeline closes the stages behind the adapted ones too:')
+
+
+@coroutine(batch=True)
+def report_close():
+    try:
+        while True:
+            yield
+    finally:
+        print('downstream closed')
+
+
+gen1 = power_up(2, report_close())
+gen1.close()
+
+print('#' * 52 + '  Only coroutines passed in as arguments are adapted. A per row stage that creates its own'
+                 '  downstream stages internally would send them single rows, so such a stage has to be'
+                 '  written batch aware (as `pipeline_coro` below is).')
+
+print('#' * 52 + '  And a batch aware stage processes the whole list in one go:')
+
+
+@coroutine(batch=True)
+def power_up(n, next_gen):
+    while True:
+        batch = yield
+        next_gen.send([math.pow(received, n) for received in batch])
+
+
+@coroutine(batch=True)
+def filter_even(next_gen):
+    while True:
+        batch = yield
+        selected = [received for received in batch if received % 2 == 0]
+        if selected:
+            next_gen.send(selected)
+
+
+@coroutine(batch=True)
+def handle_data():
+    while True:
+        batch = yield
+        for received in batch:
+            print(received)
+
+
+print_data = handle_data()
+filtered = filter_even(print_data)
+gen2 = power_up(3, filtered)
+gen1 = power_up(2, gen2)
+gen1.send([1, 2, 3, 4, 5])
+
+print('#' * 52 + '  Both kinds of stages can be mixed in the same pipeline:')
+
+
+@coroutine
+def power_up_row(n, next_gen):
+    while True:
+        received = yield
+        next_gen.send(math.pow(received, n))
+
+
+print_data = handle_data()
+filtered = filter_even(print_data)
+gen2 = power_up_row(3, filtered)
+gen1 = power_up(2, gen2)
+gen1.send([1, 2, 3, 4, 5])
+
+print('#' * 52 + '  The driver loop now chunks the data source into batches:')
+
+from itertools import islice
+
+
+def push(rows, target, batch_size=1_000):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        target.send(batch)
+
+
+gen1 = power_up(2, filter_even(handle_data()))
+push(range(1, 11), gen1, batch_size=4)
+
+print('#' * 52 + '  #### Broadcasting pipeline')
+print('#' * 52 + '  Lets redo the broadcasting pipeline with batch aware stages:')
+
+import csv
+import os
+import tempfile
+
+
+def data_reader(f_name):
+    f = open(f_name)
+    try:
+        dialect = csv.Sniffer().sniff(f.read(2000))
+        f.seek(0)
+        reader = csv.reader(f, dialect=dialect)
+        yield from reader
+    finally:
+        f.close()
+
+
+input_file = 'car_data.csv'
+output_dir = tempfile.mkdtemp()
+
+idx_make = 0
+idx_model = 1
+idx_year = 2
+idx_vin = 3
+idx_color = 4
+
+headers = ('make', 'model', 'year', 'vin', 'color')
+
+converters = (str, str, int, str, str)
+
+
+def data_parser(f_name=input_file):
+    data = data_reader(f_name)
+    next(data)  # skip header row
+    for row in data:
+        parsed_row = [converter(item)
+                      for converter, item in zip(converters, row)]
+        yield parsed_row
+
+
+@coroutine(batch=True)
+def save_data(f_name, headers):
+    with open(f_name, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        while True:
+            data_rows = yield
+            writer.writerows(data_rows)
+
+
+@coroutine(batch=True)
+def filter_data(filter_predicate, target):
+    while True:
+        data_rows = yield
+        selected = [data_row for data_row in data_rows if filter_predicate(data_row)]
+        if selected:
+            target.send(selected)
+
+
+@coroutine(batch=True)
+def broadcast(targets):
+    while True:
+        data_rows = yield
+        for target in targets:
+            target.send(data_rows)
+
+
+def pred_pink(data_row):
+    return data_row[idx_color].lower() == 'pink'
+
+
+def pred_ford_green(data_row):
+    return (data_row[idx_make].lower() == 'ford'
+            and data_row[idx_color].lower() == 'green')
+
+
+def pred_older(data_row):
+    return data_row[idx_year] <= 2010
+
+
+@coroutine(batch=True)
+def pipeline_coro():
+    out_pink_cars = save_data(os.path.join(output_dir, 'pink_cars.csv'), headers)
+    out_ford_green = save_data(os.path.join(output_dir, 'ford_green.csv'), headers)
+    out_older = save_data(os.path.join(output_dir, 'older.csv'), headers)
+    outputs = (out_pink_cars, out_ford_green, out_older)
+
+    filter_pink_cars = filter_data(pred_pink, out_pink_cars)
+    filter_ford_green = filter_data(pred_ford_green, out_ford_green)
+    filter_older = filter_data(pred_older, out_older)
+
+    filters = (filter_pink_cars, filter_ford_green, filter_older)
+
+    broadcaster = broadcast(filters)
+
+    try:
+        while True:
+            data_rows = yield
+            broadcaster.send(data_rows)
+    finally:
+        for output in outputs:
+            output.close()
+
+
+from contextlib import contextmanager
+
+
+@contextmanager
+def pipeline():
+    p = pipeline_coro()
+    try:
+        yield p
+    finally:
+        p.close()
+
+
+with pipeline() as pipe:
+    push(data_parser(), pipe, batch_size=100)
+
+
+def print_file_data():
+    for file_name in ('pink_cars.csv', 'ford_green.csv', 'older.csv'):
+        print(f'***** {file_name} *****')
+        for row in islice(data_reader(os.path.join(output_dir, file_name)), 5):
+            print(row)
+        print('\n')
+
+
+print_file_data()
+
+print('#' * 52 + '  #### Rows per second vs batch size')
+print('#' * 52 + '  We compare against the original one `send()` per row pipeline from the previous lecture:')
+
+
+def coroutine_per_row(fn):
+    def inner(*args, **kwargs):
+        g = fn(*args, **kwargs)
+        next(g)
+        return g
+    return inner
+
+
+@coroutine_per_row
+def save_data_per_row(f_name, headers):
+    with open(f_name, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        while True:
+            data_row = yield
+            writer.writerow(data_row)
+
+
+@coroutine_per_row
+def filter_data_per_row(filter_predicate, target):
+    while True:
+        data_row = yield
+        if filter_predicate(data_row):
+            target.send(data_row)
+
+
+@coroutine_per_row
+def broadcast_per_row(targets):
+    while True:
+        data_row = yield
+        for target in targets:
+            target.send(data_row)
+
+
+def per_row_pipeline():
+    predicates = (pred_pink, pred_ford_green, pred_older)
+    outputs = [save_data_per_row(os.path.join(output_dir, f'row_{i}.csv'), headers)
+               for i in range(len(predicates))]
+    filters = [filter_data_per_row(predicate, output)
+               for predicate, output in zip(predicates, outputs)]
+    return broadcast_per_row(filters), outputs
+
+
+from time import perf_counter
+
+rows = list(data_parser()) * 200  # 200,000 rows held in memory
+
+
+def run_per_row():
+    broadcaster, outputs = per_row_pipeline()
+    start = perf_counter()
+    for row in rows:
+        broadcaster.send(row)
+    for output in outputs:
+        output.close()
+    return perf_counter() - start
+
+
+def run_batched(batch_size):
+    start = perf_counter()
+    with pipeline() as pipe:
+        push(rows, pipe, batch_size=batch_size)
+    return perf_counter() - start
+
+
+print(f'{"batch size":>10} {"rows/sec":>12}')
+print(f'{"per row":>10} {len(rows) / run_per_row():>12,.0f}')
+for batch_size in (1, 10, 100, 1_000, 10_000):
+    print(f'{batch_size:>10} {len(rows) / run_batched(batch_size):>12,.0f}')
+
+import shutil
+
+shutil.rmtree(output_dir)
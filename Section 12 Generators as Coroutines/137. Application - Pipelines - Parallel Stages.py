@@ -0,0 +1,316 @@
+import csv
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+
+def data_reader(f_name):
+    f = open(f_name)
+    try:
+        dialect = csv.Sniffer().sniff(f.read(2000))
+        f.seek(0)
+        reader = csv.reader(f, dialect=dialect)
+        yield from reader
+    finally:
+        f.close()
+
+
+idx_make = 0
+idx_model = 1
+idx_year = 2
+idx_vin = 3
+idx_color = 4
+
+headers = ('make', 'model', 'year', 'vin', 'color')
+
+converters = (str, str, int, str, str)
+
+
+def data_parser(f_name):
+    data = data_reader(f_name)
+    next(data)  # skip header row
+    for row in data:
+        parsed_row = [converter(item)
+                      for converter, item in zip(converters, row)]
+        yield parsed_row
+
+
+def coroutine(fn):
+    def inner(*args, **kwargs):
+        g = fn(*args, **kwargs)
+        next(g)
+        return g
+    return inner
+
+
+@coroutine
+def save_data(f_name, headers):
+    with open(f_name, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        while True:
+            data_row = yield
+            writer.writerow(data_row)
+
+
+@coroutine
+def filter_data(filter_predicate, target):
+    while True:
+        data_row = yield
+        if filter_predicate(data_row):
+            target.send(data_row)
+
+
+@coroutine
+def broadcast(targets):
+    while True:
+        data_row = yield
+        for target in targets:
+            target.send(data_row)
+
+
+# predicates are module level functions (not lambdas) so they can be sent to worker processes
+
+def pred_pink(data_row):
+    return data_row[idx_color].lower() == 'pink'
+
+
+def pred_ford_green(data_row):
+    return (data_row[idx_make].lower() == 'ford'
+            and data_row[idx_color].lower() == 'green')
+
+
+def pred_older(data_row):
+    return data_row[idx_year] <= 2010
+
+
+def filtered_output(filter_predicate, f_name):
+    # builds the filter --> save_data part of the graph inside the worker
+    return filter_data(filter_predicate, save_data(f_name, headers))
+
+
+def run_stage(inbox, factory, args):
+    stage = None
+    error = None
+    try:
+        stage = factory(*args)
+    except Exception as ex:
+        error = ex
+    while True:
+        batch = inbox.get()
+        if batch is None:
+            break
+        if error is not None:
+            continue  # keep draining so the sender never blocks on a full queue
+        try:
+            for row in batch:
+                stage.send(row)
+        except Exception as ex:
+            error = ex
+    if stage is not None:
+        try:
+            stage.close()
+        except Exception as ex:
+            error = error or ex
+    if error is not None:
+        raise error
+
+
+class ParallelStage:
+    def __init__(self, factory, *args, kind='process', maxsize=16, batch_size=1_000):
+        if kind not in ('process', 'thread'):
+            raise ValueError(f"kind must be 'process' or 'thread', not {kind!r}")
+        self._kind = kind
+        self._batch_size = batch_size
+        self._batch = []
+        self._error = None
+        self._closed = False
+        if kind == 'process':
+            context = multiprocessing.get_context()
+            self._inbox = context.Queue(maxsize)
+            self._worker = context.Process(target=run_stage,
+                                           args=(self._inbox, factory, args),
+                                           daemon=True)
+        else:
+            self._inbox = queue.Queue(maxsize)
+            self._worker = threading.Thread(target=self._run_thread,
+                                            args=(factory, args),
+                                            daemon=True)
+        self._worker.start()
+
+    def _run_thread(self, factory, args):
+        try:
+            run_stage(self._inbox, factory, args)
+        except Exception as ex:
+            self._error = ex
+
+    def _check_worker(self):
+        if self._error is not None:
+            raise RuntimeError('pipeline stage failed') from self._error
+        if self._kind == 'process' and self._worker.exitcode not in (0, None):
+            raise RuntimeError(f'pipeline stage process exited with code {self._worker.exitcode}')
+
+    def _put(self, item):
+        # blocks while the queue is full: backpressure on the sender,
+        # unless the worker is gone and nothing will ever read the queue again
+        while True:
+            try:
+                self._inbox.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if not self._worker.is_alive():
+                    self._worker.join()
+                    self._check_worker()
+                    raise RuntimeError('pipeline stage worker stopped')
+
+    def _flush(self):
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self._put(batch)
+
+    def send(self, data_row):
+        if self._closed:
+            raise StopIteration
+        self._batch.append(data_row)
+        if len(self._batch) >= self._batch_size:
+            self._flush()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._flush()
+            self._put(None)
+        finally:
+            self._worker.join()
+        self._check_worker()
+
+
+output_dir = None  # set by the demo below, workers only ever see full paths
+
+outputs = (('pink_cars.csv', pred_pink),
+           ('ford_green.csv', pred_ford_green),
+           ('older.csv', pred_older))
+
+
+@coroutine
+def pipeline_coro(kind=None):
+    if kind is None:
+        filters = [filtered_output(predicate, os.path.join(output_dir, f_name))
+                   for f_name, predicate in outputs]
+    else:
+        filters = [ParallelStage(filtered_output, predicate,
+                                 os.path.join(output_dir, f_name), kind=kind)
+                   for f_name, predicate in outputs]
+
+    broadcaster = broadcast(filters)
+
+    try:
+        while True:
+            data_row = yield
+            broadcaster.send(data_row)
+    finally:
+        # close (and join) every stage, even if one of them fails
+        errors = []
+        for stage in filters:
+            try:
+                stage.close()
+            except Exception as ex:
+                errors.append(ex)
+        if errors:
+            raise errors[0]
+
+
+@contextmanager
+def pipeline(kind=None):
+    p = pipeline_coro(kind)
+    try:
+        yield p
+    finally:
+        p.close()
+
+
+def print_file_data():
+    for file_name, _ in outputs:
+        with open(os.path.join(output_dir, file_name)) as f:
+            print(f'***** {file_name}: {sum(1 for _ in f) - 1} rows *****')
+
+
+def make_large_input(f_name, copies):
+    with open('car_data.csv') as f:
+        header = next(f)
+        rows = f.readlines()
+    with open(f_name, 'w') as f:
+        f.write(header)
+        for _ in range(copies):
+            f.writelines(rows)
+
+
+def run(input_file, kind):
+    start = perf_counter()
+    with pipeline(kind) as pipe:
+        for row in data_parser(input_file):
+            pipe.send(row)
+    return perf_counter() - start
+
+
+if __name__ == '__main__':
+    # worker processes may re-import this module, so the demo only runs in the parent
+    output_dir = tempfile.mkdtemp()
+
+    print('#' * 52 + '  ### Pipelines - Parallel Stages')
+    print('#' * 52 + '  Each filter --> save_data branch can run in its own worker process (or thread).')
+    print('#' * 52 + '  The broadcaster still just calls `send()`, rows are shipped to the workers'
+                     '  in batches over bounded queues.')
+
+    with pipeline('process') as pipe:
+        for row in data_parser('car_data.csv'):
+            pipe.send(row)
+
+    print_file_data()
+
+    print('#' * 52 + '  Same results as the single threaded pipeline:')
+
+    with pipeline() as pipe:
+        for row in data_parser('car_data.csv'):
+            pipe.send(row)
+
+    print_file_data()
+
+    print('#' * 52 + '  Errors inside a worker are reported when the pipeline is closed:')
+
+    try:
+        with pipeline('thread') as pipe:
+            pipe.send(['Ford', 'Focus', 'not a year', 'VIN', 'Green'])
+    except RuntimeError as ex:
+        print(repr(ex), 'caused by', repr(ex.__cause__))
+
+    print('#' * 52 + '  A stage that cannot even start (here: its output directory does not exist) still drains'
+                     '  its queue, so the sender never blocks:')
+
+    stage = ParallelStage(filtered_output, pred_pink, os.path.join(output_dir, 'missing', 'out.csv'),
+                          kind='thread', maxsize=2, batch_size=1)
+    try:
+        for row in data_parser('car_data.csv'):
+            stage.send(row)
+        stage.close()
+    except RuntimeError as ex:
+        print(repr(ex), 'caused by', repr(ex.__cause__))
+
+    print('#' * 52 + '  Timings on a larger car_data.csv:')
+    print('#' * 52 + '  Process stages only pay off with spare cores: every row is pickled once per worker.')
+    print('cpu count:', os.cpu_count())
+
+    large_file = os.path.join(output_dir, 'car_data_large.csv')
+    make_large_input(large_file, 500)  # 500,000 rows
+
+    for kind in (None, 'thread', 'process'):
+        print(f'{str(kind):>8}: {run(large_file, kind):.2f} s')
+
+    shutil.rmtree(output_dir)
@@ -0,0 +1,462 @@
+print('#' * 52 + '  ### Pipelines - Buffered Stages')
+
+print('#' * 52 + '  In our push pipelines every `send()` runs the whole chain synchronously:'
+                 '  a slow `save_data` stalls every stage before it.')
+print('#' * 52 + '  Just like the producer / consumer coordinator built on a capped `deque`,'
+                 '  we can put a buffer between two stages.')
+print('#' * 52 + '  The buffer collects items, flushes them downstream in bulk,'
+                 '  and tells the upstream side when it is filling up.')
+
+from collections import deque
+from itertools import islice
+from time import perf_counter
+
+
+class BufferedStage:
+    def __init__(self, target, size=100, *, high_water=None, low_water=0,
+                 capacity=None, autoflush=True, bulk=False):
+        if high_water is None:
+            high_water = size
+        if capacity is None:
+            capacity = max(2 * high_water, size)
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        if not 0 <= low_water < high_water <= capacity:
+            raise ValueError('watermarks must satisfy 0 <= low_water < high_water <= capacity')
+        self._target = target
+        self._size = size
+        self._high_water = high_water
+        self._low_water = low_water
+        self._autoflush = autoflush
+        self._bulk = bulk
+        # maxlen is only a safety net: we always flush before the deque would discard items
+        self._buffer = deque(maxlen=capacity)
+        self._pressure = False
+        self._closed = False
+
+        self._items_in = 0
+        self._items_out = 0
+        self._flushes = 0
+        self._forced_flushes = 0
+        self._pressure_events = 0
+        self._max_depth = 0
+        self._depth_total = 0
+        self._flush_time = 0.0
+
+    def __repr__(self):
+        return (f'BufferedStage(size={self._size}, high_water={self._high_water}, '
+                f'low_water={self._low_water}, capacity={self.capacity}, depth={self.depth})')
+
+    @property
+    def depth(self):
+        return len(self._buffer)
+
+    @property
+    def capacity(self):
+        return self._buffer.maxlen
+
+    @property
+    def pressure(self):
+        return self._pressure
+
+    def send(self, item):
+        if self._closed:
+            raise StopIteration
+        buffer = self._buffer
+        if len(buffer) == buffer.maxlen:
+            # the upstream side ignored the backpressure signal: stall and make room
+            self._forced_flushes += 1
+            self.flush(self._size)
+        buffer.append(item)
+        self._items_in += 1
+
+        depth = len(buffer)
+        self._depth_total += depth
+        if depth > self._max_depth:
+            self._max_depth = depth
+        if not self._pressure and depth >= self._high_water:
+            self._pressure = True
+            self._pressure_events += 1
+            if self._autoflush:
+                self.drain()
+        return self._pressure
+
+    def flush(self, max_items=None):
+        buffer = self._buffer
+        count = len(buffer) if max_items is None else min(max_items, len(buffer))
+        start = perf_counter()
+        remaining = count
+        while remaining > 0:
+            n = min(remaining, self._size)
+            if n == len(buffer):
+                chunk = list(buffer)
+                buffer.clear()
+            else:
+                chunk = list(islice(buffer, n))
+                for _ in range(n):
+                    buffer.popleft()
+            if self._bulk:
+                self._target.send(chunk)
+            else:
+                send = self._target.send
+                for item in chunk:
+                    send(item)
+            self._flushes += 1
+            self._items_out += n
+            remaining -= n
+        self._flush_time += perf_counter() - start
+        if self._pressure and len(buffer) <= self._low_water:
+            self._pressure = False
+        return count
+
+    def drain(self):
+        # flush down to the low watermark
+        return self.flush(len(self._buffer) - self._low_water)
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._target.close()
+
+    def stats(self):
+        return {
+            'items_in': self._items_in,
+            'items_out': self._items_out,
+            'depth': self.depth,
+            'max_depth': self._max_depth,
+            'mean_depth': self._depth_total / self._items_in if self._items_in else 0.0,
+            'flushes': self._flushes,
+            'mean_flush_size': self._items_out / self._flushes if self._flushes else 0.0,
+            'forced_flushes': self._forced_flushes,
+            'pressure_events': self._pressure_events,
+            'flush_time': self._flush_time,
+        }
+
+
+def coroutine(fn):
+    def inner(*args, **kwargs):
+        g = fn(*args, **kwargs)
+        next(g)
+        return g
+    return inner
+
+
+def test_buffered_stage():
+    received = []
+
+    @coroutine
+    def sink():
+        while True:
+            received.append((yield))
+
+    stage = BufferedStage(sink(), size=3, bulk=True)
+    for i in range(7):
+        stage.send(i)
+    assert received == [[0, 1, 2], [3, 4, 5]]
+    assert stage.depth == 1
+    stage.close()
+    assert received == [[0, 1, 2], [3, 4, 5], [6]]
+    assert stage.stats()['items_out'] == 7
+
+    received.clear()
+    stage = BufferedStage(sink(), size=2, high_water=4, low_water=1,
+                          capacity=6, autoflush=False)
+    signals = [stage.send(i) for i in range(6)]
+    assert signals == [False, False, False, True, True, True]
+    assert received == []
+    stage.drain()
+    assert received == [0, 1, 2, 3, 4] and not stage.pressure
+    for i in range(6, 12):
+        stage.send(i)
+    assert stage.stats()['forced_flushes'] == 1, 'a full buffer must flush, never drop items'
+    stage.close()
+    assert received == list(range(12))
+
+    try:
+        BufferedStage(sink(), size=10, high_water=5, low_water=5)
+        assert False, 'ValueError expected'
+    except ValueError:
+        pass
+
+
+test_buffered_stage()
+
+print('#' * 52 + '  A buffer between two per row stages: rows are flushed downstream 5 at a time')
+
+import math
+
+
+@coroutine
+def handle_data():
+    while True:
+        received = yield
+        print(received)
+
+
+@coroutine
+def power_up(n, next_gen):
+    while True:
+        received = yield
+        output = math.pow(received, n)
+        next_gen.send(output)
+
+
+print_data = handle_data()
+buffer = BufferedStage(print_data, size=5, bulk=True)
+gen = power_up(2, buffer)
+# pipeline: gen --> buffer --> print_data
+for i in range(1, 13):
+    gen.send(i)
+print('still buffered:', buffer.depth)
+buffer.close()
+
+print('#' * 52 + '  #### Backpressure')
+print('#' * 52 + '  With `autoflush=False` the buffer only signals: `send()` returns `True`'
+                 '  once the depth reaches the high watermark,')
+print('#' * 52 + '  and keeps returning `True` until it has been drained below the low watermark.')
+print('#' * 52 + '  This is the producer / consumer coordinator again, the producer yields control'
+                 '  when it is told to back off:')
+
+
+def produce_elements(stage, n):
+    for i in range(1, n):
+        if stage.send(i):
+            print('high watermark reached - yielding control')
+            yield
+
+
+def consume_elements(stage):
+    while True:
+        print('depth before draining:', stage.depth)
+        stage.drain()
+        yield
+
+
+def coordinator():
+    stage = BufferedStage(handle_data(), size=4, high_water=8, low_water=2,
+                          autoflush=False, bulk=True)
+    producer = produce_elements(stage, 21)
+    consumer = consume_elements(stage)
+    while True:
+        try:
+            next(producer)
+        except StopIteration:
+            break
+        finally:
+            next(consumer)
+    stage.close()
+    print(stage.stats())
+
+
+coordinator()
+
+print('#' * 52 + '  #### Broadcasting pipeline')
+print('#' * 52 + '  Lets put a buffer in front of each `save_data` and write the rows with `writerows`:')
+
+import csv
+import os
+import tempfile
+
+
+def data_reader(f_name):
+    f = open(f_name)
+    try:
+        dialect = csv.Sniffer().sniff(f.read(2000))
+        f.seek(0)
+        reader = csv.reader(f, dialect=dialect)
+        yield from reader
+    finally:
+        f.close()
+
+
+output_dir = tempfile.mkdtemp()
+
+idx_make = 0
+idx_model = 1
+idx_year = 2
+idx_vin = 3
+idx_color = 4
+
+headers = ('make', 'model', 'year', 'vin', 'color')
+
+converters = (str, str, int, str, str)
+
+
+def data_parser(f_name='car_data.csv'):
+    data = data_reader(f_name)
+    next(data)  # skip header row
+    for row in data:
+        parsed_row = [converter(item)
+                      for converter, item in zip(converters, row)]
+        yield parsed_row
+
+
+@coroutine
+def save_data(f_name, headers):
+    with open(f_name, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        while True:
+            data_row = yield
+            writer.writerow(data_row)
+
+
+@coroutine
+def save_rows(f_name, headers):
+    with open(f_name, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        while True:
+            data_rows = yield
+            writer.writerows(data_rows)
+
+
+@coroutine
+def filter_data(filter_predicate, target):
+    while True:
+        data_row = yield
+        if filter_predicate(data_row):
+            target.send(data_row)
+
+
+@coroutine
+def broadcast(targets):
+    while True:
+        data_row = yield
+        for target in targets:
+            target.send(data_row)
+
+
+def pred_pink(data_row):
+    return data_row[idx_color].lower() == 'pink'
+
+
+def pred_ford_green(data_row):
+    return (data_row[idx_make].lower() == 'ford'
+            and data_row[idx_color].lower() == 'green')
+
+
+def pred_older(data_row):
+    return data_row[idx_year] <= 2010
+
+
+outputs = (('pink_cars.csv', pred_pink),
+           ('ford_green.csv', pred_ford_green),
+           ('older.csv', pred_older))
+
+
+@coroutine
+def pipeline_coro(buffers, size=500):
+    for f_name, predicate in outputs:
+        out = save_rows(os.path.join(output_dir, f_name), headers)
+        buffers[f_name] = BufferedStage(out, size=size, bulk=True)
+
+    filters = [filter_data(predicate, buffers[f_name])
+               for f_name, predicate in outputs]
+
+    broadcaster = broadcast(filters)
+
+    try:
+        while True:
+            data_row = yield
+            broadcaster.send(data_row)
+    finally:
+        for stage in buffers.values():
+            stage.close()
+
+
+from contextlib import contextmanager
+
+
+@contextmanager
+def pipeline(buffers, size=500):
+    p = pipeline_coro(buffers, size)
+    try:
+        yield p
+    finally:
+        p.close()
+
+
+buffers = {}
+with pipeline(buffers) as pipe:
+    for row in data_parser():
+        pipe.send(row)
+
+print('#' * 52 + '  Queue depth metrics for each buffer:')
+
+for f_name, stage in buffers.items():
+    stats = stage.stats()
+    print(f'{f_name:<15} in={stats["items_in"]:>4} flushes={stats["flushes"]:>2} '
+          f'max depth={stats["max_depth"]:>3} mean depth={stats["mean_depth"]:>6.1f} '
+          f'flush time={stats["flush_time"] * 1000:.2f} ms')
+
+
+def print_file_data():
+    for file_name, _ in outputs:
+        print(f'***** {file_name} *****')
+        for row in islice(data_reader(os.path.join(output_dir, file_name)), 5):
+            print(row)
+        print('\n')
+
+
+print_file_data()
+
+print('#' * 52 + '  #### A slow sink')
+print('#' * 52 + '  Here each call to the sink pays a fixed cost (a flush to disk),'
+                 '  the buffer amortizes it over a whole chunk:')
+
+
+@coroutine
+def slow_save_data(f_name, headers):
+    with open(f_name, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        while True:
+            data_row = yield
+            writer.writerow(data_row)
+            f.flush()
+
+
+@coroutine
+def slow_save_rows(f_name, headers):
+    with open(f_name, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        while True:
+            data_rows = yield
+            writer.writerows(data_rows)
+            f.flush()
+
+
+rows = list(data_parser()) * 100  # 100,000 rows held in memory
+
+
+def run(size):
+    if size is None:
+        sinks = [slow_save_data(os.path.join(output_dir, f'slow_{f_name}'), headers)
+                 for f_name, _ in outputs]
+        targets = sinks
+    else:
+        sinks = [slow_save_rows(os.path.join(output_dir, f'slow_{f_name}'), headers)
+                 for f_name, _ in outputs]
+        targets = [BufferedStage(sink, size=size, bulk=True) for sink in sinks]
+    broadcaster = broadcast([filter_data(predicate, target)
+                             for (_, predicate), target in zip(outputs, targets)])
+    start = perf_counter()
+    for row in rows:
+        broadcaster.send(row)
+    for target in targets:
+        target.close()
+    return perf_counter() - start
+
+
+print(f'{"buffer size":>11} {"rows/sec":>12}')
+print(f'{"none":>11} {len(rows) / run(None):>12,.0f}')
+for size in (10, 100, 1_000, 10_000):
+    print(f'{size:>11} {len(rows) / run(size):>12,.0f}')
+
+import shutil
+
+shutil.rmtree(output_dir)
@@ -0,0 +1,363 @@
+print('#' * 52 + '  ### Pipelines - Asyncio')
+
+print('#' * 52 + '  Our generator based pipelines run every stage in a single call chain:'
+                 '  each `writer.writerow` in `save_data` blocks everything else.')
+print('#' * 52 + '  With `asyncio` each stage becomes a task, stages are connected by bounded `asyncio.Queue`s,'
+                 '  and the sinks write large chunks in a worker thread, off the event loop.')
+print('#' * 52 + '  While one sink waits on its (slow) file, the parser and the other sinks keep running.')
+
+import asyncio
+import csv
+import io
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+
+def data_reader(f_name):
+    f = open(f_name)
+    try:
+        dialect = csv.Sniffer().sniff(f.read(2000))
+        f.seek(0)
+        reader = csv.reader(f, dialect=dialect)
+        yield from reader
+    finally:
+        f.close()
+
+
+idx_make = 0
+idx_model = 1
+idx_year = 2
+idx_vin = 3
+idx_color = 4
+
+headers = ('make', 'model', 'year', 'vin', 'color')
+
+converters = (str, str, int, str, str)
+
+
+def data_parser(f_name='car_data.csv'):
+    data = data_reader(f_name)
+    next(data)  # skip header row
+    for row in data:
+        parsed_row = [converter(item)
+                      for converter, item in zip(converters, row)]
+        yield parsed_row
+
+
+def pred_pink(data_row):
+    return data_row[idx_color].lower() == 'pink'
+
+
+def pred_ford_green(data_row):
+    return (data_row[idx_make].lower() == 'ford'
+            and data_row[idx_color].lower() == 'green')
+
+
+def pred_older(data_row):
+    return data_row[idx_year] <= 2010
+
+
+outputs = (('pink_cars.csv', pred_pink),
+           ('ford_green.csv', pred_ford_green),
+           ('older.csv', pred_older))
+
+print('#' * 52 + '  #### Stages')
+print('#' * 52 + '  Batches of rows (lists) travel through the queues, `None` marks the end of the data.')
+print('#' * 52 + '  If a stage fails it keeps draining its inbox, so the stages before it never block'
+                 '  on a full queue, and the error is raised when the pipeline is closed.')
+
+
+async def consume(inbox, process, error=None):
+    # with an error from the start (the stage could not even start), only drains
+    while (batch := await inbox.get()) is not None:
+        if error is None:
+            try:
+                await process(batch)
+            except Exception as ex:
+                error = ex
+    if error is not None:
+        raise error
+
+
+async def filter_data(filter_predicate, inbox, outbox):
+    async def process(data_rows):
+        selected = [data_row for data_row in data_rows if filter_predicate(data_row)]
+        if selected:
+            await outbox.put(selected)
+
+    try:
+        await consume(inbox, process)
+    finally:
+        await outbox.put(None)
+
+
+async def broadcast(inbox, outboxes):
+    async def process(data_rows):
+        for outbox in outboxes:
+            await outbox.put(data_rows)
+
+    try:
+        await consume(inbox, process)
+    finally:
+        for outbox in outboxes:
+            await outbox.put(None)
+
+
+def write_rows(f, rows):
+    # one write call per chunk, whatever the number of rows
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    f.write(buffer.getvalue())
+
+
+async def save_data(f_name, headers, inbox, chunk_size=10_000, opener=open):
+    try:
+        f = await asyncio.to_thread(opener, f_name, 'w', newline='')
+    except Exception as ex:
+        await consume(inbox, None, error=ex)
+    chunk = [headers]
+    pending = None
+
+    async def process(data_rows):
+        nonlocal chunk, pending
+        chunk.extend(data_rows)
+        if len(chunk) >= chunk_size:
+            # at most one write in flight, the next chunk fills up in the meantime
+            if pending is not None:
+                await pending
+            pending = asyncio.create_task(asyncio.to_thread(write_rows, f, chunk))
+            chunk = []
+
+    try:
+        await consume(inbox, process)
+        if pending is not None:
+            await pending
+            pending = None
+        await asyncio.to_thread(write_rows, f, chunk)
+    finally:
+        if pending is not None:
+            await asyncio.gather(pending, return_exceptions=True)
+        await asyncio.to_thread(f.close)
+
+
+class Pipe:
+    def __init__(self, inbox, batch_size):
+        self._inbox = inbox
+        self._batch_size = batch_size
+        self._batch = []
+
+    async def send(self, data_row):
+        self._batch.append(data_row)
+        if len(self._batch) >= self._batch_size:
+            await self.flush()
+
+    async def flush(self):
+        if self._batch:
+            # waits when the queue is full: backpressure on the sender
+            await self._inbox.put(self._batch)
+            self._batch = []
+
+
+@asynccontextmanager
+async def pipeline(output_dir, *, batch_size=1_000, maxsize=16, chunk_size=10_000, opener=open):
+    head = asyncio.Queue(maxsize)
+    filter_inboxes = [asyncio.Queue(maxsize) for _ in outputs]
+    sink_inboxes = [asyncio.Queue(maxsize) for _ in outputs]
+
+    tasks = [asyncio.create_task(broadcast(head, filter_inboxes))]
+    for (f_name, predicate), filter_inbox, sink_inbox in zip(outputs, filter_inboxes, sink_inboxes):
+        tasks.append(asyncio.create_task(filter_data(predicate, filter_inbox, sink_inbox)))
+        tasks.append(asyncio.create_task(
+            save_data(os.path.join(output_dir, f_name), headers, sink_inbox, chunk_size, opener)))
+
+    async def close():
+        await head.put(None)
+        # wait for every stage, so all files are closed before reporting the first error
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return next((result for result in results if isinstance(result, BaseException)), None)
+
+    pipe = Pipe(head, batch_size)
+    try:
+        yield pipe
+        await pipe.flush()
+    except BaseException:
+        # an error in the body of the `async with` takes precedence over stage errors
+        await close()
+        raise
+    error = await close()
+    if error is not None:
+        raise error
+
+
+output_dir = tempfile.mkdtemp()
+
+
+async def main():
+    async with pipeline(output_dir) as pipe:
+        for row in data_parser():
+            await pipe.send(row)
+
+
+asyncio.run(main())
+
+
+def print_file_data():
+    for file_name, _ in outputs:
+        with open(os.path.join(output_dir, file_name)) as f:
+            print(f'***** {file_name}: {sum(1 for _ in f) - 1} rows *****')
+
+
+print_file_data()
+
+print('#' * 52 + '  Errors in any stage surface when the `async with` block exits:')
+
+
+async def bad_row():
+    async with pipeline(output_dir) as pipe:
+        await pipe.send(['Ford', 'Focus', 'not a year', 'VIN', 'Green'])
+        await pipe.send(['Ford', 'Focus', 2000, 'VIN', 'Green'])
+
+
+try:
+    asyncio.run(bad_row())
+except TypeError as ex:
+    print(repr(ex))
+
+print('#' * 52 + '  Including a sink that cannot open its file: it still drains its inbox,'
+                 '  so nothing upstream waits on it.')
+
+
+async def missing_directory():
+    async with pipeline(os.path.join(output_dir, 'missing'), batch_size=1, maxsize=1) as pipe:
+        for row in data_parser():
+            await pipe.send(row)
+
+
+try:
+    asyncio.run(missing_directory())
+except FileNotFoundError as ex:
+    print(repr(ex))
+
+print('#' * 52 + '  #### Slow sinks')
+print('#' * 52 + '  A stand-in for a slow disk or a network connection:'
+                 '  every write pays a fixed latency plus a bandwidth cost.')
+
+
+class SlowFile:
+    def __init__(self, f_name, mode='r', *, newline=None, latency=0.000_1, bandwidth=2_000_000):
+        self._f = open(f_name, mode, newline=newline)
+        self._latency = latency
+        self._bandwidth = bandwidth
+
+    def write(self, data):
+        time.sleep(self._latency + len(data) / self._bandwidth)
+        return self._f.write(data)
+
+    def close(self):
+        self._f.close()
+
+
+def coroutine(fn):
+    def inner(*args, **kwargs):
+        g = fn(*args, **kwargs)
+        next(g)
+        return g
+    return inner
+
+
+@coroutine
+def sync_save_data(f_name, headers, opener=open):
+    f = opener(f_name, 'w', newline='')
+    try:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        while True:
+            data_row = yield
+            writer.writerow(data_row)
+    finally:
+        f.close()
+
+
+@coroutine
+def sync_save_chunks(f_name, headers, opener=open, chunk_size=1_000):
+    f = opener(f_name, 'w', newline='')
+    chunk = [headers]
+    try:
+        while True:
+            chunk.append((yield))
+            if len(chunk) >= chunk_size:
+                write_rows(f, chunk)
+                chunk = []
+    finally:
+        write_rows(f, chunk)
+        f.close()
+
+
+@coroutine
+def sync_filter_data(filter_predicate, target):
+    while True:
+        data_row = yield
+        if filter_predicate(data_row):
+            target.send(data_row)
+
+
+@coroutine
+def sync_broadcast(targets):
+    while True:
+        data_row = yield
+        for target in targets:
+            target.send(data_row)
+
+
+large_file = os.path.join(output_dir, 'car_data_large.csv')
+with open('car_data.csv') as f:
+    header = next(f)
+    rows = f.readlines()
+with open(large_file, 'w') as f:
+    f.write(header)
+    for _ in range(20):
+        f.writelines(rows)  # 20,000 rows
+
+
+def run_sync(sink, opener):
+    start = time.perf_counter()
+    sinks = [sink(os.path.join(output_dir, f'sync_{f_name}'), headers, opener)
+             for f_name, _ in outputs]
+    broadcaster = sync_broadcast([sync_filter_data(predicate, out)
+                                  for (_, predicate), out in zip(outputs, sinks)])
+    for row in data_parser(large_file):
+        broadcaster.send(row)
+    for out in sinks:
+        out.close()
+    return time.perf_counter() - start
+
+
+def run_async(opener):
+    async def run():
+        async with pipeline(output_dir, chunk_size=1_000, opener=opener) as pipe:
+            for row in data_parser(large_file):
+                await pipe.send(row)
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return time.perf_counter() - start
+
+
+from functools import partial
+
+print('#' * 52 + '  The asyncio pipeline overlaps the sinks with each other and with parsing,'
+                 '  so it can never beat the slowest single sink (here `older.csv`).')
+
+print(f'{"latency":>8} {"bandwidth":>10} {"sync per row":>13} {"sync chunked":>13} {"asyncio":>8}')
+for latency, bandwidth in ((0.000_1, 2_000_000), (0.000_1, 10_000_000), (0.002, 50_000_000)):
+    opener = partial(SlowFile, latency=latency, bandwidth=bandwidth)
+    # one write per row is too slow to bother with once the latency grows
+    per_row = f'{run_sync(sync_save_data, opener):.2f} s' if latency < 0.001 else 'n/a'
+    print(f'{latency * 1000:>5.1f} ms {bandwidth / 1e6:>5.0f} MB/s {per_row:>13} '
+          f'{run_sync(sync_save_chunks, opener):>11.2f} s {run_async(opener):>6.2f} s')
+
+import shutil
+
+shutil.rmtree(output_dir)
@@ -0,0 +1,388 @@
+print('#' * 52 + '  ### Pipelines - Profiling Stages')
+
+print('#' * 52 + '  When a push pipeline is slow, which stage is the bottleneck?')
+print('#' * 52 + '  Since every `send()` runs synchronously, the time spent in a stage includes the time'
+                 '  spent in all the stages it sends to.')
+print('#' * 52 + '  We keep a stack of the stages currently running: when a `send()` returns,'
+                 '  its time is charged to the stage, and to the caller as time blocked downstream.')
+
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+_profiler = None
+
+
+class Profiler:
+    def __init__(self, report=True, collapsed_file=None):
+        self.stages = []
+        self.stack = []
+        self.self_times = defaultdict(float)  # call path --> time spent in the stage itself
+        self._names = defaultdict(int)
+        self._report = report
+        self._collapsed_file = collapsed_file
+
+    def register(self, stage, name):
+        self._names[name] += 1
+        if self._names[name] > 1:
+            name = f'{name}#{self._names[name]}'
+        self.stages.append(stage)
+        return name
+
+    def pipeline_closed(self):
+        if self._report:
+            print(self.report())
+        if self._collapsed_file is not None:
+            self.write_collapsed(self._collapsed_file)
+
+    def report(self):
+        total = sum(stage.self_time for stage in self.stages) or 1.0
+        lines = [f'{"stage":<22} {"rows in":>9} {"rows out":>9} {"selectivity":>11} '
+                 f'{"total ms":>9} {"self ms":>9} {"blocked ms":>10} {"self %":>7}']
+        # upstream stages include the time of everything downstream, so they come first
+        for stage in sorted(self.stages, key=lambda stage: stage.total_time, reverse=True):
+            selectivity = f'{stage.rows_out / stage.rows_in:.3f}' if stage.rows_in else '-'
+            lines.append(f'{stage.name:<22} {stage.rows_in:>9} {stage.rows_out:>9} {selectivity:>11} '
+                         f'{stage.total_time * 1000:>9.1f} {stage.self_time * 1000:>9.1f} '
+                         f'{stage.downstream_time * 1000:>10.1f} {stage.self_time / total:>7.1%}')
+        return '\n'.join(lines)
+
+    def collapsed(self):
+        # "stage;stage;stage microseconds" lines, the input format of flamegraph.pl and speedscope
+        for path, seconds in self.self_times.items():
+            names = []
+            while path is not None:
+                path, name = path
+                names.append(name)
+            yield f'{";".join(reversed(names))} {round(seconds * 1_000_000)}'
+
+    def write_collapsed(self, f_name):
+        with open(f_name, 'w') as f:
+            for line in self.collapsed():
+                f.write(line + '\n')
+
+
+class ProfiledStage:
+    def __init__(self, gen, name, profiler):
+        self._gen = gen
+        self._profiler = profiler
+        self.name = profiler.register(self, name)
+        self.rows_in = 0
+        self.rows_out = 0
+        self.total_time = 0.0
+        self.downstream_time = 0.0
+        self._has_parent = False
+
+    def __repr__(self):
+        return f'ProfiledStage({self.name!r})'
+
+    @property
+    def self_time(self):
+        return self.total_time - self.downstream_time
+
+    def _call(self, method, *args):
+        stack = self._profiler.stack
+        parent = stack[-1] if stack else None
+        if parent is not None:
+            self._has_parent = True
+        # a frame is [stage, call path, time spent in the stages it sent to]
+        frame = [self, (parent[1] if parent else None, self.name), 0.0]
+        stack.append(frame)
+        start = perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = perf_counter() - start
+            stack.pop()
+            self.total_time += elapsed
+            self._profiler.self_times[frame[1]] += elapsed - frame[2]
+            if parent is not None:
+                parent[2] += elapsed
+                parent[0].downstream_time += elapsed
+
+    def send(self, value):
+        self.rows_in += 1
+        stack = self._profiler.stack
+        if stack:
+            stack[-1][0].rows_out += 1
+        return self._call(self._gen.send, value)
+
+    def throw(self, *args):
+        return self._call(self._gen.throw, *args)
+
+    def close(self):
+        self._call(self._gen.close)
+        if not self._has_parent:
+            self._profiler.pipeline_closed()
+
+
+class ProfiledSource:
+    def __init__(self, iterable, name, profiler):
+        self._it = iter(iterable)
+        self._profiler = profiler
+        self.name = profiler.register(self, name)
+        self.rows_in = 0
+        self.rows_out = 0
+        self.total_time = 0.0
+        self.downstream_time = 0.0
+
+    @property
+    def self_time(self):
+        return self.total_time
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = perf_counter()
+        try:
+            row = next(self._it)
+        finally:
+            elapsed = perf_counter() - start
+            self.total_time += elapsed
+            self._profiler.self_times[(None, self.name)] += elapsed
+        self.rows_out += 1
+        return row
+
+
+@contextmanager
+def profiling(report=True, collapsed_file=None):
+    global _profiler
+    previous, _profiler = _profiler, Profiler(report, collapsed_file)
+    try:
+        yield _profiler
+    finally:
+        _profiler = previous
+
+
+def profiled(stage, name=None):
+    # wraps an already created coroutine when profiling is on
+    if _profiler is None:
+        return stage
+    return ProfiledStage(stage, name or getattr(stage, '__name__', 'stage'), _profiler)
+
+
+def profiled_source(iterable, name=None):
+    # the data source is pulled from, not sent to
+    if _profiler is None:
+        return iterable
+    return ProfiledSource(iterable, name or getattr(iterable, '__name__', 'source'), _profiler)
+
+
+def coroutine(fn=None, *, profile=True):
+    if fn is None:
+        return lambda fn: coroutine(fn, profile=profile)
+
+    def inner(*args, **kwargs):
+        g = fn(*args, **kwargs)
+        next(g)
+        # decided once, when the stage is created: no cost per row when profiling is off
+        if profile and _profiler is not None:
+            return ProfiledStage(g, fn.__name__, _profiler)
+        return g
+    return inner
+
+
+def test_profiling():
+    @coroutine
+    def keep_even(target):
+        while True:
+            received = yield
+            if received % 2 == 0:
+                target.send(received)
+
+    @coroutine
+    def sink(results):
+        while True:
+            results.append((yield))
+
+    results = []
+    stage = keep_even(sink(results))
+    assert not isinstance(stage, ProfiledStage), 'profiling is off by default'
+
+    with profiling(report=False) as profiler:
+        stage = keep_even(sink(results))
+        for i in range(10):
+            stage.send(i)
+        stage.close()
+    assert results == [0, 2, 4, 6, 8]
+    out, keep = profiler.stages  # the sink is created first
+    assert (keep.name, keep.rows_in, keep.rows_out) == ('keep_even', 10, 5)
+    assert (out.name, out.rows_in, out.rows_out) == ('sink', 5, 0)
+    assert keep.downstream_time > 0 and keep.total_time >= keep.downstream_time
+    assert sorted(line.split()[0] for line in profiler.collapsed()) == ['keep_even', 'keep_even;sink']
+
+
+test_profiling()
+
+print('#' * 52 + '  #### Profiling the broadcasting pipeline')
+
+import csv
+import os
+import tempfile
+
+
+def data_reader(f_name):
+    f = open(f_name)
+    try:
+        dialect = csv.Sniffer().sniff(f.read(2000))
+        f.seek(0)
+        reader = csv.reader(f, dialect=dialect)
+        yield from reader
+    finally:
+        f.close()
+
+
+output_dir = tempfile.mkdtemp()
+
+idx_make = 0
+idx_model = 1
+idx_year = 2
+idx_vin = 3
+idx_color = 4
+
+headers = ('make', 'model', 'year', 'vin', 'color')
+
+converters = (str, str, int, str, str)
+
+
+def data_parser(f_name='car_data.csv'):
+    data = data_reader(f_name)
+    next(data)  # skip header row
+    for row in data:
+        parsed_row = [converter(item)
+                      for converter, item in zip(converters, row)]
+        yield parsed_row
+
+
+@coroutine
+def save_data(f_name, headers):
+    with open(f_name, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        while True:
+            data_row = yield
+            writer.writerow(data_row)
+
+
+@coroutine
+def filter_data(filter_predicate, target):
+    while True:
+        data_row = yield
+        if filter_predicate(data_row):
+            target.send(data_row)
+
+
+@coroutine
+def broadcast(targets):
+    while True:
+        data_row = yield
+        for target in targets:
+            target.send(data_row)
+
+
+def pred_pink(data_row):
+    return data_row[idx_color].lower() == 'pink'
+
+
+def pred_ford_green(data_row):
+    return (data_row[idx_make].lower() == 'ford'
+            and data_row[idx_color].lower() == 'green')
+
+
+def pred_older(data_row):
+    return data_row[idx_year] <= 2010
+
+
+@coroutine
+def pipeline_coro():
+    out_pink_cars = save_data(os.path.join(output_dir, 'pink_cars.csv'), headers)
+    out_ford_green = save_data(os.path.join(output_dir, 'ford_green.csv'), headers)
+    out_older = save_data(os.path.join(output_dir, 'older.csv'), headers)
+    outputs = (out_pink_cars, out_ford_green, out_older)
+
+    filter_pink_cars = filter_data(pred_pink, out_pink_cars)
+    filter_ford_green = filter_data(pred_ford_green, out_ford_green)
+    filter_older = filter_data(pred_older, out_older)
+
+    filters = (filter_pink_cars, filter_ford_green, filter_older)
+
+    broadcaster = broadcast(filters)
+
+    try:
+        while True:
+            data_row = yield
+            broadcaster.send(data_row)
+    finally:
+        for output in outputs:
+            output.close()
+
+
+@contextmanager
+def pipeline():
+    p = pipeline_coro()
+    try:
+        yield p
+    finally:
+        p.close()
+
+
+print('#' * 52 + '  Stages created inside the `profiling()` block are instrumented,'
+                 '  the report is printed when the pipeline is closed:')
+
+collapsed_file = os.path.join(output_dir, 'pipeline.folded')
+
+with profiling(collapsed_file=collapsed_file):
+    with pipeline() as pipe:
+        for row in profiled_source(data_parser()):
+            pipe.send(row)
+
+print('#' * 52 + '  And the same data as collapsed stacks, ready for `flamegraph.pl` or speedscope:')
+
+with open(collapsed_file) as f:
+    print(f.read())
+
+print('#' * 52 + '  #### Overhead')
+print('#' * 52 + '  With profiling off the decorator returns the plain generator,'
+                 '  so the only cost is one check per stage creation:')
+
+
+def coroutine_plain(fn):
+    def inner(*args, **kwargs):
+        g = fn(*args, **kwargs)
+        next(g)
+        return g
+    return inner
+
+
+def make_chain(decorator, depth=3):
+    def relay(target):
+        while True:
+            target.send((yield))
+
+    def sink():
+        while True:
+            yield
+
+    stage = decorator(sink)()
+    for _ in range(depth):
+        stage = decorator(relay)(stage)
+    return stage
+
+
+def run_chain(stage, n=300_000):
+    start = perf_counter()
+    for i in range(n):
+        stage.send(i)
+    stage.close()
+    return perf_counter() - start
+
+
+print(f'{"plain coroutine":<22} {run_chain(make_chain(coroutine_plain)):.3f} s')
+print(f'{"profiling disabled":<22} {run_chain(make_chain(coroutine)):.3f} s')
+with profiling(report=False):
+    print(f'{"profiling enabled":<22} {run_chain(make_chain(coroutine)):.3f} s')
+
+import shutil
+
+shutil.rmtree(output_dir)
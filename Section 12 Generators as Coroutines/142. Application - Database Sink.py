@@ -0,0 +1,197 @@
+print('#' * 52 + '  ### Application - Database Sink')
+
+print('#' * 52 + '  Our `write_to_db` coroutine modelled transactions with `CommitException`'
+                 '  and `RollbackException`, but only printed the rows.')
+print('#' * 52 + '  Lets write the real thing with `sqlite3`: rows are buffered, inserted with `executemany`'
+                 '  in batches, inside explicit transactions.')
+
+import sqlite3
+
+
+class CommitException(Exception):
+    pass
+
+
+class RollbackException(Exception):
+    pass
+
+
+def coroutine(fn):
+    def inner(*args, **kwargs):
+        g = fn(*args, **kwargs)
+        next(g)
+        return g
+    return inner
+
+
+@coroutine
+def write_to_db(db_name, table, columns, batch_size=1_000):
+    # isolation_level=None: the sqlite3 module does not open transactions behind our back
+    connection = sqlite3.connect(db_name, isolation_level=None)
+    column_names = ', '.join(columns)
+    connection.execute(f'CREATE TABLE IF NOT EXISTS {table} ({column_names})')
+    insert = f'INSERT INTO {table} ({column_names}) VALUES ({", ".join("?" * len(columns))})'
+    batch = []
+
+    def flush():
+        if batch:
+            if not connection.in_transaction:
+                connection.execute('BEGIN')
+            connection.executemany(insert, batch)
+            batch.clear()
+
+    def commit():
+        flush()
+        if connection.in_transaction:
+            connection.execute('COMMIT')
+
+    def rollback():
+        batch.clear()
+        if connection.in_transaction:
+            connection.execute('ROLLBACK')
+
+    try:
+        while True:
+            try:
+                data = yield
+                batch.append(data)
+                if len(batch) >= batch_size:
+                    flush()
+            except CommitException:
+                commit()
+            except RollbackException:
+                rollback()
+    except GeneratorExit:
+        commit()
+        raise
+    except Exception:
+        rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def count_rows(db_name, table):
+    connection = sqlite3.connect(db_name)
+    try:
+        return connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    finally:
+        connection.close()
+
+
+import os
+import tempfile
+
+output_dir = tempfile.mkdtemp()
+
+
+def test_write_to_db():
+    db_name = os.path.join(output_dir, 'test.db')
+    sql = write_to_db(db_name, 'numbers', ('n', 'square'), batch_size=3)
+    for n in range(5):
+        sql.send((n, n * n))
+    assert count_rows(db_name, 'numbers') == 0, 'nothing is visible before the commit'
+    sql.throw(CommitException)
+    assert count_rows(db_name, 'numbers') == 5
+
+    for n in range(5, 10):
+        sql.send((n, n * n))  # 3 of these already went to the database with executemany
+    sql.throw(RollbackException)
+    assert count_rows(db_name, 'numbers') == 5
+
+    sql.send((10, 100))
+    sql.close()
+    assert count_rows(db_name, 'numbers') == 6
+
+    sql = write_to_db(db_name, 'numbers', ('n', 'square'), batch_size=2)
+    sql.send((11, 121))
+    try:
+        sql.send((12,))  # wrong number of values: the batch fails, the transaction is rolled back
+        assert False, 'sqlite3.ProgrammingError expected'
+    except sqlite3.ProgrammingError:
+        pass
+    assert count_rows(db_name, 'numbers') == 6
+
+
+test_write_to_db()
+
+print('#' * 52 + '  Loading car_data.csv, committing every 250 rows:')
+
+import csv
+
+db_name = os.path.join(output_dir, 'cars.db')
+
+with open('car_data.csv') as f:
+    rows = csv.reader(f)
+    headers = next(rows)
+    sql = write_to_db(db_name, 'cars', headers, batch_size=100)
+    for i, row in enumerate(rows, 1):
+        sql.send(row)
+        if i % 250 == 0:
+            sql.throw(CommitException)
+    sql.close()
+
+print('rows in cars:', count_rows(db_name, 'cars'))
+
+print('#' * 52 + '  Rolling back discards the rows of the current transaction,'
+                 '  including batches that were already sent to the database:')
+
+sql = write_to_db(db_name, 'cars', headers, batch_size=100)
+for _ in range(150):
+    sql.send(['Ford', 'Focus', '2012', 'VIN', 'Green'])
+sql.throw(RollbackException)
+sql.close()
+
+print('rows in cars:', count_rows(db_name, 'cars'))
+
+print('#' * 52 + '  #### Throughput')
+print('#' * 52 + '  Compared with one INSERT per row, in autocommit mode (one transaction per row)'
+                 '  and all in a single transaction:')
+
+from time import perf_counter
+
+with open('car_data.csv') as f:
+    rows = list(csv.reader(f))[1:] * 100  # 100,000 rows
+
+
+def per_row(db_name, rows, autocommit):
+    connection = sqlite3.connect(db_name, isolation_level=None)
+    connection.execute(f'CREATE TABLE cars ({", ".join(headers)})')
+    insert = f'INSERT INTO cars VALUES ({", ".join("?" * len(headers))})'
+    if not autocommit:
+        connection.execute('BEGIN')
+    for row in rows:
+        connection.execute(insert, row)
+    if not autocommit:
+        connection.execute('COMMIT')
+    connection.close()
+
+
+def batched(db_name, rows, batch_size):
+    sql = write_to_db(db_name, 'cars', headers, batch_size=batch_size)
+    for row in rows:
+        sql.send(row)
+    sql.close()
+
+
+def rows_per_second(fn, rows, *args):
+    db_name = os.path.join(output_dir, 'benchmark.db')
+    if os.path.exists(db_name):
+        os.remove(db_name)
+    start = perf_counter()
+    fn(db_name, rows, *args)
+    elapsed = perf_counter() - start
+    assert count_rows(db_name, 'cars') == len(rows)
+    return len(rows) / elapsed
+
+
+print(f'{"method":<28} {"rows/sec":>12}')
+# each commit waits for the disk, so this one only gets 1,000 rows
+print(f'{"per row, autocommit":<28} {rows_per_second(per_row, rows[:1_000], True):>12,.0f}')
+print(f'{"per row, one transaction":<28} {rows_per_second(per_row, rows, False):>12,.0f}')
+for batch_size in (10, 100, 1_000, 10_000):
+    print(f'{f"write_to_db, batch {batch_size}":<28} {rows_per_second(batched, rows, batch_size):>12,.0f}')
+
+import shutil
+
+shutil.rmtree(output_dir)
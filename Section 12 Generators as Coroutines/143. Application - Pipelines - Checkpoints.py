@@ -0,0 +1,289 @@
+print('#' * 52 + '  ### Pipelines - Checkpoints')
+
+print('#' * 52 + '  If a long running push pipeline dies halfway, we have to start over from the first row,'
+                 '  and `save_data` truncates the output files with `open(f_name, "w")`.')
+print('#' * 52 + '  Instead, every so often we record a checkpoint:')
+print('#' * 52 + '  - the source records its byte offset in the input file and the number of rows read,')
+print('#' * 52 + '  - the sinks flush their files and record how many bytes and rows they hold.')
+print('#' * 52 + '  A restarted pipeline seeks to the checkpoint, cuts off whatever the sinks wrote after it,'
+                 '  and appends.')
+
+import csv
+import json
+import os
+
+
+class Checkpoint(Exception):
+    pass
+
+
+def coroutine(fn):
+    def inner(*args, **kwargs):
+        g = fn(*args, **kwargs)
+        next(g)
+        return g
+    return inner
+
+
+idx_make = 0
+idx_model = 1
+idx_year = 2
+idx_vin = 3
+idx_color = 4
+
+headers = ('make', 'model', 'year', 'vin', 'color')
+
+converters = (str, str, int, str, str)
+
+
+class DataParser:
+    def __init__(self, f_name, offset=0, rows=0):
+        self.f_name = f_name
+        self.offset = offset
+        self.rows = rows
+
+    def state(self):
+        return {'f_name': self.f_name, 'offset': self.offset, 'rows': self.rows}
+
+    def _lines(self, f):
+        # the csv reader pulls lines one at a time, never ahead of the row it is building,
+        # so after each row `offset` is exactly where the next row starts
+        for line in f:
+            self.offset += len(line)
+            yield line.decode()
+
+    def __iter__(self):
+        with open(self.f_name, 'rb') as f:
+            dialect = csv.Sniffer().sniff(f.read(2000).decode(errors='ignore'))
+            f.seek(self.offset)
+            reader = csv.reader(self._lines(f), dialect=dialect)
+            if self.offset == 0:
+                next(reader)  # skip header row
+            for row in reader:
+                self.rows += 1
+                yield [converter(item)
+                       for converter, item in zip(converters, row)]
+
+
+@coroutine
+def save_data(f_name, headers, resume=None):
+    if resume is None:
+        f = open(f_name, 'w', newline='')
+        rows = 0
+    else:
+        # anything written after the checkpoint is discarded
+        os.truncate(f_name, resume['offset'])
+        f = open(f_name, 'a', newline='')
+        rows = resume['rows']
+    with f:
+        writer = csv.writer(f)
+        if resume is None:
+            writer.writerow(headers)
+        state = None
+        while True:
+            try:
+                data_row = yield state
+                state = None
+                writer.writerow(data_row)
+                rows += 1
+            except Checkpoint:
+                f.flush()
+                os.fsync(f.fileno())
+                state = {'offset': f.tell(), 'rows': rows}
+
+
+@coroutine
+def filter_data(filter_predicate, target):
+    while True:
+        data_row = yield
+        if filter_predicate(data_row):
+            target.send(data_row)
+
+
+@coroutine
+def broadcast(targets):
+    while True:
+        data_row = yield
+        for target in targets:
+            target.send(data_row)
+
+
+def pred_pink(data_row):
+    return data_row[idx_color].lower() == 'pink'
+
+
+def pred_ford_green(data_row):
+    return (data_row[idx_make].lower() == 'ford'
+            and data_row[idx_color].lower() == 'green')
+
+
+def pred_older(data_row):
+    return data_row[idx_year] <= 2010
+
+
+outputs = (('pink_cars.csv', pred_pink),
+           ('ford_green.csv', pred_ford_green),
+           ('older.csv', pred_older))
+
+
+class CheckpointFile:
+    def __init__(self, f_name):
+        self.f_name = f_name
+
+    def load(self):
+        try:
+            with open(self.f_name) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, source, sinks):
+        # sends are synchronous: every row read so far has already reached the sinks
+        state = {'source': source.state(),
+                 'sinks': {f_name: sink.throw(Checkpoint) for f_name, sink in sinks.items()}}
+        # write a new file and rename it, so a crash never leaves a half written checkpoint
+        temp_name = self.f_name + '.tmp'
+        with open(temp_name, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_name, self.f_name)
+        return state
+
+    def clear(self):
+        if os.path.exists(self.f_name):
+            os.remove(self.f_name)
+
+
+@coroutine
+def pipeline_coro(output_dir, sinks, resume=None):
+    for f_name, _ in outputs:
+        sink_state = None if resume is None else resume['sinks'][f_name]
+        sinks[f_name] = save_data(os.path.join(output_dir, f_name), headers, sink_state)
+
+    filters = [filter_data(predicate, sinks[f_name]) for f_name, predicate in outputs]
+    broadcaster = broadcast(filters)
+
+    try:
+        while True:
+            data_row = yield
+            broadcaster.send(data_row)
+    finally:
+        for sink in sinks.values():
+            sink.close()
+
+
+from contextlib import contextmanager
+
+
+@contextmanager
+def pipeline(output_dir, sinks, resume=None):
+    p = pipeline_coro(output_dir, sinks, resume)
+    try:
+        yield p
+    finally:
+        p.close()
+
+
+class Crash(Exception):
+    pass
+
+
+def run(input_file, output_dir, every=10_000, crash_after=None):
+    checkpoints = CheckpointFile(os.path.join(output_dir, 'checkpoint.json'))
+    state = checkpoints.load()
+    if state is None:
+        source = DataParser(input_file)
+    else:
+        if state['source']['f_name'] != input_file:
+            raise ValueError(f'checkpoint was recorded for {state["source"]["f_name"]}')
+        source = DataParser(**state['source'])
+    start_rows = source.rows
+
+    sinks = {}
+    with pipeline(output_dir, sinks, state) as pipe:
+        for row in source:
+            pipe.send(row)
+            if source.rows % every == 0:
+                checkpoints.save(source, sinks)
+            if crash_after is not None and source.rows == crash_after:
+                raise Crash(f'crashed after row {source.rows}')
+    checkpoints.clear()
+    return source.rows - start_rows
+
+
+import tempfile
+
+
+def test_resume():
+    output_dir = tempfile.mkdtemp()
+    try:
+        expected_dir = os.path.join(output_dir, 'expected')
+        os.mkdir(expected_dir)
+        assert run('car_data.csv', expected_dir) == 1000
+
+        for crash_after in (1, 250, 399, 400, 999, 1000):
+            run_dir = os.path.join(output_dir, f'run_{crash_after}')
+            os.mkdir(run_dir)
+            try:
+                run('car_data.csv', run_dir, every=100, crash_after=crash_after)
+            except Crash:
+                pass
+            processed = run('car_data.csv', run_dir, every=100)
+            assert processed == 1000 - crash_after // 100 * 100, processed
+            for f_name, _ in outputs:
+                with open(os.path.join(expected_dir, f_name)) as expected, \
+                        open(os.path.join(run_dir, f_name)) as actual:
+                    assert actual.read() == expected.read(), (crash_after, f_name)
+            assert not os.path.exists(os.path.join(run_dir, 'checkpoint.json'))
+    finally:
+        import shutil
+        shutil.rmtree(output_dir)
+
+
+test_resume()
+
+print('#' * 52 + '  #### A crash, and a restart')
+
+output_dir = tempfile.mkdtemp()
+large_file = os.path.join(output_dir, 'car_data_large.csv')
+
+with open('car_data.csv') as f:
+    header = next(f)
+    rows = f.readlines()
+with open(large_file, 'w') as f:
+    f.write(header)
+    for _ in range(300):
+        f.writelines(rows)  # 300,000 rows
+
+from time import perf_counter
+
+start = perf_counter()
+try:
+    run(large_file, output_dir, every=25_000, crash_after=260_000)
+except Crash as ex:
+    print(f'{ex!r} after {perf_counter() - start:.2f} s')
+
+print('The last checkpoint:')
+with open(os.path.join(output_dir, 'checkpoint.json')) as f:
+    print(json.load(f))
+
+start = perf_counter()
+processed = run(large_file, output_dir, every=25_000)
+print(f'restart processed {processed:,} rows in {perf_counter() - start:.2f} s')
+
+for f_name, _ in outputs:
+    with open(os.path.join(output_dir, f_name)) as f:
+        print(f'***** {f_name}: {sum(1 for _ in f) - 1:,} rows *****')
+
+print('#' * 52 + '  #### Cost of checkpointing')
+print('#' * 52 + '  Each checkpoint flushes and fsyncs the output files, so it should not happen too often:')
+
+for every in (1_000, 10_000, 100_000, 1_000_000):
+    start = perf_counter()
+    run(large_file, output_dir, every=every)
+    print(f'checkpoint every {every:>9,} rows: {perf_counter() - start:.2f} s')
+
+import shutil
+
+shutil.rmtree(output_dir)
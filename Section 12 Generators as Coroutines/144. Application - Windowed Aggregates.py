@@ -0,0 +1,372 @@
+print('#' * 52 + '  ### Application - Windowed Aggregates')
+
+print('#' * 52 + '  `running_averager` keeps a total and a count over **everything** it has ever received.')
+print('#' * 52 + '  Here are coroutines in the same style (`result = yield ...`) that aggregate over a window:')
+print('#' * 52 + '  - sliding windows of the last `size` values,')
+print('#' * 52 + '  - tumbling windows: consecutive, non overlapping blocks of `size` values,')
+print('#' * 52 + '  - time windows: the values received in the last `seconds`.')
+print('#' * 52 + '  Every update is O(1) (amortized), and memory is bounded by the size of the window.')
+
+import math
+import operator
+from collections import deque
+
+
+def coroutine(gen_fn):
+    def inner(*args, **kwargs):
+        gen = gen_fn(*args, **kwargs)
+        next(gen)
+        return gen
+    return inner
+
+
+@coroutine
+def sliding_sum(size):
+    window = deque(maxlen=size)
+    total = 0
+    updates = 0
+    result = None
+    while True:
+        value = yield result
+        if len(window) == size:
+            total -= window[0]
+        window.append(value)
+        total += value
+        updates += 1
+        if updates == size:
+            # start again from the exact sum once per window, so float rounding errors do not pile up
+            total = sum(window)
+            updates = 0
+        result = total
+
+
+@coroutine
+def sliding_mean(size):
+    window = deque(maxlen=size)
+    total = 0
+    updates = 0
+    result = None
+    while True:
+        value = yield result
+        if len(window) == size:
+            total -= window[0]
+        window.append(value)
+        total += value
+        updates += 1
+        if updates == size:
+            total = sum(window)
+            updates = 0
+        result = total / len(window)
+
+
+@coroutine
+def sliding_max(size):
+    # (index, value) pairs with decreasing values: the front is the maximum of the window
+    window = deque()
+    i = 0
+    result = None
+    while True:
+        value = yield result
+        while window and window[-1][1] <= value:
+            window.pop()
+        window.append((i, value))
+        if window[0][0] <= i - size:
+            window.popleft()
+        result = window[0][1]
+        i += 1
+
+
+@coroutine
+def sliding_min(size):
+    window = deque()
+    i = 0
+    result = None
+    while True:
+        value = yield result
+        while window and window[-1][1] >= value:
+            window.pop()
+        window.append((i, value))
+        if window[0][0] <= i - size:
+            window.popleft()
+        result = window[0][1]
+        i += 1
+
+
+@coroutine
+def sliding_variance(size):
+    # Welford's algorithm, with the oldest value removed once the window is full
+    window = deque(maxlen=size)
+    mean = 0.0
+    m2 = 0.0
+    result = None
+    while True:
+        value = yield result
+        if len(window) == size:
+            old = window[0]
+            n = size - 1
+            if n:
+                delta = old - mean
+                mean -= delta / n
+                m2 -= delta * (old - mean)
+            else:
+                mean = m2 = 0.0
+        window.append(value)
+        n = len(window)
+        delta = value - mean
+        mean += delta / n
+        m2 += delta * (value - mean)
+        result = (mean, m2 / (n - 1) if n > 1 else 0.0)
+
+
+@coroutine
+def running_variance():
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    result = None
+    while True:
+        value = yield result
+        count += 1
+        delta = value - mean
+        mean += delta / count
+        m2 += delta * (value - mean)
+        result = (count, mean, m2 / (count - 1) if count > 1 else 0.0)
+
+
+@coroutine
+def ewma(alpha):
+    average = None
+    while True:
+        value = yield average
+        if average is None:
+            average = value
+        else:
+            average += alpha * (value - average)
+
+
+@coroutine
+def tumbling(size, combine, finish=None):
+    # yields the aggregate of the last completed window (None until the first one completes)
+    accumulated = None
+    count = 0
+    result = None
+    while True:
+        value = yield result
+        accumulated = value if count == 0 else combine(accumulated, value)
+        count += 1
+        if count == size:
+            result = accumulated if finish is None else finish(accumulated, count)
+            count = 0
+
+
+def tumbling_sum(size):
+    return tumbling(size, operator.add)
+
+
+def tumbling_mean(size):
+    return tumbling(size, operator.add, operator.truediv)
+
+
+def tumbling_min(size):
+    return tumbling(size, min)
+
+
+def tumbling_max(size):
+    return tumbling(size, max)
+
+
+print('#' * 52 + '  Time windows receive `(timestamp, value)` tuples, with timestamps that never go backwards:')
+
+
+@coroutine
+def time_sliding_mean(seconds):
+    window = deque()
+    total = 0
+    evicted = 0
+    result = None
+    while True:
+        timestamp, value = yield result
+        window.append((timestamp, value))
+        total += value
+        while window[0][0] <= timestamp - seconds:
+            total -= window.popleft()[1]
+            evicted += 1
+        if evicted > len(window):
+            total = sum(value for _, value in window)
+            evicted = 0
+        result = total / len(window)
+
+
+@coroutine
+def time_sliding_max(seconds):
+    window = deque()
+    result = None
+    while True:
+        timestamp, value = yield result
+        while window and window[-1][1] <= value:
+            window.pop()
+        window.append((timestamp, value))
+        while window[0][0] <= timestamp - seconds:
+            window.popleft()
+        result = window[0][1]
+
+
+@coroutine
+def time_sliding_min(seconds):
+    window = deque()
+    result = None
+    while True:
+        timestamp, value = yield result
+        while window and window[-1][1] >= value:
+            window.pop()
+        window.append((timestamp, value))
+        while window[0][0] <= timestamp - seconds:
+            window.popleft()
+        result = window[0][1]
+
+
+@coroutine
+def time_tumbling_mean(seconds):
+    # yields (window start, mean) for the last completed window
+    start = None
+    total = 0
+    count = 0
+    result = None
+    while True:
+        timestamp, value = yield result
+        window_start = timestamp - timestamp % seconds
+        if window_start != start:
+            if count:
+                result = (start, total / count)
+            start, total, count = window_start, 0, 0
+        total += value
+        count += 1
+
+
+@coroutine
+def fan_out(**aggregators):
+    result = None
+    while True:
+        value = yield result
+        result = {name: aggregator.send(value) for name, aggregator in aggregators.items()}
+
+
+def test_aggregates():
+    import random
+    import statistics
+
+    rnd = random.Random(0)
+    values = [rnd.uniform(-100, 100) for _ in range(500)]
+    size = 7
+
+    aggregators = {'sum': sliding_sum(size), 'mean': sliding_mean(size),
+                   'min': sliding_min(size), 'max': sliding_max(size),
+                   'variance': sliding_variance(size)}
+    for i, value in enumerate(values):
+        window = values[max(0, i - size + 1):i + 1]
+        assert math.isclose(aggregators['sum'].send(value), sum(window), abs_tol=1e-9)
+        assert math.isclose(aggregators['mean'].send(value), sum(window) / len(window), abs_tol=1e-9)
+        assert aggregators['min'].send(value) == min(window)
+        assert aggregators['max'].send(value) == max(window)
+        mean, variance = aggregators['variance'].send(value)
+        assert math.isclose(mean, statistics.mean(window), abs_tol=1e-9)
+        expected = statistics.variance(window) if len(window) > 1 else 0.0
+        assert math.isclose(variance, expected, rel_tol=1e-9, abs_tol=1e-9)
+
+    averager = running_variance()
+    for value in values:
+        count, mean, variance = averager.send(value)
+    assert count == len(values)
+    assert math.isclose(mean, statistics.mean(values))
+    assert math.isclose(variance, statistics.variance(values))
+
+    aggregator = tumbling_max(5)
+    results = [aggregator.send(value) for value in values]
+    assert results[4] == max(values[:5]) and results[-1] == max(values[-5:])
+    aggregator = tumbling_mean(5)
+    results = [aggregator.send(value) for value in values[:12]]
+    assert results[:4] == [None] * 4
+    assert math.isclose(results[4], sum(values[:5]) / 5)
+    assert results[5:9] == [results[4]] * 4
+    assert math.isclose(results[9], sum(values[5:10]) / 5)
+
+    aggregator = sliding_variance(1)
+    assert [aggregator.send(value) for value in (4, 8)] == [(4.0, 0.0), (8.0, 0.0)]
+
+    aggregator = ewma(0.5)
+    assert [aggregator.send(value) for value in (4, 8, 0)] == [4, 6, 3]
+
+    timestamps = sorted(rnd.uniform(0, 100) for _ in values)
+    aggregators = (time_sliding_mean(5), time_sliding_min(5), time_sliding_max(5))
+    for timestamp, value in zip(timestamps, values):
+        window = [v for t, v in zip(timestamps, values) if timestamp - 5 < t <= timestamp]
+        mean, low, high = (aggregator.send((timestamp, value)) for aggregator in aggregators)
+        assert math.isclose(mean, sum(window) / len(window), abs_tol=1e-9)
+        assert (low, high) == (min(window), max(window))
+
+    aggregator = time_tumbling_mean(10)
+    results = [aggregator.send((t, v)) for t, v in ((1, 1), (5, 3), (12, 10), (25, 7), (29, 1))]
+    assert results == [None, None, (0, 2), (10, 10), (10, 10)]
+
+
+test_aggregates()
+
+print('#' * 52 + '  #### Examples')
+
+values = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5, 8, 9, 7, 9]
+
+stats = fan_out(mean=sliding_mean(3), low=sliding_min(3), high=sliding_max(3),
+                ewma=ewma(0.5), tumbling=tumbling_sum(5))
+for value in values:
+    result = stats.send(value)
+    print(value, {name: round(v, 2) if v is not None else v for name, v in result.items()})
+
+print('#' * 52 + '  A time window over events that do not arrive at a regular pace:')
+
+events = [(0.0, 10), (0.5, 12), (0.7, 40), (2.9, 11), (3.0, 9), (3.4, 10), (6.0, 30)]
+mean = time_sliding_mean(2)
+high = time_sliding_max(2)
+for event in events:
+    print(event, round(mean.send(event), 2), high.send(event))
+
+print('#' * 52 + '  #### Benchmark: 10,000,000 updates per aggregate')
+
+import random
+from itertools import cycle, islice
+from time import perf_counter
+
+rnd = random.Random(0)
+samples = [rnd.random() for _ in range(10_000)]
+n = 10_000_000
+
+
+def run(aggregator, timed=False):
+    send = aggregator.send
+    start = perf_counter()
+    if timed:
+        for i, value in enumerate(islice(cycle(samples), n)):
+            send((i, value))
+    else:
+        for value in islice(cycle(samples), n):
+            send(value)
+    return perf_counter() - start
+
+
+def window_length(aggregator):
+    return len(aggregator.gi_frame.f_locals.get('window', ()))
+
+
+benchmarks = (('sliding_mean(1000)', sliding_mean, (1000,), False),
+              ('sliding_max(1000)', sliding_max, (1000,), False),
+              ('sliding_variance(1000)', sliding_variance, (1000,), False),
+              ('running_variance()', running_variance, (), False),
+              ('ewma(0.1)', ewma, (0.1,), False),
+              ('tumbling_mean(1000)', tumbling_mean, (1000,), False),
+              ('time_sliding_mean(1000)', time_sliding_mean, (1000,), True),
+              ('time_sliding_max(1000)', time_sliding_max, (1000,), True))
+
+print(f'{"aggregate":<24} {"seconds":>8} {"updates/sec":>12} {"window":>7}')
+for name, factory, args, timed in benchmarks:
+    aggregator = factory(*args)
+    elapsed = run(aggregator, timed)
+    print(f'{name:<24} {elapsed:>8.2f} {n / elapsed:>12,.0f} {window_length(aggregator):>7}')
@@ -0,0 +1,277 @@
+print('#' * 52 + '  ### Pipelines - Keyed Router')
+
+print('#' * 52 + '  `broadcast` sends every row to every target, and each target then throws away'
+                 '  the rows it does not want.')
+print('#' * 52 + '  When each target only wants the rows for one key (one make, one color, ...),'
+                 '  we can route instead:')
+print('#' * 52 + '  a key function picks the subpipeline for a row, and only that subpipeline receives it.')
+print('#' * 52 + '  Subpipelines are created on demand by a factory, and the least recently used ones'
+                 '  are closed when there are too many open at the same time.')
+
+import csv
+import os
+import tempfile
+from collections import OrderedDict
+from contextlib import ExitStack
+from operator import itemgetter
+
+
+def coroutine(fn):
+    def inner(*args, **kwargs):
+        g = fn(*args, **kwargs)
+        next(g)
+        return g
+    return inner
+
+
+@coroutine
+def route(key_fn, factory, max_open=None):
+    # factory(key, reopened) creates the subpipeline for key,
+    # reopened is True if an earlier subpipeline for that key was closed to make room
+    pipelines = OrderedDict()
+    seen = set()
+    try:
+        while True:
+            data_row = yield
+            key = key_fn(data_row)
+            target = pipelines.get(key)
+            if target is None:
+                # make room first, so no more than max_open subpipelines are ever open
+                if max_open is not None and len(pipelines) >= max_open:
+                    _, least_recent = pipelines.popitem(last=False)
+                    least_recent.close()
+                target = factory(key, key in seen)
+                seen.add(key)
+                pipelines[key] = target
+            elif max_open is not None:
+                pipelines.move_to_end(key)
+            target.send(data_row)
+    finally:
+        # close every subpipeline, even if closing one of them fails
+        with ExitStack() as stack:
+            for target in reversed(pipelines.values()):
+                stack.callback(target.close)
+
+
+def test_route():
+    received = []
+    events = []
+    open_keys = set()
+
+    @coroutine
+    def collect(key):
+        try:
+            while True:
+                received.append((key, (yield)))
+        finally:
+            open_keys.discard(key)
+            events.append(('close', key))
+
+    def factory(key, reopened):
+        assert len(open_keys) < 2, open_keys
+        open_keys.add(key)
+        events.append(('reopen' if reopened else 'open', key))
+        return collect(key)
+
+    router = route(lambda n: n % 3, factory, max_open=2)
+    for n in (0, 1, 3, 2, 4, 0):
+        router.send(n)
+    router.close()
+
+    assert received == [(0, 0), (1, 1), (0, 3), (2, 2), (1, 4), (0, 0)]
+    # 3 made key 0 the most recently used, so key 1 is closed before key 2 is opened
+    assert events == [('open', 0), ('open', 1), ('close', 1), ('open', 2),
+                      ('close', 0), ('reopen', 1), ('close', 2), ('reopen', 0),
+                      ('close', 1), ('close', 0)], events
+
+
+def test_route_close_failure():
+    closed = []
+
+    class Target:
+        def __init__(self, key):
+            self.key = key
+
+        def send(self, data_row):
+            pass
+
+        def close(self):
+            closed.append(self.key)
+            if self.key == 0:
+                raise RuntimeError('close failed')
+
+    router = route(lambda n: n, lambda key, reopened: Target(key))
+    for n in (0, 1, 2):
+        router.send(n)
+    try:
+        router.close()
+    except RuntimeError:
+        pass
+    else:
+        assert False, 'close error was swallowed'
+    assert closed == [0, 1, 2], closed
+
+
+test_route()
+test_route_close_failure()
+
+print('#' * 52 + '  #### Splitting car_data.csv into one file per make')
+
+
+def data_reader(f_name):
+    f = open(f_name)
+    try:
+        dialect = csv.Sniffer().sniff(f.read(2000))
+        f.seek(0)
+        reader = csv.reader(f, dialect=dialect)
+        yield from reader
+    finally:
+        f.close()
+
+
+idx_make = 0
+idx_model = 1
+idx_year = 2
+idx_vin = 3
+idx_color = 4
+
+headers = ('make', 'model', 'year', 'vin', 'color')
+
+converters = (str, str, int, str, str)
+
+
+def data_parser(f_name='car_data.csv'):
+    data = data_reader(f_name)
+    next(data)  # skip header row
+    for row in data:
+        parsed_row = [converter(item)
+                      for converter, item in zip(converters, row)]
+        yield parsed_row
+
+
+@coroutine
+def save_data(f_name, headers, append=False):
+    with open(f_name, 'a' if append else 'w', newline='') as f:
+        writer = csv.writer(f)
+        if not append:
+            writer.writerow(headers)
+        while True:
+            data_row = yield
+            writer.writerow(data_row)
+
+
+@coroutine
+def filter_data(filter_predicate, target):
+    while True:
+        data_row = yield
+        if filter_predicate(data_row):
+            target.send(data_row)
+
+
+@coroutine
+def broadcast(targets):
+    while True:
+        data_row = yield
+        for target in targets:
+            target.send(data_row)
+
+
+output_dir = tempfile.mkdtemp()
+
+
+def file_name(directory, make):
+    return os.path.join(directory, make.replace(' ', '_') + '.csv')
+
+
+def make_writer(directory, counters=None):
+    def factory(make, reopened):
+        if counters is not None:
+            counters['reopened' if reopened else 'opened'] += 1
+        return save_data(file_name(directory, make), headers, append=reopened)
+    return factory
+
+
+from collections import Counter
+from contextlib import contextmanager
+
+
+@contextmanager
+def pipeline(target):
+    try:
+        yield target
+    finally:
+        target.close()
+
+
+counters = Counter()
+with pipeline(route(itemgetter(idx_make), make_writer(output_dir, counters), max_open=10)) as pipe:
+    for row in data_parser():
+        pipe.send(row)
+
+makes = sorted(f_name for f_name in os.listdir(output_dir))
+print(f'{len(makes)} files, {dict(counters)}, never more than 10 open at a time')
+print(makes[:8])
+
+with open(file_name(output_dir, 'Ford')) as f:
+    for row in list(f)[:5]:
+        print(row.strip())
+
+print('#' * 52 + '  #### Timings')
+print('#' * 52 + '  The same split with `broadcast`, one filter per make: every row is checked by every filter.')
+
+from time import perf_counter
+
+rows = list(data_parser()) * 100  # 100,000 rows
+all_makes = sorted({row[idx_make] for row in rows})
+
+
+def run_broadcast(directory):
+    def make_filter(make):
+        return filter_data(lambda row: row[idx_make] == make,
+                           save_data(file_name(directory, make), headers))
+
+    filters = [make_filter(make) for make in all_makes]
+    broadcaster = broadcast(filters)
+    for row in rows:
+        broadcaster.send(row)
+    for target in filters:
+        target.close()
+
+
+def run_route(directory, max_open=None):
+    router = route(itemgetter(idx_make), make_writer(directory), max_open)
+    for row in rows:
+        router.send(row)
+    router.close()
+
+
+def timed(fn, *args):
+    directory = tempfile.mkdtemp(dir=output_dir)
+    start = perf_counter()
+    fn(directory, *args)
+    return perf_counter() - start, directory
+
+
+def same_output(directory_1, directory_2):
+    for make in all_makes:
+        with open(file_name(directory_1, make)) as f_1, open(file_name(directory_2, make)) as f_2:
+            if f_1.read() != f_2.read():
+                return False
+    return True
+
+
+print(f'{len(all_makes)} makes, {len(rows):,} rows')
+print(f'{"method":<24} {"seconds":>8}')
+elapsed, expected = timed(run_broadcast)
+print(f'{"broadcast + filters":<24} {elapsed:>8.3f}')
+for max_open in (None, 20, 5):
+    elapsed, directory = timed(run_route, max_open)
+    assert same_output(expected, directory)
+    print(f'{f"route, max_open={max_open}":<24} {elapsed:>8.3f}')
+
+print('#' * 52 + '  A small `max_open` keeps the number of file handles bounded,'
+                 '  at the cost of reopening files when the keys are spread out.')
+
+import shutil
+
+shutil.rmtree(output_dir)
@@ -0,0 +1,232 @@
+print('#' * 52 + '  ### Application - Dialect Detection')
+
+print('#' * 52 + '  All our readers start with `csv.Sniffer().sniff(f.read(2000))` followed by `f.seek(0)`.')
+print('#' * 52 + '  On a directory of many small files, sniffing can cost more than the parsing itself.')
+print('#' * 52 + '  Two things help:')
+print('#' * 52 + '  - a fast path that only tries a few candidate delimiters, and falls back to `csv.Sniffer`'
+                 '  when the answer is not clear cut,')
+print('#' * 52 + '  - a persistent cache of the detected dialects, keyed by (path, size, modification time).')
+
+import csv
+import json
+import os
+
+
+def make_dialect(delimiter, quotechar='"', doublequote=True, skipinitialspace=False, escapechar=None):
+    return type('SniffedDialect', (csv.Dialect,),
+                {'delimiter': delimiter, 'quotechar': quotechar, 'doublequote': doublequote,
+                 'skipinitialspace': skipinitialspace, 'escapechar': escapechar,
+                 'lineterminator': '\r\n', 'quoting': csv.QUOTE_MINIMAL})
+
+
+def dialect_params(dialect):
+    return {'delimiter': dialect.delimiter, 'quotechar': dialect.quotechar,
+            'doublequote': dialect.doublequote, 'skipinitialspace': dialect.skipinitialspace,
+            'escapechar': dialect.escapechar}
+
+
+def fast_sniff(sample, candidates=(',', ';', '\t', '|')):
+    lines = sample.splitlines(keepends=True)
+    if len(lines) > 1 and not sample.endswith(('\n', '\r')):
+        lines.pop()  # the sample most likely cut the last line short
+    if not lines:
+        return None
+    found = None
+    for delimiter in candidates:
+        if delimiter not in lines[0]:
+            continue
+        # the csv module takes care of quoted fields, even across lines
+        reader = csv.reader(lines, delimiter=delimiter)
+        width = len(next(reader))
+        if width < 2 or any(len(row) != width for row in reader):
+            continue
+        if found is not None:
+            return None  # more than one candidate fits: ambiguous
+        found = delimiter
+    if found is None:
+        return None
+    # like csv.Sniffer: a space after every delimiter on the first line means skipinitialspace
+    skipinitialspace = lines[0].count(found) == lines[0].count(found + ' ')
+    return make_dialect(found, skipinitialspace=skipinitialspace)
+
+
+class DialectCache:
+    def __init__(self, f_name=None, sample_size=2000):
+        self.f_name = f_name
+        self.sample_size = sample_size
+        self._entries = {}
+        self._dirty = False
+        self.stats = {'hits': 0, 'fast': 0, 'fallback': 0}
+        if f_name is not None and os.path.exists(f_name):
+            with open(f_name) as f:
+                self._entries = json.load(f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.save()
+        return False
+
+    def detect(self, f_name):
+        path = os.path.abspath(f_name)
+        stat = os.stat(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            self.stats['hits'] += 1
+            return make_dialect(**entry['dialect'])
+
+        with open(path) as f:
+            sample = f.read(self.sample_size)
+        dialect = fast_sniff(sample)
+        if dialect is not None:
+            self.stats['fast'] += 1
+        else:
+            self.stats['fallback'] += 1
+            dialect = csv.Sniffer().sniff(sample)
+        self._entries[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                               'dialect': dialect_params(dialect)}
+        self._dirty = True
+        return dialect
+
+    def save(self):
+        if self.f_name is None or not self._dirty:
+            return
+        temp_name = self.f_name + '.tmp'
+        with open(temp_name, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(temp_name, self.f_name)
+        self._dirty = False
+
+
+def parse_data(f_name, dialects):
+    with open(f_name) as f:
+        reader = csv.reader(f, dialect=dialects.detect(f_name))
+        next(reader)  # skip header row
+        yield from reader
+
+
+def parse_data_sniffer(f_name):
+    f = open(f_name)
+    try:
+        dialect = csv.Sniffer().sniff(f.read(2000))
+        f.seek(0)
+        next(f)  # skip header row
+        yield from csv.reader(f, dialect=dialect)
+    finally:
+        f.close()
+
+
+import tempfile
+import time
+
+
+def test_dialect_detection():
+    for f_name in ('cars.csv', 'car_data.csv', 'cars_2014.csv'):
+        with open(f_name) as f:
+            sample = f.read(2000)
+        assert fast_sniff(sample).delimiter == csv.Sniffer().sniff(sample).delimiter, f_name
+
+    assert fast_sniff('a;b;c\n1;"2;3";4\n5;6;7\n').delimiter == ';'
+    assert fast_sniff('a,b\n"x\ny",2\n3,4\n').delimiter == ','
+    assert fast_sniff('just one column\nper line\n') is None
+    assert fast_sniff('a,b;c\n1,2;3\n') is None, 'both , and ; fit'
+
+    sample = 'make, model, year\nFord, Focus, 2012\nBMW, X5, 2015\n'
+    dialect = fast_sniff(sample)
+    assert dialect.skipinitialspace and csv.Sniffer().sniff(sample).skipinitialspace
+    assert list(csv.reader(sample.splitlines(), dialect=dialect))[1] == ['Ford', 'Focus', '2012']
+    assert not fast_sniff('a, b,c\n1,2,3\n').skipinitialspace
+
+    directory = tempfile.mkdtemp()
+    try:
+        data_file = os.path.join(directory, 'data.csv')
+        cache_file = os.path.join(directory, 'dialects.json')
+        with open(data_file, 'w') as f:
+            f.write('a;b\n1;2\n')
+
+        with DialectCache(cache_file) as dialects:
+            assert dialects.detect(data_file).delimiter == ';'
+            assert dialects.detect(data_file).delimiter == ';'
+            assert dialects.stats == {'hits': 1, 'fast': 1, 'fallback': 0}
+
+        dialects = DialectCache(cache_file)
+        assert list(parse_data(data_file, dialects)) == [['1', '2']]
+        assert dialects.stats['hits'] == 1, 'the cache should persist'
+
+        time.sleep(0.01)
+        with open(data_file, 'w') as f:
+            f.write('a,b\n1,2\n')
+        assert dialects.detect(data_file).delimiter == ',', 'a modified file is sniffed again'
+    finally:
+        import shutil
+        shutil.rmtree(directory)
+
+
+test_dialect_detection()
+
+print('#' * 52 + '  Both paths find the same dialect for our files:')
+
+dialects = DialectCache()
+for f_name in ('cars.csv', 'car_data.csv', 'cars_2014.csv'):
+    print(f'{f_name:<14} {dialects.detect(f_name).delimiter!r}')
+print(dialects.stats)
+
+print('#' * 52 + '  #### Timings: 2,000 small csv files')
+
+output_dir = tempfile.mkdtemp()
+cache_file = os.path.join(output_dir, 'dialects.json')
+
+samples = []
+for f_name in ('cars.csv', 'car_data.csv'):
+    with open(f_name) as f:
+        samples.append(''.join(f.readlines()[:30]))
+
+files = []
+for i in range(2_000):
+    f_name = os.path.join(output_dir, f'file_{i}.csv')
+    with open(f_name, 'w') as f:
+        f.write(samples[i % 2])
+    files.append(f_name)
+
+
+def read_all(parse, *args):
+    start = time.perf_counter()
+    rows = sum(1 for f_name in files for _ in parse(f_name, *args))
+    return time.perf_counter() - start, rows
+
+
+delimiters = {f_name: ';' if i % 2 == 0 else ',' for i, f_name in enumerate(files)}
+
+
+def no_sniff(f_name):
+    with open(f_name) as f:
+        next(f)
+        yield from csv.reader(f, delimiter=delimiters[f_name])
+
+
+print(f'{"method":<34} {"seconds":>8}')
+elapsed, expected = read_all(parse_data_sniffer)
+print(f'{"csv.Sniffer on every open":<34} {elapsed:>8.3f}')
+
+elapsed, rows = read_all(parse_data, DialectCache())
+assert rows == expected
+print(f'{"fast sniff, no cache":<34} {elapsed:>8.3f}')
+
+with DialectCache(cache_file) as dialects:
+    elapsed, rows = read_all(parse_data, dialects)
+assert rows == expected
+print(f'{"fast sniff, filling the cache":<34} {elapsed:>8.3f}')
+
+dialects = DialectCache(cache_file)  # as if in a new process
+elapsed, rows = read_all(parse_data, dialects)
+assert rows == expected and dialects.stats['hits'] == len(files)
+print(f'{"cache loaded from disk":<34} {elapsed:>8.3f}')
+
+elapsed, rows = read_all(no_sniff)
+assert rows == expected
+print(f'{"parsing only (dialect known)":<34} {elapsed:>8.3f}')
+
+import shutil
+
+shutil.rmtree(output_dir)
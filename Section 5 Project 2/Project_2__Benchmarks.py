@@ -0,0 +1,217 @@
+import contextlib
+import importlib.util
+import io
+import json
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+
+root = Path(__file__).resolve().parent.parent
+
+variant_files = (sorted((root / 'Section 3 Project 1').glob('*.py'))
+                 + sorted((root / 'Section 5 Project 2').glob('Project_2__Solution_*.py')))
+
+properties = ('interior_angle', 'side_length', 'apothem', 'area', 'perimeter')
+
+
+def variant_name(path):
+    project = 'P1' if path.parent.name.startswith('Section 3') else 'P2'
+    goal = path.stem.split('Goal')[-1].strip(' _')
+    return f'{project} Goal {goal}'
+
+
+def load_variant(path, index):
+    spec = importlib.util.spec_from_file_location(f'polygon_variant_{index}', path)
+    module = importlib.util.module_from_spec(spec)
+    # the solution files print their demos and run their tests at import time
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    return module
+
+
+def is_variant(module):
+    polygons = getattr(module, 'Polygons', None)
+    if polygons is not None:
+        # early Polygons drafts only implement len and repr
+        return hasattr(polygons, '__iter__') or hasattr(polygons, '__getitem__')
+    return hasattr(module, 'Polygon')
+
+
+def load_variants(paths=variant_files):
+    variants = {}
+    for index, path in enumerate(paths):
+        module = load_variant(path, index)
+        if is_variant(module):
+            variants[variant_name(path)] = module
+    return variants
+
+
+def build(module, m, R):
+    if hasattr(module, 'Polygons'):
+        return module.Polygons(m, R)
+    # Polygon only variants: the eager equivalent of Polygons(m, R)
+    return [module.Polygon(n, R) for n in range(3, m + 1)]
+
+
+def timed(fn):
+    start = perf_counter()
+    result = fn()
+    return perf_counter() - start, result
+
+
+def best_of(fn, m):
+    repeat = 5 if m <= 10_000 else 1
+    return min(timed(fn)[0] for _ in range(repeat))
+
+
+def access_properties(polygons):
+    count = 0
+    for p in polygons:
+        for prop in properties:
+            getattr(p, prop)
+        count += len(properties)
+    return count
+
+
+def iterate(polygons):
+    for _ in polygons:
+        pass
+
+
+def max_efficiency(module, m, R):
+    # build a fresh collection so lazily cached results are not reused
+    collection = build(module, m, R)
+    # checking the class, hasattr on the instance would compute the property
+    if not hasattr(type(collection), 'max_efficiency_polygon'):
+        return None
+    try:
+        elapsed, _ = timed(lambda: collection.max_efficiency_polygon)
+    except AttributeError:
+        return 'error'
+    return elapsed
+
+
+def peak_memory(module, m, R):
+    tracemalloc.start()
+    try:
+        polygons = build(module, m, R)
+        iterate(polygons)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_variant(module, m, R=1):
+    result = {'m': m}
+    result['construct'] = best_of(lambda: build(module, m, R), m)
+
+    polygons = build(module, m, R)
+    elapsed, count = timed(lambda: access_properties(polygons))
+    result['props_per_sec'] = count / elapsed if elapsed else float('inf')
+
+    result['max_efficiency'] = max_efficiency(module, m, R)
+    result['iterate'] = best_of(lambda: iterate(build(module, m, R)), m)
+    result['peak_memory'] = peak_memory(module, m, R)
+    return result
+
+
+def run_benchmarks(ms=(10, 100, 1_000, 10_000, 100_000, 1_000_000), variants=None):
+    if variants is None:
+        variants = load_variants()
+    results = {}
+    for name, module in variants.items():
+        results[name] = [benchmark_variant(module, m) for m in ms]
+    return results
+
+
+def format_seconds(value):
+    if value is None:
+        return 'n/a'
+    if isinstance(value, str):
+        return value
+    return f'{value * 1000:.3f}'
+
+
+def print_results(results):
+    header = (f'{"variant":<14} {"m":>9} {"construct ms":>13} {"props/s":>12} '
+              f'{"max_eff ms":>11} {"iterate ms":>11} {"peak KiB":>10}')
+    print(header)
+    print('-' * len(header))
+    for name, rows in results.items():
+        for row in rows:
+            print(f'{name:<14} {row["m"]:>9} {format_seconds(row["construct"]):>13} '
+                  f'{row["props_per_sec"]:>12,.0f} '
+                  f'{format_seconds(row["max_efficiency"]):>11} '
+                  f'{format_seconds(row["iterate"]):>11} '
+                  f'{row["peak_memory"] / 1024:>10,.1f}')
+
+
+def save_results(results, f_name):
+    with open(f_name, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def print_regressions(regressions, limit=5):
+    print(f'{len(regressions)} regressions')
+    for name, m, key, old_value, new_value in regressions[:limit]:
+        print(f'  {name:<14} {m:>9} {key:<15} {old_value:>14.6g} -> {new_value:.6g}')
+
+
+def find_regressions(results, baseline, threshold=1.25):
+    timings = ('construct', 'max_efficiency', 'iterate')
+    regressions = []
+    for name, rows in results.items():
+        baseline_rows = {row['m']: row for row in baseline.get(name, ())}
+        for row in rows:
+            old = baseline_rows.get(row['m'])
+            if old is None:
+                continue
+            for key in timings:
+                new_value, old_value = row[key], old[key]
+                if not isinstance(new_value, float) or not isinstance(old_value, float):
+                    continue
+                if new_value > old_value * threshold:
+                    regressions.append((name, row['m'], key, old_value, new_value))
+            if row['props_per_sec'] * threshold < old['props_per_sec']:
+                regressions.append((name, row['m'], 'props_per_sec',
+                                    old['props_per_sec'], row['props_per_sec']))
+    return regressions
+
+
+print('#' * 52 + '  Loading the Polygon / Polygons variants from Project 1 and Project 2:')
+
+variants = load_variants()
+print(list(variants))
+
+print('#' * 52 + '  Comparison table:')
+
+results = run_benchmarks(ms=(10, 1_000, 100_000), variants=variants)
+print_results(results)
+
+print('#' * 52 + '  To check for regressions, save a baseline and compare later runs against it:')
+
+import os
+import shutil
+import tempfile
+
+output_dir = tempfile.mkdtemp()
+baseline_file = os.path.join(output_dir, 'polygon_benchmarks.json')
+save_results(results, baseline_file)
+
+with open(baseline_file) as f:
+    baseline = json.load(f)
+# nothing changed in between: whatever is listed is noise of more than 25% between two runs,
+# which is what the threshold has to be set against on a given machine
+print_regressions(find_regressions(run_benchmarks(ms=(10, 1_000, 100_000), variants=variants), baseline))
+
+print('#' * 52 + '  Against a baseline where every variant was twice as fast, each measurement is flagged:')
+
+faster = {name: [{**row,
+                  'construct': row['construct'] / 2,
+                  'iterate': row['iterate'] / 2,
+                  'props_per_sec': row['props_per_sec'] * 2}
+                 for row in rows]
+          for name, rows in baseline.items()}
+print_regressions(find_regressions(results, faster))
+
+shutil.rmtree(output_dir)
@@ -0,0 +1,324 @@
+import math
+from bisect import bisect_left, bisect_right
+from functools import total_ordering
+from operator import itemgetter
+
+
+@total_ordering
+class Polygon:
+    def __init__(self, n, R):
+        if n < 3:
+            raise ValueError('Polygon must have at least 3 vertices.')
+        self._n = n
+        self._R = R
+
+        self._interior_angle = None
+        self._side_length = None
+        self._apothem = None
+        self._area = None
+        self._perimeter = None
+
+    def __repr__(self):
+        return f'Polygon(n={self._n}, R={self._R})'
+
+    @property
+    def count_vertices(self):
+        return self._n
+
+    @property
+    def count_edges(self):
+        return self._n
+
+    @property
+    def circumradius(self):
+        return self._R
+
+    @property
+    def interior_angle(self):
+        if self._interior_angle is None:
+            self._interior_angle = (self._n - 2) * 180 / self._n
+        return self._interior_angle
+
+    @property
+    def side_length(self):
+        if self._side_length is None:
+            self._side_length = 2 * self._R * math.sin(math.pi / self._n)
+        return self._side_length
+
+    @property
+    def apothem(self):
+        if self._apothem is None:
+            self._apothem = self._R * math.cos(math.pi / self._n)
+        return self._apothem
+
+    @property
+    def area(self):
+        if self._area is None:
+            self._area = self._n / 2 * self.side_length * self.apothem
+        return self._area
+
+    @property
+    def perimeter(self):
+        if self._perimeter is None:
+            self._perimeter = self._n * self.side_length
+        return self._perimeter
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return (self.count_edges == other.count_edges
+                    and self.circumradius == other.circumradius)
+        else:
+            return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, self.__class__):
+            return ((self.count_vertices, self.circumradius)
+                    > (other.count_vertices, other.circumradius))
+        else:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash((self._n, self._R))
+
+
+class Polygons:
+    def __init__(self, m, R):
+        if m < 3:
+            raise ValueError('m must be greater than 3')
+        self._m = m
+        self._R = R
+        self._max_efficiency_polygon = None
+
+    def __len__(self):
+        return self._m - 2
+
+    def __repr__(self):
+        return f'Polygons(m={self._m}, R={self._R})'
+
+    def __iter__(self):
+        return PolygonsIterator(self._m, self._R)
+
+    @property
+    def max_efficiency_polygon(self):
+        if self._max_efficiency_polygon is None:
+            sorted_polygons = sorted(PolygonsIterator(self._m, self._R),
+                                     key=lambda p: p.area / p.perimeter,
+                                     reverse=True)
+            self._max_efficiency_polygon = sorted_polygons[0]
+        return self._max_efficiency_polygon
+
+
+class PolygonsIterator:
+    def __init__(self, m, R):
+        if m < 3:
+            raise ValueError('m must be greater than 3')
+        self._m = m
+        self._R = R
+        self._i = 3
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._i > self._m:
+            raise StopIteration
+        else:
+            result = Polygon(self._i, self._R)
+            self._i += 1
+            return result
+
+
+_INSERT_LIMIT = 64
+
+
+class PolygonIndex:
+    def __init__(self, polygons=(), attributes=('area', 'perimeter')):
+        self._attributes = tuple(attributes)
+        self._polygons = set()
+        self._pending = []
+        self._keys = {attr: [] for attr in self._attributes}
+        self._values = {attr: [] for attr in self._attributes}
+        self.update(polygons)
+
+    def __len__(self):
+        return len(self._polygons)
+
+    def __contains__(self, polygon):
+        return polygon in self._polygons
+
+    def __iter__(self):
+        return iter(sorted(self._polygons))
+
+    def __repr__(self):
+        return f'PolygonIndex(size={len(self)}, attributes={self._attributes})'
+
+    def add(self, polygon):
+        if polygon not in self._polygons:
+            self._polygons.add(polygon)
+            self._pending.append(polygon)
+
+    def update(self, polygons):
+        for polygon in polygons:
+            self.add(polygon)
+
+    def _flush(self):
+        # new polygons are only merged into the sorted keys when we next query,
+        # so bulk loads cost a single (mostly pre-sorted) sort per attribute,
+        # and a few adds between queries are inserted in place
+        if not self._pending:
+            return
+        if len(self._pending) <= _INSERT_LIMIT:
+            for attr in self._attributes:
+                keys = self._keys[attr]
+                values = self._values[attr]
+                for p in self._pending:
+                    key = getattr(p, attr)
+                    i = bisect_right(keys, key)
+                    keys.insert(i, key)
+                    values.insert(i, p)
+            self._pending.clear()
+            return
+        for attr in self._attributes:
+            pairs = list(zip(self._keys[attr], self._values[attr]))
+            pairs.extend((getattr(p, attr), p) for p in self._pending)
+            pairs.sort(key=itemgetter(0))
+            self._keys[attr] = [key for key, _ in pairs]
+            self._values[attr] = [p for _, p in pairs]
+        self._pending.clear()
+
+    def _check_attribute(self, attr):
+        if attr not in self._keys:
+            raise ValueError(f'{attr} is not indexed, '
+                             f'indexed attributes: {self._attributes}')
+
+    def between(self, attr, low, high):
+        self._check_attribute(attr)
+        self._flush()
+        keys = self._keys[attr]
+        start = bisect_left(keys, low)
+        stop = bisect_right(keys, high)
+        return self._values[attr][start:stop]
+
+    def below(self, attr, value):
+        self._check_attribute(attr)
+        self._flush()
+        stop = bisect_left(self._keys[attr], value)
+        return self._values[attr][:stop]
+
+    def above(self, attr, value):
+        self._check_attribute(attr)
+        self._flush()
+        start = bisect_right(self._keys[attr], value)
+        return self._values[attr][start:]
+
+    def count_between(self, attr, low, high):
+        self._check_attribute(attr)
+        self._flush()
+        keys = self._keys[attr]
+        return bisect_right(keys, high) - bisect_left(keys, low)
+
+
+def test_polygon():
+    p1 = Polygon(3, 10)
+    p2 = Polygon(10, 10)
+    p3 = Polygon(15, 10)
+    p4 = Polygon(15, 100)
+    p5 = Polygon(15, 100)
+
+    assert p2 > p1
+    assert p2 < p3
+    assert p3 != p4
+    assert p1 != p4
+    assert p4 == p5
+
+    assert p3 < p4, 'same n, ordering should fall back to R'
+    assert p4 >= p5 and p4 <= p5
+    assert not p4 < p5 and not p4 > p5
+
+    assert hash(p4) == hash(p5)
+    assert len({p1, p2, p3, p4, p5}) == 4
+    assert Polygon(4, 1) == Polygon(4, 1.0)
+    assert hash(Polygon(4, 1)) == hash(Polygon(4, 1.0))
+
+    lookup = {p4: 'big'}
+    assert lookup[p5] == 'big'
+
+    assert sorted([p4, p1, p3, p2]) == [p1, p2, p3, p4]
+
+
+def test_polygon_index():
+    abs_tol = 0.001
+    rel_tol = 0.001
+
+    polygons = [Polygon(n, R) for n in range(3, 50) for R in (1, 2, 5)]
+    index = PolygonIndex(polygons)
+    index.update(polygons)  # duplicates are ignored
+    assert len(index) == len(polygons)
+    assert Polygon(10, 2) in index
+
+    low, high = 2, 10
+    expected = sorted(p for p in polygons if low <= p.area <= high)
+    assert sorted(index.between('area', low, high)) == expected
+    assert index.count_between('area', low, high) == len(expected)
+
+    result = index.between('area', low, high)
+    assert all(a.area <= b.area for a, b in zip(result, result[1:]))
+
+    expected = sorted(p for p in polygons if p.perimeter < 6)
+    assert sorted(index.below('perimeter', 6)) == expected
+
+    expected = sorted(p for p in polygons if p.perimeter > 30)
+    assert sorted(index.above('perimeter', 30)) == expected
+
+    index.add(Polygon(1000, 10))
+    largest = index.above('area', 314)
+    assert largest == [Polygon(1000, 10)]
+    assert math.isclose(largest[0].area, 100 * math.pi,
+                        rel_tol=rel_tol, abs_tol=abs_tol)
+
+    # adds interleaved with queries are inserted in place, in order
+    index = PolygonIndex()
+    added = []
+    for n in range(3, 200):
+        for R in (3, 1, 2):
+            index.add(Polygon(n, R))
+            added.append(Polygon(n, R))
+        assert index.count_between('area', 0, math.inf) == len(added)
+    assert index.below('area', math.inf) == sorted(added, key=lambda p: p.area)
+    assert index.below('perimeter', math.inf) == sorted(added, key=lambda p: p.perimeter)
+
+    try:
+        index.between('apothem', 0, 1)
+        assert False, 'querying a non-indexed attribute should raise'
+    except ValueError:
+        pass
+
+
+test_polygon()
+test_polygon_index()
+
+print('#' * 52 + '  Polygons are now hashable, so we can de-duplicate them with a set:')
+
+polygons = [Polygon(n, R) for n in (3, 4, 4, 5) for R in (1, 1.0, 2)]
+print(len(polygons), len(set(polygons)))
+
+print('#' * 52 + '  And they are ordered by (n, R), consistent with equality:')
+
+print(sorted(set(polygons)))
+
+print('#' * 52 + '  The PolygonIndex keeps polygons sorted by area and perimeter for range queries:')
+
+index = PolygonIndex(Polygon(n, R) for n in range(3, 200) for R in range(1, 50))
+print(index)
+print(index.between('area', 10, 10.5))
+print(index.count_between('area', 100, 200))
+print(index.below('perimeter', 6.2))
+
+print('#' * 52 + '  Timings: linear scan vs index lookup')
+
+from timeit import timeit
+
+polygons = list(index)
+
+print(timeit('[p for p in polygons if 100 <= p.area <= 101]', globals=globals(), number=10))
+print(timeit("index.between('area', 100, 101)", globals=globals(), number=10))
@@ -0,0 +1,392 @@
+import decimal
+import math
+import sys
+from contextvars import ContextVar
+from decimal import Decimal
+from functools import lru_cache, total_ordering
+
+# number of guard digits used for intermediate results in precision mode
+GUARD_DIGITS = 5
+
+# active decimal precision, None means properties are computed with floats;
+# a ContextVar, so that each thread (and asyncio task) has its own mode
+_active_prec = ContextVar('active_prec', default=None)
+# (token, localcontext) for each active precision block, innermost last: kept per
+# thread and task too, so one precision instance can be shared and nested
+_entered = ContextVar('precision_entered', default=())
+
+
+class precision:
+    def __init__(self, prec=None, *, rel_tol=None):
+        if prec is None and rel_tol is None:
+            raise ValueError('either prec or rel_tol must be specified')
+        if prec is None:
+            prec = math.ceil(-math.log10(rel_tol)) + 1
+        self.prec = prec
+        self.exact = prec > sys.float_info.dig
+
+    def __enter__(self):
+        # fast path: floats already carry enough digits for this precision
+        token = _active_prec.set(self.prec if self.exact else None)
+        # arithmetic on the returned decimals runs at the same precision
+        local_context = decimal.localcontext(prec=self.prec)
+        local_context.__enter__()
+        _entered.set(_entered.get() + ((token, local_context),))
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        *outer, (token, local_context) = _entered.get()
+        _entered.set(tuple(outer))
+        _active_prec.reset(token)
+        local_context.__exit__(exc_type, exc_value, exc_traceback)
+        return False
+
+
+@lru_cache()
+def decimal_pi(prec):
+    with decimal.localcontext(prec=prec + 2):
+        three = Decimal(3)
+        lasts, t, s, n, na, d, da = 0, three, 3, 1, 0, 0, 24
+        while s != lasts:
+            lasts = s
+            n, na = n + na, na + 8
+            d, da = d + da, da + 32
+            t = (t * n) / d
+            s += t
+    with decimal.localcontext(prec=prec):
+        return +s
+
+
+def decimal_sin(x):
+    i, lasts, s, fact, num, sign = 1, 0, x, 1, x, 1
+    while s != lasts:
+        lasts = s
+        i += 2
+        fact *= i * (i - 1)
+        num *= x * x
+        sign *= -1
+        s += num / fact * sign
+    return s
+
+
+def decimal_cos(x):
+    i, lasts, s, fact, num, sign = 0, 0, 1, 1, 1, 1
+    while s != lasts:
+        lasts = s
+        i += 2
+        fact *= i * (i - 1)
+        num *= x * x
+        sign *= -1
+        s += num / fact * sign
+    return s
+
+
+def exact_properties(n, R, prec):
+    with decimal.localcontext(prec=prec + GUARD_DIGITS):
+        n = Decimal(n)
+        R = Decimal(R)
+        angle = decimal_pi(prec + GUARD_DIGITS) / n
+        side_length = 2 * R * decimal_sin(angle)
+        apothem = R * decimal_cos(angle)
+        values = {
+            'interior_angle': (n - 2) * 180 / n,
+            'side_length': side_length,
+            'apothem': apothem,
+            'area': n / 2 * side_length * apothem,
+            'perimeter': n * side_length,
+        }
+    with decimal.localcontext(prec=prec):
+        return {name: +value for name, value in values.items()}
+
+
+@total_ordering
+class Polygon:
+    def __init__(self, n, R):
+        if n < 3:
+            raise ValueError('Polygon must have at least 3 vertices.')
+        self._n = n
+        self._R = R
+
+        self._interior_angle = None
+        self._side_length = None
+        self._apothem = None
+        self._area = None
+        self._perimeter = None
+        self._exact_values = {}
+
+    def __repr__(self):
+        return f'Polygon(n={self._n}, R={self._R})'
+
+    def _exact(self, name, prec):
+        values = self._exact_values.get(prec)
+        if values is None:
+            values = exact_properties(self._n, self._R, prec)
+            self._exact_values[prec] = values
+        return values[name]
+
+    @property
+    def count_vertices(self):
+        return self._n
+
+    @property
+    def count_edges(self):
+        return self._n
+
+    @property
+    def circumradius(self):
+        return self._R
+
+    @property
+    def interior_angle(self):
+        prec = _active_prec.get()
+        if prec is not None:
+            return self._exact('interior_angle', prec)
+        if self._interior_angle is None:
+            self._interior_angle = (self._n - 2) * 180 / self._n
+        return self._interior_angle
+
+    @property
+    def side_length(self):
+        prec = _active_prec.get()
+        if prec is not None:
+            return self._exact('side_length', prec)
+        if self._side_length is None:
+            self._side_length = 2 * self._R * math.sin(math.pi / self._n)
+        return self._side_length
+
+    @property
+    def apothem(self):
+        prec = _active_prec.get()
+        if prec is not None:
+            return self._exact('apothem', prec)
+        if self._apothem is None:
+            self._apothem = self._R * math.cos(math.pi / self._n)
+        return self._apothem
+
+    @property
+    def area(self):
+        prec = _active_prec.get()
+        if prec is not None:
+            return self._exact('area', prec)
+        if self._area is None:
+            self._area = self._n / 2 * self.side_length * self.apothem
+        return self._area
+
+    @property
+    def perimeter(self):
+        prec = _active_prec.get()
+        if prec is not None:
+            return self._exact('perimeter', prec)
+        if self._perimeter is None:
+            self._perimeter = self._n * self.side_length
+        return self._perimeter
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return (self.count_edges == other.count_edges
+                    and self.circumradius == other.circumradius)
+        else:
+            return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, self.__class__):
+            return ((self.count_vertices, self.circumradius)
+                    > (other.count_vertices, other.circumradius))
+        else:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash((self._n, self._R))
+
+    def isclose(self, other, *, rel_tol=1e-09, abs_tol=0.0):
+        # __eq__ has to stay exact to agree with __hash__,
+        # use this when circumradii come out of float computations
+        if isinstance(other, self.__class__):
+            return (self.count_edges == other.count_edges
+                    and math.isclose(self.circumradius, other.circumradius,
+                                     rel_tol=rel_tol, abs_tol=abs_tol))
+        else:
+            return NotImplemented
+
+
+class Polygons:
+    def __init__(self, m, R):
+        if m < 3:
+            raise ValueError('m must be greater than 3')
+        self._m = m
+        self._R = R
+        self._max_efficiency_polygon = {}
+
+    def __len__(self):
+        return self._m - 2
+
+    def __repr__(self):
+        return f'Polygons(m={self._m}, R={self._R})'
+
+    def __iter__(self):
+        return PolygonsIterator(self._m, self._R)
+
+    @property
+    def max_efficiency_polygon(self):
+        # the winner can differ between float and decimal computations
+        prec = _active_prec.get()
+        if prec not in self._max_efficiency_polygon:
+            sorted_polygons = sorted(PolygonsIterator(self._m, self._R),
+                                     key=lambda p: p.area / p.perimeter,
+                                     reverse=True)
+            self._max_efficiency_polygon[prec] = sorted_polygons[0]
+        return self._max_efficiency_polygon[prec]
+
+
+class PolygonsIterator:
+    def __init__(self, m, R):
+        if m < 3:
+            raise ValueError('m must be greater than 3')
+        self._m = m
+        self._R = R
+        self._i = 3
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._i > self._m:
+            raise StopIteration
+        else:
+            result = Polygon(self._i, self._R)
+            self._i += 1
+            return result
+
+
+def test_polygon():
+    abs_tol = 0.001
+    rel_tol = 0.001
+
+    p = Polygon(6, 2)
+    with precision(40):
+        assert isinstance(p.area, Decimal)
+        assert math.isclose(p.side_length, 2,
+                            rel_tol=rel_tol, abs_tol=abs_tol)
+        assert math.isclose(p.apothem, 1.73205,
+                            rel_tol=rel_tol, abs_tol=abs_tol)
+        assert math.isclose(p.area, 10.3923,
+                            rel_tol=rel_tol, abs_tol=abs_tol)
+        assert math.isclose(p.perimeter, 12,
+                            rel_tol=rel_tol, abs_tol=abs_tol)
+        assert p.interior_angle == 120
+        assert p.apothem == decimal.Context(prec=40).sqrt(3)
+    assert isinstance(p.area, float)
+
+    with precision(10):
+        assert isinstance(p.area, float), 'float fast path expected'
+    with precision(rel_tol=1e-30):
+        assert isinstance(p.area, Decimal)
+
+    with precision(30):
+        with precision(50):
+            assert len(Polygon(7, 1).apothem.as_tuple().digits) == 50
+        assert len(Polygon(7, 1).apothem.as_tuple().digits) == 30
+
+    p = Polygon(10 ** 8, 1)
+    assert 0.5 - p.area / p.perimeter < 1e-15
+    with precision(40):
+        ratio = p.area / p.perimeter
+    assert math.isclose(1 - 2 * ratio, (math.pi / 10 ** 8) ** 2 / 2, rel_tol=1e-12)
+
+    with precision(30):
+        assert Polygons(100, 1).max_efficiency_polygon == Polygon(100, 1)
+
+    # the same instance, nested: both blocks restore what they found
+    prec40 = precision(40)
+    with prec40:
+        with prec40:
+            assert isinstance(p.area, Decimal)
+        assert isinstance(p.area, Decimal)
+    assert isinstance(p.area, float)
+
+    # precision mode is scoped to the thread that entered it
+    import threading
+    entered = threading.Event()
+    done = threading.Event()
+    areas = []
+
+    def worker():
+        entered.wait()
+        areas.append(Polygon(5, 1).area)
+        done.set()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    with precision(40):
+        entered.set()
+        done.wait()
+    thread.join()
+    assert isinstance(areas[0], float)
+
+    # one instance shared by two threads, with overlapping blocks
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def shared_worker():
+        try:
+            with prec40:
+                barrier.wait()
+                assert isinstance(Polygon(5, 1).area, Decimal)
+                barrier.wait()
+            assert isinstance(Polygon(5, 1).area, float)
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=shared_worker) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+
+    assert Polygon(3, 0.1 + 0.2) != Polygon(3, 0.3)
+    assert Polygon(3, 0.1 + 0.2).isclose(Polygon(3, 0.3))
+    assert not Polygon(4, 0.1 + 0.2).isclose(Polygon(3, 0.3))
+
+
+test_polygon()
+
+print('#' * 52 + '  With floats, the area/perimeter ratio converges to R/2 and we can no longer tell polygons apart:')
+
+for n in (10 ** 7, 10 ** 8, 10 ** 9, 10 ** 10):
+    p = Polygon(n, 1)
+    print(n, p.area / p.perimeter)
+
+print('#' * 52 + '  In precision mode the properties are computed with decimals:')
+
+with precision(40):
+    for n in (10 ** 7, 10 ** 8, 10 ** 9, 10 ** 10):
+        p = Polygon(n, 1)
+        print(n, p.area / p.perimeter)
+
+print('#' * 52 + '  Timings and accuracy: float vs decimal at various n')
+
+from timeit import timeit
+
+
+def compute(n, prec):
+    p = Polygon(n, 1)
+    if prec is None:
+        return p.area / p.perimeter
+    with precision(prec):
+        return p.area / p.perimeter
+
+
+def benchmark(ns=(10, 10 ** 4, 10 ** 8), precs=(None, 15, 30, 50, 100), number=200):
+    print(f'{"n":>12} {"prec":>6} {"time (us)":>12} {"error of area/perimeter":>26}')
+    for n in ns:
+        reference = compute(n, 200)
+        for prec in precs:
+            elapsed = timeit(lambda: compute(n, prec), number=number) / number
+            value = compute(n, prec)
+            with decimal.localcontext(prec=200):
+                error = abs(Decimal(value) - reference)
+            print(f'{n:>12} {str(prec):>6} {elapsed * 1e6:>12.2f} {error:>26.3e}')
+
+
+benchmark()
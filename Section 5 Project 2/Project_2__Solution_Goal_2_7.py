@@ -0,0 +1,300 @@
+import math
+import sys
+from array import array
+from functools import total_ordering
+
+
+class PolygonTable:
+    # one array of doubles per factor: 8 bytes per value, instead of a tuple
+    # and five float objects per row
+    def __init__(self, size=1000, max_size=10_000):
+        self._max_size = max_size
+        # indexed directly by n, entries 0 to 2 are unused
+        self._columns = tuple(array('d', bytes(3 * 8)) for _ in range(5))
+        (self._interior_angles, self._side_factors, self._apothem_factors,
+         self._area_factors, self._perimeter_factors) = self._columns
+        self._extend(min(size, max_size) + 1)
+
+    def __len__(self):
+        return len(self._columns[0])
+
+    def __repr__(self):
+        return (f'PolygonTable(size={len(self)}, max_size={self._max_size}, '
+                f'memory={self.memory_usage()} bytes)')
+
+    @staticmethod
+    def compute(n):
+        # R-independent factors: properties are factor * R (area: factor * R ** 2)
+        sin = math.sin(math.pi / n)
+        cos = math.cos(math.pi / n)
+        return ((n - 2) * 180 / n,
+                2 * sin,
+                cos,
+                n * sin * cos,
+                2 * n * sin)
+
+    def _extend(self, size):
+        rows = [self.compute(n) for n in range(len(self), size)]
+        for column, values in zip(self._columns, zip(*rows)):
+            column.extend(values)
+
+    def covers(self, n):
+        if n < len(self):
+            return True
+        if n > self._max_size:
+            return False
+        self._extend(min(max(n + 1, 2 * len(self)), self._max_size + 1))
+        return True
+
+    def factors(self, n):
+        try:
+            return (self._interior_angles[n], self._side_factors[n], self._apothem_factors[n],
+                    self._area_factors[n], self._perimeter_factors[n])
+        except IndexError:
+            if self.covers(n):
+                return self.factors(n)
+            return self.compute(n)
+
+    def apothem_factors(self, m):
+        self.covers(m)
+        return self._apothem_factors[3:m + 1]
+
+    def memory_usage(self):
+        return sys.getsizeof(self._columns) + sum(sys.getsizeof(column) for column in self._columns)
+
+
+polygon_table = PolygonTable()
+
+
+@total_ordering
+class Polygon:
+    def __init__(self, n, R):
+        if n < 3:
+            raise ValueError('Polygon must have at least 3 vertices.')
+        self._n = n
+        self._R = R
+        (self._interior_angle, self._side_factor, self._apothem_factor,
+         self._area_factor, self._perimeter_factor) = polygon_table.factors(n)
+
+    def __repr__(self):
+        return f'Polygon(n={self._n}, R={self._R})'
+
+    @property
+    def count_vertices(self):
+        return self._n
+
+    @property
+    def count_edges(self):
+        return self._n
+
+    @property
+    def circumradius(self):
+        return self._R
+
+    @property
+    def interior_angle(self):
+        return self._interior_angle
+
+    @property
+    def side_length(self):
+        return self._side_factor * self._R
+
+    @property
+    def apothem(self):
+        return self._apothem_factor * self._R
+
+    @property
+    def area(self):
+        return self._area_factor * self._R * self._R
+
+    @property
+    def perimeter(self):
+        return self._perimeter_factor * self._R
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return (self.count_edges == other.count_edges
+                    and self.circumradius == other.circumradius)
+        else:
+            return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, self.__class__):
+            return ((self.count_vertices, self.circumradius)
+                    > (other.count_vertices, other.circumradius))
+        else:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash((self._n, self._R))
+
+
+class Polygons:
+    def __init__(self, m, R):
+        if m < 3:
+            raise ValueError('m must be greater than 3')
+        self._m = m
+        self._R = R
+        self._max_efficiency_polygon = None
+
+    def __len__(self):
+        return self._m - 2
+
+    def __repr__(self):
+        return f'Polygons(m={self._m}, R={self._R})'
+
+    def __iter__(self):
+        return PolygonsIterator(self._m, self._R)
+
+    @property
+    def max_efficiency_polygon(self):
+        # area / perimeter == apothem / 2, so we only need to compare the
+        # apothem factors in the table and build the winning polygon
+        if self._max_efficiency_polygon is None:
+            if polygon_table.covers(self._m):
+                factors = polygon_table.apothem_factors(self._m)
+                n = max(range(len(factors)), key=factors.__getitem__) + 3
+            else:
+                n = max(range(3, self._m + 1),
+                        key=lambda i: PolygonTable.compute(i)[2])
+            self._max_efficiency_polygon = Polygon(n, self._R)
+        return self._max_efficiency_polygon
+
+
+class PolygonsIterator:
+    def __init__(self, m, R):
+        if m < 3:
+            raise ValueError('m must be greater than 3')
+        self._m = m
+        self._R = R
+        self._i = 3
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._i > self._m:
+            raise StopIteration
+        else:
+            result = Polygon(self._i, self._R)
+            self._i += 1
+            return result
+
+
+def test_polygon():
+    abs_tol = 0.001
+    rel_tol = 0.001
+
+    try:
+        p = Polygon(2, 10)
+        assert False, ('Creating a Polygon with 2 sides: '
+                       ' Exception expected, not received')
+    except ValueError:
+        pass
+
+    p = Polygon(4, 1)
+    assert p.interior_angle == 90, (f'actual: {p.interior_angle}, '
+                                    ' expected: 90')
+    assert math.isclose(p.area, 2,
+                        rel_tol=abs_tol,
+                        abs_tol=abs_tol), (f'actual: {p.area},'
+                                           ' expected: 2.0')
+    assert math.isclose(p.side_length, math.sqrt(2),
+                        rel_tol=rel_tol,
+                        abs_tol=abs_tol), (f'actual: {p.side_length},'
+                                           f' expected: {math.sqrt(2)}')
+    assert math.isclose(p.perimeter, 4 * math.sqrt(2),
+                        rel_tol=rel_tol,
+                        abs_tol=abs_tol), (f'actual: {p.perimeter},'
+                                           f' expected: {4 * math.sqrt(2)}')
+    assert math.isclose(p.apothem, 0.707,
+                        rel_tol=rel_tol,
+                        abs_tol=abs_tol), (f'actual: {p.perimeter},'
+                                           ' expected: 0.707')
+
+    p = Polygon(12, 3)
+    assert math.isclose(p.side_length, 1.55291,
+                        rel_tol=rel_tol, abs_tol=abs_tol)
+    assert math.isclose(p.apothem, 2.89778,
+                        rel_tol=rel_tol, abs_tol=abs_tol)
+    assert math.isclose(p.area, 27,
+                        rel_tol=rel_tol, abs_tol=abs_tol)
+    assert math.isclose(p.perimeter, 18.635,
+                        rel_tol=rel_tol, abs_tol=abs_tol)
+    assert math.isclose(p.interior_angle, 150,
+                        rel_tol=rel_tol, abs_tol=abs_tol)
+
+    # table values must match the direct computation
+    for n in (3, 7, 999, 5000, 2_000_000):
+        p = Polygon(n, 2.5)
+        assert math.isclose(p.side_length, 2 * 2.5 * math.sin(math.pi / n))
+        assert math.isclose(p.apothem, 2.5 * math.cos(math.pi / n))
+        assert math.isclose(p.area, n / 2 * p.side_length * p.apothem)
+        assert math.isclose(p.perimeter, n * p.side_length)
+
+    assert Polygons(10, 1).max_efficiency_polygon == Polygon(10, 1)
+    assert Polygons(3, 1).max_efficiency_polygon == Polygon(3, 1)
+
+
+def test_polygon_table():
+    table = PolygonTable(size=10, max_size=100)
+    assert len(table) == 11
+    assert table.covers(15)
+    assert len(table) == 22, 'table should grow geometrically'
+    assert table.covers(100)
+    assert len(table) == 101
+    assert not table.covers(101)
+    assert table.factors(101) == PolygonTable.compute(101)
+    assert table.memory_usage() > 5 * 97 * 8
+    assert table.factors(50) == PolygonTable.compute(50)
+    assert list(table.apothem_factors(5)) == [PolygonTable.compute(n)[2] for n in (3, 4, 5)]
+
+    # large n are computed directly, they never grow the table
+    assert Polygons(200, 1).max_efficiency_polygon == Polygon(200, 1)
+    assert Polygon(999_999, 1).apothem == math.cos(math.pi / 999_999)
+    assert len(polygon_table) <= 10_001
+
+
+test_polygon()
+test_polygon_table()
+
+print('#' * 52 + '  The R-independent factors are computed once per n:')
+
+polygon_table = PolygonTable()
+print(polygon_table)
+print(polygon_table.factors(6))
+
+print('#' * 52 + '  The table is extended lazily when we ask for a larger n:')
+
+p = Polygon(5000, 1)
+print(polygon_table)
+
+print('#' * 52 + '  Timings: many small polygons with different radii')
+
+from timeit import timeit
+
+
+def direct(n, R):
+    return (2 * R * math.sin(math.pi / n),
+            R * math.cos(math.pi / n),
+            n * 2 * R * math.sin(math.pi / n))
+
+
+def tabled(n, R):
+    factors = polygon_table.factors(n)
+    return factors[1] * R, factors[2] * R, factors[4] * R
+
+
+size = 1_000_000
+print(timeit('for n in range(size): direct(n % 998 + 3, n)', globals=globals(), number=1))
+print(timeit('for n in range(size): tabled(n % 998 + 3, n)', globals=globals(), number=1))
+
+print('#' * 52 + '  And max_efficiency_polygon only scans the table:')
+
+print(timeit('Polygons(10_000, 1).max_efficiency_polygon', globals=globals(), number=1))
+print(polygon_table)
+
+print('#' * 52 + '  Beyond max_size, polygons are computed directly and the table stays small:')
+
+print(timeit('Polygons(100_000, 1).max_efficiency_polygon', globals=globals(), number=1))
+print(polygon_table)
@@ -0,0 +1,322 @@
+import math
+import threading
+from functools import total_ordering
+
+
+_missing = object()
+
+
+class lazy_property:
+    def __init__(self, fget):
+        self._fget = fget
+        self.__doc__ = fget.__doc__
+
+    def __set_name__(self, owner, name):
+        self._name = name
+        # the computed value is stored under a private name, so that this
+        # (data) descriptor stays in charge of reads and writes
+        self._attr = '_' + name
+
+    def __get__(self, instance, owner_class):
+        if instance is None:
+            return self
+        values = instance.__dict__
+        value = values.get(self._attr, _missing)
+        if value is not _missing:
+            return value
+        lock = values.get('_lazy_property_lock')
+        if lock is None:
+            lock = values.setdefault('_lazy_property_lock', threading.RLock())
+        with lock:
+            value = values.get(self._attr, _missing)
+            if value is _missing:
+                value = self._fget(instance)
+                values[self._attr] = value
+            return value
+
+    def __set__(self, instance, value):
+        raise AttributeError(f"property '{self._name}' of "
+                             f"'{type(instance).__name__}' object has no setter")
+
+
+@total_ordering
+class Polygon:
+    def __init__(self, n, R):
+        if n < 3:
+            raise ValueError('Polygon must have at least 3 vertices.')
+        self._n = n
+        self._R = R
+
+    def __repr__(self):
+        return f'Polygon(n={self._n}, R={self._R})'
+
+    @property
+    def count_vertices(self):
+        return self._n
+
+    @property
+    def count_edges(self):
+        return self._n
+
+    @property
+    def circumradius(self):
+        return self._R
+
+    @lazy_property
+    def interior_angle(self):
+        return (self._n - 2) * 180 / self._n
+
+    @lazy_property
+    def side_length(self):
+        return 2 * self._R * math.sin(math.pi / self._n)
+
+    @lazy_property
+    def apothem(self):
+        return self._R * math.cos(math.pi / self._n)
+
+    @lazy_property
+    def area(self):
+        return self._n / 2 * self.side_length * self.apothem
+
+    @lazy_property
+    def perimeter(self):
+        return self._n * self.side_length
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return (self.count_edges == other.count_edges
+                    and self.circumradius == other.circumradius)
+        else:
+            return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, self.__class__):
+            return ((self.count_vertices, self.circumradius)
+                    > (other.count_vertices, other.circumradius))
+        else:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash((self._n, self._R))
+
+
+class Polygons:
+    def __init__(self, m, R):
+        if m < 3:
+            raise ValueError('m must be greater than 3')
+        self._m = m
+        self._R = R
+
+    def __len__(self):
+        return self._m - 2
+
+    def __repr__(self):
+        return f'Polygons(m={self._m}, R={self._R})'
+
+    def __iter__(self):
+        return PolygonsIterator(self._m, self._R)
+
+    @lazy_property
+    def max_efficiency_polygon(self):
+        sorted_polygons = sorted(PolygonsIterator(self._m, self._R),
+                                 key=lambda p: p.area / p.perimeter,
+                                 reverse=True)
+        return sorted_polygons[0]
+
+
+class PolygonsIterator:
+    def __init__(self, m, R):
+        if m < 3:
+            raise ValueError('m must be greater than 3')
+        self._m = m
+        self._R = R
+        self._i = 3
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._i > self._m:
+            raise StopIteration
+        else:
+            result = Polygon(self._i, self._R)
+            self._i += 1
+            return result
+
+
+def test_polygon():
+    abs_tol = 0.001
+    rel_tol = 0.001
+
+    p = Polygon(12, 3)
+    assert math.isclose(p.side_length, 1.55291,
+                        rel_tol=rel_tol, abs_tol=abs_tol)
+    assert math.isclose(p.apothem, 2.89778,
+                        rel_tol=rel_tol, abs_tol=abs_tol)
+    assert math.isclose(p.area, 27,
+                        rel_tol=rel_tol, abs_tol=abs_tol)
+    assert math.isclose(p.perimeter, 18.635,
+                        rel_tol=rel_tol, abs_tol=abs_tol)
+    assert math.isclose(p.interior_angle, 150,
+                        rel_tol=rel_tol, abs_tol=abs_tol)
+    assert '_area' in p.__dict__, 'computed value should be stored in the instance'
+
+    try:
+        p.area = 123
+        assert False, 'AttributeError expected'
+    except AttributeError:
+        pass
+    assert math.isclose(p.area, 27, rel_tol=rel_tol, abs_tol=abs_tol)
+
+    assert isinstance(Polygon.area, lazy_property)
+    assert Polygons(10, 1).max_efficiency_polygon == Polygon(10, 1)
+
+
+def test_lazy_property_computes_once():
+    from time import sleep
+
+    calls = []
+
+    class Slow:
+        @lazy_property
+        def value(self):
+            calls.append(threading.get_ident())
+            sleep(0.01)  # releases the GIL, wide race window
+            return 42
+
+    obj = Slow()
+    barrier = threading.Barrier(32)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(obj.value)
+
+    threads = [threading.Thread(target=worker) for _ in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [42] * 32
+    assert len(calls) == 1, f'computed {len(calls)} times'
+
+
+test_polygon()
+test_lazy_property_computes_once()
+
+print('#' * 52 + '  The first access computes and stores the value in the instance dictionary:')
+
+p = Polygon(6, 1)
+print(p.__dict__)
+print(p.area)
+print(p.__dict__)
+
+print('#' * 52 + '  Contention benchmark: 32 threads hammering area and perimeter')
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from time import perf_counter, sleep
+
+
+def make_polygon_class(kind, counter):
+    # the sleep(0) stands in for an expensive computation that lets other threads run
+
+    if kind == 'check-then-set':
+        class BenchPolygon:
+            def __init__(self, n, R):
+                self._n, self._R = n, R
+                self._area = None
+                self._perimeter = None
+
+            @property
+            def area(self):
+                if self._area is None:
+                    next(counter)
+                    sleep(0)
+                    self._area = self._n / 2 * (2 * self._R * math.sin(math.pi / self._n)) \
+                        * self._R * math.cos(math.pi / self._n)
+                return self._area
+
+            @property
+            def perimeter(self):
+                if self._perimeter is None:
+                    next(counter)
+                    sleep(0)
+                    self._perimeter = self._n * 2 * self._R * math.sin(math.pi / self._n)
+                return self._perimeter
+
+    elif kind == 'always-lock':
+        class BenchPolygon:
+            def __init__(self, n, R):
+                self._n, self._R = n, R
+                self._area = None
+                self._perimeter = None
+                self._lock = threading.Lock()
+
+            @property
+            def area(self):
+                with self._lock:
+                    if self._area is None:
+                        next(counter)
+                        sleep(0)
+                        self._area = self._n / 2 * (2 * self._R * math.sin(math.pi / self._n)) \
+                            * self._R * math.cos(math.pi / self._n)
+                    return self._area
+
+            @property
+            def perimeter(self):
+                with self._lock:
+                    if self._perimeter is None:
+                        next(counter)
+                        sleep(0)
+                        self._perimeter = self._n * 2 * self._R * math.sin(math.pi / self._n)
+                    return self._perimeter
+
+    else:
+        class BenchPolygon:
+            def __init__(self, n, R):
+                self._n, self._R = n, R
+
+            @lazy_property
+            def area(self):
+                next(counter)
+                sleep(0)
+                return self._n / 2 * (2 * self._R * math.sin(math.pi / self._n)) \
+                    * self._R * math.cos(math.pi / self._n)
+
+            @lazy_property
+            def perimeter(self):
+                next(counter)
+                sleep(0)
+                return self._n * 2 * self._R * math.sin(math.pi / self._n)
+
+    return BenchPolygon
+
+
+def contention_benchmark(kind, threads=32, polygons=100, reads=20_000):
+    counter = count()
+    polygon_class = make_polygon_class(kind, counter)
+    shared = [polygon_class(n, 1) for n in range(3, polygons + 3)]
+    barrier = threading.Barrier(threads)
+
+    def hammer():
+        barrier.wait()
+        for i in range(reads):
+            p = shared[i % polygons]
+            p.area
+            p.perimeter
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for future in [executor.submit(hammer) for _ in range(threads)]:
+            future.result()
+    elapsed = perf_counter() - start
+    computations = next(counter)
+    return elapsed, computations, 2 * polygons
+
+
+print(f'{"implementation":<16} {"time (s)":>9} {"computations":>13} {"expected":>9}')
+for kind in ('check-then-set', 'always-lock', 'lazy_property'):
+    elapsed, computations, expected = contention_benchmark(kind)
+    print(f'{kind:<16} {elapsed:>9.3f} {computations:>13} {expected:>9}')